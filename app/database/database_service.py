@@ -1,8 +1,11 @@
+from psycopg2.extras import Json
 from app.database.models import get_db_connection
 
 def insert_video_wordcount(video_id, channel_id, channel_name, video_title, wordcount, total_palabras):
     """
     Inserta o actualiza información de wordcount y total de palabras para un video.
+    Returns:
+        True si se guardó, False si hubo un error
     """
     conn = get_db_connection()
     try:
@@ -28,9 +31,11 @@ def insert_video_wordcount(video_id, channel_id, channel_name, video_title, word
 
         conn.commit()
         print(f"✅ Datos guardados para video {video_id}")
+        return True
     except Exception as e:
         print(f"❌ Error al insertar datos del video {video_id}: {e}")
         conn.rollback()
+        return False
     finally:
         conn.close()
 
@@ -131,3 +136,622 @@ def save_feedback(feedback_type, result, content, prompt=None):
         print(f"Error al guardar el feedback: {e}")
         raise
 
+
+def get_cached_definition(term_key):
+    """
+    Obtiene la definición guardada para un término normalizado.
+    Returns:
+        La definición o None si no existe
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = "SELECT definition FROM definition_cache WHERE term_key = %s;"
+            cursor.execute(query, (term_key,))
+            row = cursor.fetchone()
+            return row["definition"] if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar la caché de definiciones: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_cached_definition(term_key, term, definition):
+    """
+    Guarda o reemplaza la definición de un término normalizado.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO definition_cache (term_key, term, definition, created_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (term_key) DO UPDATE
+                SET term = EXCLUDED.term, definition = EXCLUDED.definition, created_at = EXCLUDED.created_at;
+            """
+            cursor.execute(query, (term_key, term, definition))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar la definición en caché: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def delete_cached_definition(definition):
+    """
+    Elimina de la caché las entradas cuyo texto coincide con la definición dada.
+    Returns:
+        Lista de term_key eliminados
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = "DELETE FROM definition_cache WHERE definition = %s RETURNING term_key;"
+            cursor.execute(query, (definition,))
+            deleted = [row["term_key"] for row in cursor.fetchall()]
+        conn.commit()
+        return deleted
+    except Exception as e:
+        print(f"❌ Error al invalidar la caché de definiciones: {e}")
+        conn.rollback()
+        return []
+    finally:
+        conn.close()
+
+
+def get_video_analysis(video_id):
+    """
+    Obtiene el análisis guardado de un video.
+    Returns:
+        Diccionario con transcript_hash, summary, wordcount, brands y total_palabras, o None
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                SELECT transcript_hash, summary, wordcount, brands, total_palabras
+                FROM video_analysis
+                WHERE video_id = %s;
+            """
+            cursor.execute(query, (video_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar el análisis del video {video_id}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_video_analysis(video_id, transcript_hash, summary, wordcount, brands, total_palabras):
+    """
+    Guarda o reemplaza el análisis procesado de un video.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO video_analysis (video_id, transcript_hash, summary, wordcount, brands, total_palabras, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (video_id) DO UPDATE SET
+                    transcript_hash = EXCLUDED.transcript_hash,
+                    summary = EXCLUDED.summary,
+                    wordcount = EXCLUDED.wordcount,
+                    brands = EXCLUDED.brands,
+                    total_palabras = EXCLUDED.total_palabras,
+                    updated_at = EXCLUDED.updated_at;
+            """
+            cursor.execute(query, (
+                video_id, transcript_hash, summary, Json(wordcount), Json(brands), total_palabras
+            ))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar el análisis del video {video_id}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def get_sql_plan(question_key):
+    """
+    Obtiene el SQL guardado para una pregunta normalizada e incrementa su contador de usos.
+    Returns:
+        La consulta SQL o None si no existe
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                UPDATE sql_plan_cache SET hits = hits + 1
+                WHERE question_key = %s
+                RETURNING sql_query;
+            """
+            cursor.execute(query, (question_key,))
+            row = cursor.fetchone()
+        conn.commit()
+        return row["sql_query"] if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar la caché de SQL: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+def save_sql_plan(question_key, question, sql_query):
+    """
+    Guarda el SQL validado para una pregunta normalizada.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO sql_plan_cache (question_key, question, sql_query)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (question_key) DO UPDATE SET sql_query = EXCLUDED.sql_query;
+            """
+            cursor.execute(query, (question_key, question, sql_query))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar la consulta SQL en caché: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def get_channel_id_for_handle(handle_key):
+    """
+    Obtiene el channelId guardado para un handle normalizado.
+    Returns:
+        El channelId o None si no se ha resuelto antes
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT channel_id FROM channel_handles WHERE handle_key = %s;",
+                (handle_key,)
+            )
+            row = cursor.fetchone()
+            return row["channel_id"] if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar el channelId del handle {handle_key}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_channel_handle(handle_key, channel_id, source):
+    """
+    Guarda el channelId resuelto para un handle normalizado.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO channel_handles (handle_key, channel_id, source)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (handle_key) DO UPDATE SET
+                    channel_id = EXCLUDED.channel_id,
+                    source = EXCLUDED.source,
+                    resolved_at = CURRENT_TIMESTAMP;
+            """
+            cursor.execute(query, (handle_key, channel_id, source))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar el channelId del handle {handle_key}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def create_analysis_job(job_id, channel_url, kind="analyze"):
+    """
+    Encola un trabajo de análisis ("analyze") o de sincronización ("sync") de un canal.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO analysis_jobs (job_id, kind, channel_url) VALUES (%s, %s, %s);",
+                (job_id, kind, channel_url)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def claim_next_analysis_job():
+    """
+    Marca como en ejecución el trabajo encolado más antiguo y lo devuelve.
+    SKIP LOCKED permite que varios procesos tomen trabajos a la vez sin repetirlos.
+    Returns:
+        Diccionario con job_id, kind y channel_url, o None si no hay trabajos pendientes
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                UPDATE analysis_jobs
+                SET status = 'running', started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = (
+                    SELECT job_id FROM analysis_jobs
+                    WHERE status = 'queued'
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING job_id, kind, channel_url;
+            """
+            cursor.execute(query)
+            row = cursor.fetchone()
+        conn.commit()
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"❌ Error al obtener el siguiente trabajo de análisis: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+def update_analysis_job(job_id, status, stages, result=None, error=None):
+    """
+    Actualiza el estado, las etapas y, al terminar, el resultado o el error de un trabajo.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                UPDATE analysis_jobs
+                SET status = %s, stages = %s, result = %s, error = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = %s;
+            """
+            cursor.execute(query, (
+                status, Json(stages), Json(result) if result is not None else None, error, job_id
+            ))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al actualizar el trabajo {job_id}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def touch_analysis_job(job_id):
+    """
+    Latido de un trabajo en ejecución: renueva updated_at para que no se
+    considere abandonado mientras una etapa larga sigue en marcha.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE analysis_jobs SET updated_at = CURRENT_TIMESTAMP WHERE job_id = %s AND status = 'running';",
+                (job_id,)
+            )
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al renovar el trabajo {job_id}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def get_analysis_job(job_id):
+    """
+    Obtiene un trabajo de análisis.
+    Returns:
+        Diccionario con los campos del trabajo o None si no existe
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                SELECT job_id, kind, channel_url, status, stages, result, error,
+                       created_at, started_at, updated_at
+                FROM analysis_jobs
+                WHERE job_id = %s;
+            """
+            cursor.execute(query, (job_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar el trabajo {job_id}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def requeue_stale_analysis_jobs(stale_seconds):
+    """
+    Vuelve a encolar los trabajos en ejecución que no se actualizan desde hace
+    `stale_seconds` (su proceso se detuvo antes de terminarlos). Los trabajos
+    vivos renuevan updated_at con touch_analysis_job.
+    Returns:
+        Número de trabajos reencolados
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                UPDATE analysis_jobs
+                SET status = 'queued', stages = '[]', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s);
+            """
+            cursor.execute(query, (stale_seconds,))
+            count = cursor.rowcount
+        conn.commit()
+        return count
+    except Exception as e:
+        print(f"❌ Error al reencolar trabajos de análisis: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+
+def get_existing_video_ids(video_ids):
+    """
+    Devuelve cuáles de los videos indicados ya están en la tabla videos.
+    Returns:
+        Conjunto de video_ids
+    """
+    if not video_ids:
+        return set()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT video_id FROM videos WHERE video_id = ANY(%s);",
+                (list(video_ids),)
+            )
+            return {row["video_id"] for row in cursor.fetchall()}
+    except Exception as e:
+        print(f"❌ Error al consultar los videos existentes: {e}")
+        raise
+    finally:
+        conn.close()
+
+def get_channel_sync_state(channel_id):
+    """
+    Obtiene la marca de agua de la última sincronización de un canal.
+    Returns:
+        Diccionario con last_published_at, last_video_id y synced_at, o None
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                SELECT last_published_at, last_video_id, synced_at
+                FROM channel_sync_state
+                WHERE channel_id = %s;
+            """
+            cursor.execute(query, (channel_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        print(f"❌ Error al consultar el estado de sincronización del canal {channel_id}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_channel_sync_state(channel_id, last_published_at, last_video_id):
+    """
+    Guarda la marca de agua de la sincronización de un canal.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO channel_sync_state (channel_id, last_published_at, last_video_id, synced_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    last_published_at = EXCLUDED.last_published_at,
+                    last_video_id = EXCLUDED.last_video_id,
+                    synced_at = EXCLUDED.synced_at;
+            """
+            cursor.execute(query, (channel_id, last_published_at, last_video_id))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar el estado de sincronización del canal {channel_id}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def save_video_brands(video_id, brands):
+    """
+    Sustituye las marcas detectadas en un video.
+    Returns:
+        True si se guardaron, False si hubo un error
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM brands WHERE video_id = %s;", (video_id,))
+            cursor.executemany(
+                "INSERT INTO brands (brand, video_id) VALUES (%s, %s);",
+                [(brand, video_id) for brand in brands]
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ Error al guardar las marcas del video {video_id}: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def add_backfill_videos(channel_id, uploads):
+    """
+    Registra como pendientes los videos de una página de la playlist de
+    subidas. Los que ya estaban registrados conservan su estado.
+    """
+    if not uploads:
+        return
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                INSERT INTO backfill_videos (channel_id, video_id, published_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (channel_id, video_id) DO NOTHING;
+            """
+            cursor.executemany(
+                query,
+                [(channel_id, video_id, published_at) for video_id, published_at in uploads]
+            )
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al registrar los videos del backfill del canal {channel_id}: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_backfill_videos(channel_id, video_ids):
+    """
+    Devuelve el checkpoint de los videos indicados.
+    Returns:
+        Diccionario {video_id: {status, stage, attempts}}
+    """
+    if not video_ids:
+        return {}
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                SELECT video_id, status, stage, attempts
+                FROM backfill_videos
+                WHERE channel_id = %s AND video_id = ANY(%s);
+            """
+            cursor.execute(query, (channel_id, list(video_ids)))
+            return {row["video_id"]: dict(row) for row in cursor.fetchall()}
+    except Exception as e:
+        print(f"❌ Error al consultar el backfill del canal {channel_id}: {e}")
+        raise
+    finally:
+        conn.close()
+
+def update_backfill_video(channel_id, video_id, status, stage=None, average_stars=None, error=None):
+    """
+    Guarda el checkpoint de un video. Un fallo suma un intento.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                UPDATE backfill_videos
+                SET status = %s,
+                    stage = COALESCE(%s, stage),
+                    average_stars = COALESCE(%s, average_stars),
+                    error = %s,
+                    attempts = attempts + CASE WHEN %s = 'failed' THEN 1 ELSE 0 END,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE channel_id = %s AND video_id = %s;
+            """
+            cursor.execute(query, (status, stage, average_stars, error, status, channel_id, video_id))
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error al guardar el checkpoint del video {video_id}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def get_backfill_summary(channel_id):
+    """
+    Cuenta los videos del backfill de un canal por estado.
+    Returns:
+        Diccionario {status: número de videos}
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            query = """
+                SELECT status, COUNT(*) AS videos
+                FROM backfill_videos
+                WHERE channel_id = %s
+                GROUP BY status;
+            """
+            cursor.execute(query, (channel_id,))
+            return {row["status"]: row["videos"] for row in cursor.fetchall()}
+    except Exception as e:
+        print(f"❌ Error al consultar el resumen del backfill del canal {channel_id}: {e}")
+        return {}
+    finally:
+        conn.close()
+
+def take_quota_units(bucket, cost, floor, capacity, refill_rate):
+    """
+    Descuenta `cost` unidades del token bucket compartido si después quedan al
+    menos `floor`. La fila se bloquea con FOR UPDATE, así que los descuentos de
+    todos los procesos se serializan; el relleno usa la hora del servidor.
+    Returns:
+        Tupla (descontadas, unidades disponibles)
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO youtube_quota (bucket, tokens, updated_at)
+                VALUES (%s, %s, EXTRACT(EPOCH FROM clock_timestamp()))
+                ON CONFLICT (bucket) DO NOTHING;
+            """, (bucket, capacity))
+            cursor.execute("""
+                SELECT tokens, updated_at, EXTRACT(EPOCH FROM clock_timestamp())::float8 AS now
+                FROM youtube_quota
+                WHERE bucket = %s
+                FOR UPDATE;
+            """, (bucket,))
+            row = cursor.fetchone()
+            tokens = min(capacity, row["tokens"] + max(row["now"] - row["updated_at"], 0) * refill_rate)
+            taken = tokens - cost >= floor
+            if taken:
+                tokens -= cost
+            cursor.execute(
+                "UPDATE youtube_quota SET tokens = %s, updated_at = %s WHERE bucket = %s;",
+                (tokens, row["now"], bucket)
+            )
+        conn.commit()
+        return taken, tokens
+    except Exception as e:
+        print(f"❌ Error al descontar cuota del bucket {bucket}: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_quota_units(bucket, capacity, refill_rate):
+    """
+    Unidades disponibles ahora mismo en el token bucket compartido.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT tokens, updated_at, EXTRACT(EPOCH FROM clock_timestamp())::float8 AS now
+                FROM youtube_quota
+                WHERE bucket = %s;
+            """, (bucket,))
+            row = cursor.fetchone()
+            if row is None:
+                return float(capacity)
+            return min(capacity, row["tokens"] + max(row["now"] - row["updated_at"], 0) * refill_rate)
+    except Exception as e:
+        print(f"❌ Error al consultar la cuota del bucket {bucket}: {e}")
+        return 0.0
+    finally:
+        conn.close()
+
+def get_channel_names():
+    """
+    Nombres de los canales con videos guardados.
+    Returns:
+        Lista de nombres, vacía si hubo un error
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT channel_name FROM videos;")
+            return [row["channel_name"] for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error al obtener los nombres de los canales: {e}")
+        return []
+    finally:
+        conn.close()
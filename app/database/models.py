@@ -58,6 +58,111 @@ def create_tables():
     """
     cursor.execute(create_brands_table_query)
 
+    # Tabla definition_cache (caché de definiciones de /api/define)
+    create_definition_cache_table_query = """
+    CREATE TABLE IF NOT EXISTS definition_cache (
+        term_key VARCHAR PRIMARY KEY,
+        term VARCHAR NOT NULL,
+        definition TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    cursor.execute(create_definition_cache_table_query)
+
+    # Tabla video_analysis (resultados procesados por video y hash de la transcripción)
+    create_video_analysis_table_query = """
+    CREATE TABLE IF NOT EXISTS video_analysis (
+        video_id VARCHAR PRIMARY KEY,
+        transcript_hash CHAR(64) NOT NULL,
+        summary TEXT,
+        wordcount JSONB,
+        brands JSONB,
+        total_palabras INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    cursor.execute(create_video_analysis_table_query)
+
+    # Tabla sql_plan_cache (preguntas normalizadas -> SQL ya ejecutado con éxito)
+    create_sql_plan_cache_table_query = """
+    CREATE TABLE IF NOT EXISTS sql_plan_cache (
+        question_key TEXT PRIMARY KEY,
+        question TEXT NOT NULL,
+        sql_query TEXT NOT NULL,
+        hits INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    cursor.execute(create_sql_plan_cache_table_query)
+
+    # Tabla channel_handles (handle normalizado -> channelId ya resuelto)
+    create_channel_handles_table_query = """
+    CREATE TABLE IF NOT EXISTS channel_handles (
+        handle_key VARCHAR PRIMARY KEY,
+        channel_id VARCHAR(255) NOT NULL,
+        source VARCHAR(20),
+        resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    cursor.execute(create_channel_handles_table_query)
+
+    # Tabla analysis_jobs (trabajos de análisis de canal encolados por /api/analyze)
+    create_analysis_jobs_table_query = """
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        job_id VARCHAR(36) PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL DEFAULT 'analyze',
+        channel_url TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        stages JSONB NOT NULL DEFAULT '[]',
+        result JSONB,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS analysis_jobs_status_idx ON analysis_jobs (status, created_at);
+    ALTER TABLE analysis_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'analyze';
+    """
+    cursor.execute(create_analysis_jobs_table_query)
+
+    # Tabla channel_sync_state (marca de agua de la sincronización incremental por canal)
+    create_channel_sync_state_table_query = """
+    CREATE TABLE IF NOT EXISTS channel_sync_state (
+        channel_id VARCHAR(255) PRIMARY KEY,
+        last_published_at VARCHAR(32),
+        last_video_id VARCHAR,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    cursor.execute(create_channel_sync_state_table_query)
+
+    # Tabla backfill_videos (checkpoint de la ingesta del histórico de un canal, backfill.py)
+    create_backfill_videos_table_query = """
+    CREATE TABLE IF NOT EXISTS backfill_videos (
+        channel_id VARCHAR(255) NOT NULL,
+        video_id VARCHAR NOT NULL,
+        published_at VARCHAR(32),
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        stage VARCHAR(20),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        average_stars REAL,
+        error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (channel_id, video_id)
+    );
+    """
+    cursor.execute(create_backfill_videos_table_query)
+
+    # Tabla youtube_quota (token bucket de la cuota de la API compartido por todos los procesos)
+    create_youtube_quota_table_query = """
+    CREATE TABLE IF NOT EXISTS youtube_quota (
+        bucket VARCHAR(50) PRIMARY KEY,
+        tokens DOUBLE PRECISION NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL
+    );
+    """
+    cursor.execute(create_youtube_quota_table_query)
+
     # Confirmar los cambios
     conn.commit()
 
@@ -1,12 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from app.routes.main import router  
+from app.utils.startup import on_startup, readiness
+from app.utils.executors import ExecutorBusy, shutdown_executors
+from app.utils.youtube_api import youtube_client, youtube_cache
+from app.utils.quota import QuotaExhausted, youtube_quota
+from app.utils.transcript_store import transcript_store
+from app.utils.analysis_jobs import analysis_jobs
 
 import os
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los modelos se cargan según STARTUP_MODE; en modo diferido el servidor
+    # empieza a responder mientras se cargan en segundo plano
+    on_startup()
+    await analysis_jobs.start()
+    yield
+    await analysis_jobs.stop()
+    await youtube_client.aclose()
+    transcript_store.close()
+    shutdown_executors()
+
+
 # Crear la instancia principal de FastAPI
-app = FastAPI(title="YouTube Analysis Backend")
+app = FastAPI(title="YouTube Analysis Backend", lifespan=lifespan)
 
 # Middleware CORS
 app.add_middleware(
@@ -27,6 +49,55 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 # Incluir solo el router principal
 app.include_router(router)
 
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request, exc: ExecutorBusy):
+    """
+    Cola de inferencia llena: 503 con Retry-After en lugar de encolar sin límite.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(QuotaExhausted)
+async def quota_exhausted_handler(request, exc: QuotaExhausted):
+    """
+    Cuota de la API de YouTube agotada: 429 con el tiempo hasta que vuelva a haber cuota.
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the YouTube Analysis API!"}
\ No newline at end of file
+    return {"message": "Welcome to the YouTube Analysis API!"}
+
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: el proceso está vivo y responde.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: estado de carga de cada modelo.
+    """
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+@app.get("/metrics/youtube")
+def youtube_metrics():
+    """
+    Contadores de la caché de respuestas de la API de YouTube, cuota restante
+    y transcripciones guardadas.
+    """
+    return {
+        "cache": youtube_cache.stats(),
+        "quota": youtube_quota.stats(),
+        "transcripts": transcript_store.stats()
+    }
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Any
-from app.utils.youtube_api import fetch_channel_videos
-from app.utils.query_llm import (
-    generate_sql_from_question,
-    execute_sql_query,
-    sanitize_sql_query  
-)
+from app.utils.analysis_jobs import analysis_jobs, TERMINAL_STATUSES
+from app.utils.query_llm import answer_question, prepare_stream
+from app.utils.sql_executor import SQL_DEFAULT_PAGE_SIZE
 from app.utils.search_llm import router as search_router  
+from app.utils.definition_cache import definition_cache
+from app.utils.audio_processing import (
+    obtener_transcripcion_youtube,
+    puntuar_texto_en_espanol,
+    generar_resumen_stream
+)
+from app.utils.streaming import sse_event
+from app.utils.executors import ExecutorBusy, inference_pool, run_inference, run_io
 from app.database.database_service import (
     get_wordcount_summary,
     get_historical_wordcount_by_channel,
@@ -43,46 +50,104 @@ class WordcountData(BaseModel):
 
 class QueryRequest(BaseModel):
     question: str
+    page: int = 1
+    page_size: int = SQL_DEFAULT_PAGE_SIZE
 
 class QueryResponse(BaseModel):
     results: Any  # Cambia Any a un tipo más específico si conoces la estructura de los resultados
 
-@router.post("/api/analyze")
+@router.post("/api/analyze", status_code=202)
 async def analyze_channel(request: AnalyzeRequest):
     """
-    Endpoint para analizar un canal de YouTube.
+    Endpoint para analizar un canal de YouTube. Encola el análisis y devuelve
+    el id del trabajo; el estado, el progreso (SSE) y el resultado se
+    consultan en /api/analyze/jobs/{job_id}.
+    """
+    try:
+        job_id = await analysis_jobs.submit(request.url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/analyze/jobs/{job_id}",
+        "events_url": f"/api/analyze/jobs/{job_id}/events",
+        "result_url": f"/api/analyze/jobs/{job_id}/result"
+    }
+
+@router.post("/api/sync", status_code=202)
+async def sync_channel_uploads(request: AnalyzeRequest):
+    """
+    Encola una sincronización incremental del canal: solo se procesan las
+    subidas que aún no están en la base de datos. Se sigue con los mismos
+    endpoints de trabajos que /api/analyze.
     """
     try:
-        # Obtener datos del canal y procesar el último video
-        channel_data = fetch_channel_videos(request.url)
-
-        if not channel_data:
-            raise HTTPException(status_code=400, detail="No se pudieron obtener los datos del canal")
-
-        # Obtener histórico del canal específico
-        historical_wordcount = get_historical_wordcount_by_channel(channel_data["channel_title"])
-
-        # Generar ruta al gráfico si existe
-        chart_path = None
-        if "wordcount_chart" in channel_data:
-            chart_path = f"/static/{channel_data['wordcount_chart']}"
-
-        # Obtener el resumen general de palabras
-        general_summary = get_wordcount_summary()
-
-        return {
-            "channel_title": channel_data["channel_title"],
-            "description": channel_data["description"],
-            "videos": channel_data["videos"],
-            "wordcount_chart": chart_path,
-            "historical_wordcount": historical_wordcount,
-            "general_wordcount_summary": general_summary
-        }
-    except ValueError as ve:
-        raise HTTPException(status_code=400, detail=str(ve))
+        job_id = await analysis_jobs.submit(request.url, kind="sync")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/analyze/jobs/{job_id}",
+        "events_url": f"/api/analyze/jobs/{job_id}/events",
+        "result_url": f"/api/analyze/jobs/{job_id}/result"
+    }
+
+@router.get("/api/analyze/jobs/{job_id}")
+async def analysis_job_status(job_id: str):
+    """
+    Estado de un trabajo de análisis, con la duración de cada etapa.
+    """
+    job = await analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@router.get("/api/analyze/jobs/{job_id}/events")
+async def analysis_job_events(job_id: str):
+    """
+    Progreso de un trabajo como Server-Sent Events: un evento "progress" en
+    cada cambio de etapa y un evento final "done" o "error".
+    """
+    job = await analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def events():
+        last = None
+        while True:
+            state = await analysis_jobs.get(job_id)
+            if state is None:
+                yield sse_event({"detail": "Trabajo no encontrado"}, event="error")
+                return
+            if state["status"] in TERMINAL_STATUSES:
+                yield sse_event(state, event=state["status"])
+                return
+            if state != last:
+                yield sse_event(state, event="progress")
+                last = state
+            await analysis_jobs.wait_changed(job_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@router.get("/api/analyze/jobs/{job_id}/result")
+async def analysis_job_result(job_id: str):
+    """
+    Resultado de un trabajo terminado (los mismos datos del dashboard que
+    devolvía /api/analyze). 409 si aún no ha terminado.
+    """
+    job = await analysis_jobs.get(job_id, include_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job["status"] == "error":
+        raise HTTPException(status_code=500, detail=f"Error interno: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail={"status": job["status"], "progress": job["progress"]})
+    return job["result"]
+
 @router.post("/api/save-wordcount")
 async def save_wordcount(data: WordcountData):
     """
@@ -105,7 +170,7 @@ async def wordcount_summary():
     Endpoint para obtener el resumen general de palabras.
     """
     try:
-        summary = get_wordcount_summary()
+        summary = await run_io(get_wordcount_summary)
         return {"wordcount_summary": summary}
     except Exception as e:
         raise HTTPException(
@@ -120,7 +185,7 @@ async def historical_wordcount(channel_name: str):
     """
     try:
         print(f"Received channel_name: {channel_name}")  # Log del canal recibido
-        wordcount = get_historical_wordcount_by_channel(channel_name)
+        wordcount = await run_io(get_historical_wordcount_by_channel, channel_name)
         print(f"Wordcount fetched: {wordcount}")  # Log del resultado
         return {"historical_wordcount": wordcount}
     except Exception as e:
@@ -146,12 +211,18 @@ async def save_user_feedback(feedback: FeedbackData):
     Endpoint para guardar la retroalimentación del usuario.
     """
     try: 
-        save_feedback(
+        await run_io(
+            save_feedback,
             feedback.type, 
             feedback.result, 
             feedback.content,
             feedback.prompt
         )
+
+        # Una definición valorada negativamente se elimina de la caché para regenerarla
+        if feedback.type == "definition" and not feedback.result:
+            await run_io(definition_cache.invalidate_definition, feedback.content)
+
         return {"message": "Feedback guardado exitosamente."}
     except Exception as e:
         raise HTTPException(
@@ -167,28 +238,80 @@ async def query_llm(request: QueryRequest):
     try:
         logger.info(f"Received question: {request.question}")
 
-        # Generar consulta SQL y prompt
-        sql_result = generate_sql_from_question(request.question)
-        logger.debug(f"Generated SQL result: {sql_result}")
+        # Plantillas, caché de SQL y, solo si hace falta, el modelo
+        answer = await run_inference(answer_question, request.question, request.page, request.page_size)
+        logger.info(f"Final result from query execution ({answer['source']}): {answer['results']}")
 
-        # Sanear la consulta SQL
-        raw_query = sql_result.get("query")  # Extraer solo la consulta SQL
-        if not raw_query:
-            logger.error("No query found in sql_result")
-            raise ValueError("No SQL query generated.")
+        return answer
 
-        sanitized_query = sanitize_sql_query(raw_query)
-        logger.debug(f"Sanitized SQL query: {sanitized_query}")
+    except (HTTPException, ExecutorBusy):
+        raise
+    except Exception as e:
+        logger.error(f"Error in query process: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
-        # Ejecutar la consulta SQL saneada
-        results = execute_sql_query(sanitized_query)
-        logger.info(f"Final result from query execution: {results}")
+@router.post("/api/query/stream")
+async def query_llm_stream(request: QueryRequest):
+    """
+    Devuelve todas las filas del resultado como JSON lines (una fila por
+    línea), leídas del servidor por lotes. La consulta se resuelve y se
+    valida antes de responder, así que sus errores llegan como 4xx/5xx.
+    """
+    try:
+        # La generación del SQL pasa por el pool de inferencia, como en /api/query
+        lines = await run_inference(prepare_stream, request.question)
+    except (HTTPException, ExecutorBusy):
+        raise
+    except Exception as e:
+        logger.error(f"Error in query stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@router.get("/api/summary/stream")
+async def stream_video_summary(video_id: str):
+    """
+    Genera el resumen de un video y lo devuelve como Server-Sent Events a
+    medida que se producen los tokens.
+    """
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
 
-        return {"results": results}
+    def error(detail):
+        return StreamingResponse(iter([sse_event({"detail": detail}, event="error")]), media_type="text/event-stream")
 
+    # La transcripción es E/S: se obtiene antes de ocupar un hueco de inferencia
+    try:
+        transcription = await run_io(obtener_transcripcion_youtube, video_url)
+    except ExecutorBusy:
+        raise
     except Exception as e:
-        logger.error(f"Error in query process: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+        logger.error(f"Error al obtener la transcripción para el resumen en streaming: {str(e)}")
+        return error(f"Error interno: {str(e)}")
+    if not transcription:
+        return error("No se pudo obtener la transcripción")
+
+    # El hueco se reserva antes de responder para poder devolver 503 si la cola está llena.
+    # Se libera al terminar la generación o, si el generador no llega a
+    # ejecutarse (el cliente se desconecta antes), al cerrar la respuesta
+    reservation = inference_pool.reserve()
+
+    def events():
+        try:
+            parts = []
+            for chunk in generar_resumen_stream(puntuar_texto_en_espanol(transcription)):
+                parts.append(chunk)
+                yield sse_event({"text": chunk})
+            yield sse_event({"summary": "".join(parts).strip()}, event="done")
+        except Exception as e:
+            logger.error(f"Error en el resumen en streaming: {str(e)}")
+            yield sse_event({"detail": f"Error interno: {str(e)}"}, event="error")
+        finally:
+            reservation.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        background=BackgroundTask(reservation.release)
+    )
 
 # Incluir las rutas del search_llm
 router.include_router(search_router, prefix="")
\ No newline at end of file
@@ -0,0 +1,301 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi.encoders import jsonable_encoder
+
+from app.utils.executors import ExecutorBusy, run_io
+from app.utils.quota import BACKGROUND, QuotaExhausted, quota_priority
+from app.database.database_service import (
+    create_analysis_job,
+    claim_next_analysis_job,
+    update_analysis_job,
+    touch_analysis_job,
+    get_analysis_job,
+    requeue_stale_analysis_jobs,
+    get_wordcount_summary,
+    get_historical_wordcount_by_channel
+)
+
+logger = logging.getLogger(__name__)
+
+# Trabajos de análisis ejecutados a la vez por proceso
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# Segundos entre consultas a la cola de Postgres cuando no hay avisos locales
+ANALYSIS_JOB_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_POLL_SECONDS", "2"))
+# Un trabajo en ejecución sin actualizaciones durante este tiempo se vuelve a encolar
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv("ANALYSIS_JOB_STALE_SECONDS", "1800"))
+# Intervalo del latido de un trabajo en ejecución (debe ser bastante menor que el anterior)
+ANALYSIS_JOB_HEARTBEAT_SECONDS = min(
+    int(os.getenv("ANALYSIS_JOB_HEARTBEAT_SECONDS", "60")),
+    ANALYSIS_JOB_STALE_SECONDS // 3
+)
+
+# Etapas del análisis de un canal, en orden
+ANALYSIS_STAGES = ["channel", "videos", "sentiment", "video_processing", "save", "chart", "dashboard"]
+# Etapas de la sincronización incremental (app/utils/channel_sync.py)
+SYNC_STAGES = ["channel", "playlist", "diff", "processing"]
+JOB_STAGES = {"analyze": ANALYSIS_STAGES, "sync": SYNC_STAGES}
+TERMINAL_STATUSES = {"done", "error"}
+
+
+class JobProgress:
+    """
+    Estado de un trabajo en ejecución. `stage` mide cada etapa y guarda el
+    progreso en Postgres; los clientes SSE de este proceso reciben el aviso
+    al instante y los de otros procesos lo leen de la tabla.
+    """
+
+    def __init__(self, job_id, channel_url, kind="analyze"):
+        self.job_id = job_id
+        self.kind = kind
+        self.channel_url = channel_url
+        self.status = "running"
+        self.stages = []
+        self.result = None
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def snapshot(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "channel_url": self.channel_url,
+            "status": self.status,
+            "stages": [dict(stage) for stage in self.stages],
+            "error": self.error,
+        }
+
+    async def _publish(self):
+        await run_io(update_analysis_job, self.job_id, self.status, self.stages, self.result, self.error)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_changed(self, timeout):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @asynccontextmanager
+    async def stage(self, name):
+        stage = {"name": name, "status": "running", "seconds": None}
+        self.stages.append(stage)
+        await self._publish()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            stage["status"] = "error"
+            raise
+        else:
+            stage["status"] = "done"
+        finally:
+            stage["seconds"] = round(time.monotonic() - start, 2)
+            await self._publish()
+
+    async def heartbeat(self, every=ANALYSIS_JOB_HEARTBEAT_SECONDS):
+        """
+        Renueva updated_at mientras el trabajo se ejecuta: las etapas largas
+        (transcripción, comentarios) no publican nada en mucho tiempo y el
+        trabajo no debe parecer abandonado a otro proceso que arranque.
+        """
+        while True:
+            await asyncio.sleep(every)
+            await run_io(touch_analysis_job, self.job_id)
+
+    async def finish(self, result=None, error=None):
+        self.status = "error" if error else "done"
+        self.result = jsonable_encoder(result) if result is not None else None
+        self.error = error
+        await self._publish()
+
+    async def requeue(self):
+        """
+        Devuelve el trabajo a la cola (se reintentará desde el principio).
+        """
+        self.status = "queued"
+        self.stages = []
+        await self._publish()
+
+
+@asynccontextmanager
+async def job_stage(progress, name):
+    """
+    Etapa de un trabajo; no hace nada si el análisis no se ejecuta como trabajo.
+    """
+    if progress is None:
+        yield
+    else:
+        async with progress.stage(name):
+            yield
+
+
+def with_progress(job):
+    """
+    Añade al estado de un trabajo el progreso (etapas terminadas / total).
+    """
+    if job is None:
+        return None
+    stages = JOB_STAGES.get(job.get("kind"), ANALYSIS_STAGES)
+    done = sum(1 for stage in job["stages"] if stage["status"] == "done")
+    job["progress"] = 1.0 if job["status"] == "done" else round(done / len(stages), 2)
+    return job
+
+
+async def build_analysis_result(channel_url, progress=None):
+    """
+    Ejecuta el análisis completo de un canal y devuelve los datos del dashboard.
+    """
+    from app.utils.youtube_api import fetch_channel_videos
+
+    channel_data = await fetch_channel_videos(channel_url, progress=progress)
+    if not channel_data:
+        raise ValueError("No se pudieron obtener los datos del canal")
+
+    async with job_stage(progress, "dashboard"):
+        # Histórico del canal y resumen general de palabras
+        historical_wordcount = await run_io(get_historical_wordcount_by_channel, channel_data["channel_title"])
+        general_summary = await run_io(get_wordcount_summary)
+
+    # Generar ruta al gráfico si existe
+    chart_path = None
+    if "wordcount_chart" in channel_data:
+        chart_path = f"/static/{channel_data['wordcount_chart']}"
+
+    return {
+        "channel_title": channel_data["channel_title"],
+        "description": channel_data["description"],
+        "videos": channel_data["videos"],
+        "wordcount_chart": chart_path,
+        "historical_wordcount": historical_wordcount,
+        "general_wordcount_summary": general_summary
+    }
+
+
+async def run_job(kind, channel_url, progress=None):
+    """
+    Ejecuta un trabajo según su tipo: análisis del dashboard o sincronización
+    incremental. La sincronización gasta cuota de la API con prioridad baja.
+    """
+    if kind == "sync":
+        from app.utils.channel_sync import sync_channel
+        with quota_priority(BACKGROUND):
+            return await sync_channel(channel_url, progress=progress)
+    return await build_analysis_result(channel_url, progress)
+
+
+class AnalysisJobQueue:
+    """
+    Cola de trabajos de análisis respaldada por la tabla `analysis_jobs`.
+
+    Los workers toman trabajos con SELECT ... FOR UPDATE SKIP LOCKED, así que
+    varios procesos comparten la cola sin repetir trabajos, y los trabajos
+    encolados sobreviven a un reinicio. Al arrancar se reencolan los que
+    quedaron a medias.
+    """
+
+    def __init__(self, workers=ANALYSIS_JOB_WORKERS, poll_seconds=ANALYSIS_JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._running = {}
+        self._tasks = []
+        self._wakeup = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        requeued = await run_io(requeue_stale_analysis_jobs, ANALYSIS_JOB_STALE_SECONDS)
+        if requeued:
+            logger.info(f"{requeued} trabajos de análisis reencolados")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, channel_url, kind="analyze"):
+        """
+        Encola el análisis (o la sincronización) de un canal y devuelve el id del trabajo.
+        """
+        if kind not in JOB_STAGES:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        job_id = str(uuid.uuid4())
+        await run_io(create_analysis_job, job_id, channel_url, kind)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id, include_result=False):
+        """
+        Devuelve el estado de un trabajo (de memoria si se ejecuta en este
+        proceso) o None si no existe.
+        """
+        progress = self._running.get(job_id)
+        if progress is not None and not include_result:
+            return with_progress(progress.snapshot())
+
+        job = await run_io(get_analysis_job, job_id)
+        if job is None:
+            return None
+        for field in ("created_at", "started_at", "updated_at"):
+            if job.get(field) is not None:
+                job[field] = job[field].isoformat()
+        if not include_result:
+            job.pop("result", None)
+        return with_progress(job)
+
+    async def wait_changed(self, job_id):
+        """
+        Espera a que cambie el estado de un trabajo, como mucho `poll_seconds`.
+        """
+        progress = self._running.get(job_id)
+        if progress is not None:
+            await progress.wait_changed(self.poll_seconds)
+        else:
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _next_job(self):
+        while True:
+            job = await run_io(claim_next_analysis_job)
+            if job:
+                return job
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, index):
+        while True:
+            job = await self._next_job()
+            progress = JobProgress(job["job_id"], job["channel_url"], job["kind"])
+            self._running[progress.job_id] = progress
+            logger.info(f"[analysis-{index}] Trabajo {progress.job_id} ({progress.kind}): {progress.channel_url}")
+            heartbeat = asyncio.create_task(progress.heartbeat())
+            try:
+                result = await run_job(progress.kind, progress.channel_url, progress)
+                await progress.finish(result=result)
+            except asyncio.CancelledError:
+                # El proceso se detiene: otro worker retomará el trabajo
+                await progress.requeue()
+                raise
+            except (ExecutorBusy, QuotaExhausted) as e:
+                # Inferencia saturada o cuota agotada: el trabajo vuelve a la cola y el worker espera
+                logger.warning(f"[analysis-{index}] {str(e)}; trabajo {progress.job_id} reencolado")
+                await progress.requeue()
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.error(f"[analysis-{index}] Error en el trabajo {progress.job_id}: {str(e)}")
+                await progress.finish(error=str(e))
+            finally:
+                heartbeat.cancel()
+                self._running.pop(progress.job_id, None)
+
+
+analysis_jobs = AnalysisJobQueue()
@@ -1,25 +1,75 @@
 # Importaciones
 import os
 import re
+import sys
 import time
+import tempfile
+import subprocess
 import yt_dlp
-import whisper
 import speech_recognition as sr
 from vosk import Model, KaldiRecognizer
 import wave
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from youtube_transcript_api import YouTubeTranscriptApi
+import traceback
+import hashlib
+from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
+import numpy as np
 import torch
+from transformers import StoppingCriteriaList
 from app.utils.text_analysis import limpiar_y_contar, TextAnalyzer
+from app.utils.model_registry import model_registry, QWEN_CHAT_MODEL
+from app.database.database_service import get_video_analysis, save_video_analysis
+from app.utils.transcription import transcribir_archivo, transcribir_stream, SAMPLE_RATE
+from app.utils.transcript_store import transcript_store, join_segments
+from app.utils.streaming import SentenceBoundaryStoppingCriteria, left_pad_batch, stream_generate
+from app.utils.model_server import served, model_server_client
 
 # Set environment variables
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 # Configuración de los modelos
-SMALL_CHAT_MODEL_CON_CASTELLANO = "Qwen/Qwen2-1.5B-Instruct"
+SMALL_CHAT_MODEL_CON_CASTELLANO = QWEN_CHAT_MODEL
 DEVICE = "cpu"
 
+# Longitud objetivo del resumen en tokens: al alcanzarla se corta en el siguiente final de frase
+SUMMARY_TARGET_TOKENS = int(os.getenv("SUMMARY_TARGET_TOKENS", "320"))
+SUMMARY_GENERATION_KWARGS = {
+    "max_new_tokens": 512,
+    "do_sample": True,
+    "temperature": 0.7,
+}
+
+# Resumen map-reduce de transcripciones largas: tamaño de ventana, solapamiento,
+# ventanas por lote y longitud de los resúmenes parciales (en tokens)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+SUMMARY_CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP", "100"))
+SUMMARY_CHUNK_BATCH_SIZE = int(os.getenv("SUMMARY_CHUNK_BATCH_SIZE", "4"))
+SUMMARY_CHUNK_TARGET_TOKENS = 120
+SUMMARY_CHUNK_MAX_TOKENS = 200
+# Rondas de combinación como máximo; si aún no cabe en una ventana se trunca
+SUMMARY_MAX_REDUCE_ROUNDS = int(os.getenv("SUMMARY_MAX_REDUCE_ROUNDS", "4"))
+
+# Cada ronda debe reducir el texto al menos a la mitad para terminar
+if SUMMARY_CHUNK_TOKENS - SUMMARY_CHUNK_OVERLAP < 2 * SUMMARY_CHUNK_MAX_TOKENS:
+    raise ValueError(
+        f"SUMMARY_CHUNK_TOKENS - SUMMARY_CHUNK_OVERLAP ({SUMMARY_CHUNK_TOKENS - SUMMARY_CHUNK_OVERLAP}) "
+        f"debe ser al menos el doble de SUMMARY_CHUNK_MAX_TOKENS ({SUMMARY_CHUNK_MAX_TOKENS})"
+    )
+
+# Transcripción del audio con Whisper cuando el video no tiene subtítulos
+WHISPER_FALLBACK = os.getenv("WHISPER_FALLBACK", "0") == "1"
+# Audio por streaming (yt-dlp -> ffmpeg -> PCM por pipes, sin archivos) o descargando un WAV temporal
+AUDIO_STREAMING = os.getenv("AUDIO_STREAMING", "1") == "1"
+# Segundos de audio por bloque leído del pipe de ffmpeg
+AUDIO_CHUNK_SECONDS = int(os.getenv("AUDIO_CHUNK_SECONDS", "10"))
+# Directorio de los WAV temporales y tamaño máximo de la descarga (MB) en modo archivo
+AUDIO_TMP_DIR = os.getenv("AUDIO_TMP_DIR", "downloads")
+AUDIO_MAX_DOWNLOAD_MB = int(os.getenv("AUDIO_MAX_DOWNLOAD_MB", "200"))
+
+# Versión del análisis (resumen, wordcount, marcas). Incrementarla invalida
+# los resultados guardados en la tabla video_analysis
+ANALYSIS_VERSION = 1
+
 # Optimizaciones de PyTorch
 torch.set_grad_enabled(False)
 torch.cuda.empty_cache()
@@ -27,81 +77,188 @@ torch.backends.cudnn.benchmark = False
 torch.backends.cudnn.deterministic = True
 
 class ModelManager:
-    def __init__(self):
-        self.model = None
-        self.tokenizer = None
-        self.is_initialized = False
+    """
+    Acceso al modelo Qwen a través del registro compartido de modelos.
+    """
+    def __init__(self, model_name=SMALL_CHAT_MODEL_CON_CASTELLANO, dtype=None):
+        self.model_name = model_name
+        self.dtype = dtype
+
+    @property
+    def is_initialized(self):
+        # Con servidor de modelos el modelo vive en otro proceso
+        if model_server_client.enabled:
+            return True
+        return model_registry.is_loaded(self.model_name, self.dtype)
 
     def initialize(self):
+        if model_server_client.enabled:
+            return True
         try:
-            print("Cargando modelo Qwen...")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                SMALL_CHAT_MODEL_CON_CASTELLANO,
-                torch_dtype=torch.float32,
-                low_cpu_mem_usage=True,
-                trust_remote_code=True,
-                device_map="cpu"
-            )
-            
-            print("Cargando tokenizer Qwen...")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                SMALL_CHAT_MODEL_CON_CASTELLANO,
-                trust_remote_code=True
-            )
-            
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-                self.model.config.pad_token_id = self.model.config.eos_token_id
-
-            self.is_initialized = True
+            model_registry.preload(self.model_name, self.dtype)
             print("Modelo y tokenizer inicializados correctamente.")
             return True
         except Exception as e:
             print(f"❌ Error al inicializar modelos/tokenizer: {str(e)}")
-            self.is_initialized = False
             return False
 
-    def get_model_and_tokenizer(self):
-        if not self.is_initialized:
-            success = self.initialize()
-            if not success:
-                raise ValueError("No se pudo inicializar el modelo y tokenizer")
-        return self.model, self.tokenizer
+    def use(self):
+        """
+        Context manager que devuelve el handle compartido del modelo.
+        """
+        return model_registry.use(self.model_name, self.dtype)
 
 # Inicialización del gestor de modelos
 model_manager = ModelManager()
 
-def download_audio_yt_dlp(video_url):
+def download_audio_yt_dlp(video_url, output_dir=AUDIO_TMP_DIR):
+    """
+    Descarga el audio de un video y lo convierte a WAV mono de 16 kHz. El
+    archivo original se elimina tras la conversión.
+
+    Returns:
+        str: Ruta del WAV (el llamador debe borrarlo) o None si falla
+    """
     try:
-        output_dir = "downloads"
         os.makedirs(output_dir, exist_ok=True)
-        
+
         ydl_opts = {
             'format': 'bestaudio/best',
             'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'wav'}],
+            'postprocessor_args': {'extractaudio': ['-ar', str(SAMPLE_RATE), '-ac', '1']},
             'outtmpl': os.path.join(output_dir, '%(id)s.%(ext)s'),
-            'keepvideo': True
+            'keepvideo': False,
+            'max_filesize': AUDIO_MAX_DOWNLOAD_MB * 1024 ** 2,
+            'quiet': True
         }
-        
+
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-            
-        return output_dir
+            info = ydl.extract_info(video_url, download=True)
+            audio_file = os.path.splitext(ydl.prepare_filename(info))[0] + ".wav"
+
+        if not os.path.exists(audio_file):
+            raise FileNotFoundError(f"No se generó el archivo {audio_file}")
+        return audio_file
     except Exception as e:
         print(f"Error al descargar audio: {e}")
         return None
 
-def transcribir_audio_whisper(audio_file):
+def stream_audio_pcm(video_url, chunk_seconds=AUDIO_CHUNK_SECONDS):
+    """
+    Decodifica el audio de un video a PCM mono de 16 kHz sin escribir en
+    disco: yt-dlp vuelca el audio en su salida estándar, ffmpeg lo lee por un
+    pipe y lo convierte, y se devuelven bloques float32 de `chunk_seconds`
+    segundos a medida que llegan. Si el consumidor se detiene, los pipes se
+    llenan y la descarga espera.
+    """
+    chunk_bytes = chunk_seconds * SAMPLE_RATE * 2  # 16 bits por muestra
+    # Procesos arrancados; si ffmpeg no llega a arrancar, yt-dlp se mata igualmente
+    processes = []
+    try:
+        downloader = subprocess.Popen(
+            [sys.executable, "-m", "yt_dlp", "--quiet", "--no-part", "-f", "bestaudio/best", "-o", "-", video_url],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        processes.append(downloader)
+        decoder = subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"
+            ],
+            stdin=downloader.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        processes.append(decoder)
+        downloader.stdout.close()  # ffmpeg es el único lector del pipe
+
+        while True:
+            data = decoder.stdout.read(chunk_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16)
+            yield samples.astype(np.float32) / 32768.0
+        if decoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg: {decoder.stderr.read().decode(errors='ignore').strip()[-300:]}")
+        if downloader.wait() != 0:
+            raise RuntimeError(f"yt-dlp terminó con código {downloader.returncode}")
+    finally:
+        for process in reversed(processes):
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            for pipe in (process.stdout, process.stderr):
+                if pipe is not None:
+                    pipe.close()
+
+@served("transcribe_stream")
+def transcribir_audio_stream(video_url, language="es"):
+    """
+    Transcribe el audio de un video mientras se descarga (ver stream_audio_pcm).
+    """
+    return transcribir_stream(stream_audio_pcm(video_url), language=language)
+
+def transcribir_video_whisper(video_url, language="es"):
+    """
+    Transcribe con Whisper el audio de un video sin subtítulos, por streaming
+    (AUDIO_STREAMING) o a través de un WAV temporal que se borra al terminar.
+    El resultado se guarda en el almacén de transcripciones con el idioma
+    "<idioma>-whisper", así que cada video se transcribe una sola vez.
+
+    Returns:
+        str: Texto de la transcripción o None
+    """
+    video_id = extraer_video_id(video_url)
+    store_lang = f"{language}-whisper"
+    stored = transcript_store.get(video_id, store_lang)
+    if stored is not None:
+        return join_segments(stored)
+
+    try:
+        if AUDIO_STREAMING:
+            segments = transcribir_audio_stream(video_url, language)
+        else:
+            os.makedirs(AUDIO_TMP_DIR, exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix="audio-", dir=AUDIO_TMP_DIR) as tmp_dir:
+                audio_file = download_audio_yt_dlp(video_url, output_dir=tmp_dir)
+                if not audio_file:
+                    return None
+                segments = transcribir_archivo(audio_file, language=language)
+    except Exception as e:
+        print(f"Error en la transcripción con Whisper: {e}")
+        return None
+
+    if not segments:
+        print("La transcripción con Whisper está vacía.")
+        return None
+    # Un fallo al guardar (disco lleno, permisos) no debe tirar una transcripción ya hecha
+    try:
+        transcript_store.put(video_id, store_lang, [
+            {"text": segment["text"], "start": segment["start"], "duration": segment["end"] - segment["start"]}
+            for segment in segments
+        ])
+    except OSError as e:
+        print(f"No se pudo guardar la transcripción de Whisper de {video_id}: {e}")
+    return join_segments(segments)
+
+def transcribir_audio_whisper(audio_file, return_segments=False):
+    """
+    Transcribe el audio con Whisper. El modelo permanece cargado en los
+    procesos del pool de transcripción y el audio se divide en segmentos de
+    voz que se transcriben en paralelo.
+
+    Si `return_segments` es True devuelve la lista de segmentos con sus
+    marcas de tiempo en lugar del texto.
+    """
     try:
         print("\nIniciando transcripción con Whisper...")
-        model = whisper.load_model("small", device="cpu")
-        
-        print("Transcribiendo con Whisper...")
-        result = model.transcribe(audio_file, language="es", task="transcribe")
-        
-        if result and "text" in result and result["text"].strip():
-            print("Transcripción completada con Whisper.")
-            return result["text"]
+        segments = transcribir_archivo(audio_file, language="es")
+        text = " ".join(segment["text"] for segment in segments)
+
+        if text.strip():
+            print(f"Transcripción completada con Whisper ({len(segments)} segmentos).")
+            return segments if return_segments else text
         else:
             print("La transcripción con Whisper está vacía.")
             return None
@@ -110,15 +267,33 @@ def transcribir_audio_whisper(audio_file):
         print(f"Error en la transcripción con Whisper: {e}")
         return None
 
-def obtener_transcripcion_youtube(video_url):
+def obtener_segmentos_youtube(video_url, lang="es"):
+    """
+    Segmentos con tiempos de la transcripción de un video. Se leen del
+    almacén local si ya se descargaron; si no, se piden a YouTube y se guardan.
+
+    Returns:
+        list: [{"text", "start", "duration"}] o None si el video no tiene
+        transcripción. Los errores de red o de la API se propagan.
+    """
+    video_id = extraer_video_id(video_url)
+    segments = transcript_store.get(video_id, lang)
+    if segments is not None:
+        return segments
     try:
-        video_id = video_url.split("https://www.youtube.com/watch?v=")[-1]
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['es'])
-        transcription = " ".join([item['text'] for item in transcript])
-        return transcription
-    except Exception as e:
-        print(f"Error al obtener la transcripción con YouTubeTranscriptApi: {str(e)}")
+        segments = YouTubeTranscriptApi.get_transcript(video_id, languages=[lang])
+    except (TranscriptsDisabled, NoTranscriptFound, VideoUnavailable) as e:
+        print(f"El video {video_id} no tiene transcripción disponible: {str(e)}")
         return None
+    try:
+        transcript_store.put(video_id, lang, segments)
+    except OSError as e:
+        print(f"No se pudo guardar la transcripción de {video_id}: {e}")
+    return segments
+
+def obtener_transcripcion_youtube(video_url):
+    segments = obtener_segmentos_youtube(video_url)
+    return join_segments(segments) if segments else None
 
 def puntuar_texto_en_espanol(texto):
     try:
@@ -131,72 +306,226 @@ def puntuar_texto_en_espanol(texto):
         print(f"Error al puntuar el texto: {e}")
         return texto
 
+SUMMARY_PROMPT = "Resume el siguiente texto en español manteniendo las ideas clave: {texto}"
+MERGE_PROMPT = (
+    "Combina los siguientes resúmenes parciales de un mismo video en un único resumen "
+    "en español, sin repetir ideas: {texto}"
+)
+
+def _summary_messages(texto, instruction=SUMMARY_PROMPT):
+    return [
+        {"role": "system", "content": "Eres un asistente que proporciona resúmenes de textos."},
+        {"role": "user", "content": instruction.format(texto=texto)}
+    ]
+
+def split_into_chunks(tokenizer, texto, chunk_tokens=None, overlap_tokens=None):
+    """
+    Divide el texto en ventanas de como máximo `chunk_tokens` tokens con un
+    pequeño solapamiento entre ventanas consecutivas.
+    """
+    chunk_tokens = chunk_tokens or SUMMARY_CHUNK_TOKENS
+    overlap_tokens = SUMMARY_CHUNK_OVERLAP if overlap_tokens is None else overlap_tokens
+    ids = tokenizer(texto, add_special_tokens=False)["input_ids"]
+    if len(ids) <= chunk_tokens:
+        return [texto]
+
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(ids), step):
+        chunks.append(tokenizer.decode(ids[start:start + chunk_tokens]))
+        if start + chunk_tokens >= len(ids):
+            break
+    return chunks
+
+def _summarize_batch(model, tokenizer, texts, instruction, target_tokens, max_new_tokens):
+    """
+    Resume varios textos en una sola llamada a `generate` (padding por la izquierda).
+    """
+    prompts = [
+        tokenizer.apply_chat_template(_summary_messages(texto, instruction), tokenize=False, add_generation_prompt=True)
+        for texto in texts
+    ]
+    input_ids, attention_mask = left_pad_batch(tokenizer, prompts)
+    criteria = SentenceBoundaryStoppingCriteria(tokenizer, input_ids.shape[1], target_tokens)
+    generation_kwargs = dict(SUMMARY_GENERATION_KWARGS, max_new_tokens=max_new_tokens)
+    with torch.no_grad():
+        generated_ids = model.generate(
+            input_ids=input_ids.to(DEVICE),
+            attention_mask=attention_mask.to(DEVICE),
+            stopping_criteria=StoppingCriteriaList([criteria]),
+            pad_token_id=tokenizer.pad_token_id,
+            **generation_kwargs
+        )
+    return [r.strip() for r in tokenizer.batch_decode(criteria.trim(generated_ids), skip_special_tokens=True)]
+
+def _map_reduce(model, tokenizer, texto):
+    """
+    Reduce el texto a un conjunto de resúmenes parciales que caben en una sola
+    ventana. Devuelve (texto a resumir, instrucción a usar en el paso final).
+    """
+    chunks = split_into_chunks(tokenizer, texto)
+    if len(chunks) == 1:
+        return texto, SUMMARY_PROMPT
+
+    instruction = SUMMARY_PROMPT
+    for _ in range(SUMMARY_MAX_REDUCE_ROUNDS):
+        if len(chunks) == 1:
+            break
+        print(f"Resumiendo {len(chunks)} fragmentos...")
+        partials = []
+        for start in range(0, len(chunks), SUMMARY_CHUNK_BATCH_SIZE):
+            partials.extend(_summarize_batch(
+                model,
+                tokenizer,
+                chunks[start:start + SUMMARY_CHUNK_BATCH_SIZE],
+                instruction,
+                SUMMARY_CHUNK_TARGET_TOKENS,
+                SUMMARY_CHUNK_MAX_TOKENS
+            ))
+        # Agrupar los resúmenes parciales en ventanas y repetir hasta que quepan en una
+        instruction = MERGE_PROMPT
+        merged = "\n\n".join(p for p in partials if p)
+        chunks = split_into_chunks(tokenizer, merged, overlap_tokens=0)
+    if len(chunks) > 1:
+        print(f"Resumen truncado: {len(chunks)} fragmentos tras {SUMMARY_MAX_REDUCE_ROUNDS} rondas")
+    return chunks[0], MERGE_PROMPT
+
+@served("summarize")
 def generar_resumen(texto):
+    """
+    Genera el resumen del texto. Los textos largos se dividen en ventanas que
+    se resumen por lotes y cuyos resúmenes se combinan jerárquicamente, de
+    modo que el tamaño del prompt nunca supera SUMMARY_CHUNK_TOKENS.
+    """
     try:
-        # Get model and tokenizer from the manager
-        model, tokenizer = model_manager.get_model_and_tokenizer()
-        
-        prompt = f"Resume el siguiente texto en español manteniendo las ideas clave: {texto}"
-        messages = [
-            {"role": "system", "content": "Eres un asistente que proporciona resúmenes de textos."},
-            {"role": "user", "content": prompt}
-        ]
-
-        with torch.no_grad():
-            text = tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-
-            # Fix: Properly handle the input encoding
-            inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-            
-            # Move inputs to device if needed
-            inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
-            
-            # Generate summary
-            generated_ids = model.generate(
-                input_ids=inputs['input_ids'],
-                attention_mask=inputs['attention_mask'],
-                max_new_tokens=512,
-                do_sample=True,
-                temperature=0.7,
-                num_return_sequences=1,
-                pad_token_id=tokenizer.pad_token_id
-            )
-            
-            # Process only the new tokens (exclude input tokens)
-            generated_ids = generated_ids[:, inputs['input_ids'].shape[1]:]
-            
-            # Decode the generated text
-            resumen = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            
-            return resumen.strip()
-            
+        # Get model and tokenizer from the shared registry
+        with model_manager.use() as handle:
+            texto, instruction = _map_reduce(handle.model, handle.tokenizer, texto)
+            return _generar_resumen(handle.model, handle.tokenizer, texto, instruction)
     except Exception as e:
         print(f"Error al generar el resumen: {str(e)}")
         traceback.print_exc()  # Add this to get more detailed error information
         return None
-    
-def procesar_video(video_url):
+
+def _summary_inputs(tokenizer, texto, instruction=SUMMARY_PROMPT):
+    """
+    Construye el prompt de resumen y lo tokeniza.
+    """
+    text = tokenizer.apply_chat_template(
+        _summary_messages(texto, instruction),
+        tokenize=False,
+        add_generation_prompt=True
+    )
+
+    # Fix: Properly handle the input encoding
+    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
+
+    # Move inputs to device if needed
+    inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
+    return inputs['input_ids'], inputs['attention_mask']
+
+def _generar_resumen(model, tokenizer, texto, instruction=SUMMARY_PROMPT):
+    """
+    Genera el resumen con el modelo y tokenizer indicados.
+    """
+    with torch.no_grad():
+        input_ids, attention_mask = _summary_inputs(tokenizer, texto, instruction)
+
+        # Generate summary, stopping at the first sentence end after the target length
+        criteria = SentenceBoundaryStoppingCriteria(tokenizer, input_ids.shape[1], SUMMARY_TARGET_TOKENS)
+        generated_ids = model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            stopping_criteria=StoppingCriteriaList([criteria]),
+            num_return_sequences=1,
+            pad_token_id=tokenizer.pad_token_id,
+            **SUMMARY_GENERATION_KWARGS
+        )
+
+        # Decode only the new tokens (exclude input tokens)
+        resumen = tokenizer.batch_decode(criteria.trim(generated_ids), skip_special_tokens=True)[0]
+
+        return resumen.strip()
+
+def generar_resumen_stream(texto):
+    """
+    Genera el resumen devolviendo los fragmentos de texto a medida que se
+    producen. En textos largos solo se transmite el paso final de combinación.
+    Con servidor de modelos se devuelve el resumen completo en un fragmento.
+    """
+    if model_server_client.enabled:
+        yield generar_resumen(texto) or ""
+        return
+    with model_manager.use() as handle:
+        texto, instruction = _map_reduce(handle.model, handle.tokenizer, texto)
+        input_ids, attention_mask = _summary_inputs(handle.tokenizer, texto, instruction)
+        yield from stream_generate(
+            handle.model,
+            handle.tokenizer,
+            input_ids,
+            attention_mask,
+            SUMMARY_TARGET_TOKENS,
+            pad_token_id=handle.tokenizer.pad_token_id,
+            **SUMMARY_GENERATION_KWARGS
+        )
+
+def extraer_video_id(video_url):
+    return video_url.split("https://www.youtube.com/watch?v=")[-1]
+
+def hash_transcripcion(transcription):
+    """
+    Hash del contenido de la transcripción junto con la versión del análisis,
+    para invalidar los resultados guardados si cambia el procesamiento.
+    """
+    contenido = f"{ANALYSIS_VERSION}\n{transcription}".encode("utf-8")
+    return hashlib.sha256(contenido).hexdigest()
+
+def procesar_video(video_url, raise_errors=False):
+    """
+    Transcribe, resume y analiza un video.
+
+    Returns:
+        dict con el análisis, o None si el video no tiene transcripción. Si
+        falla otra cosa devuelve también None, salvo con `raise_errors`, en
+        cuyo caso el error se propaga para distinguirlo de la falta de
+        transcripción.
+    """
     try:
         print("\n=== Intentando el flujo con YouTubeTranscriptApi ===")
         analyzer = TextAnalyzer()
-        
-        # Initialize model manager if not already initialized
-        if not model_manager.is_initialized:
-            if not model_manager.initialize():
-                raise ValueError("No se pudo inicializar el modelo")
-        
+        video_id = extraer_video_id(video_url)
+
         transcription = obtener_transcripcion_youtube(video_url)
+        if not transcription and WHISPER_FALLBACK:
+            print("No se pudo obtener la transcripción, transcribiendo el audio con Whisper...")
+            transcription = transcribir_video_whisper(video_url)
         if not transcription:
-            print("No se pudo obtener la transcripción, iniciando flujo alternativo...")
+            print("No se pudo obtener la transcripción.")
             return None
 
         print("\nPuntuando texto...")
         puntuado_texto = puntuar_texto_en_espanol(transcription)
-        
+
+        # Si la transcripción no ha cambiado, reutilizar el análisis guardado
+        transcript_hash = hash_transcripcion(transcription)
+        guardado = get_video_analysis(video_id)
+        if guardado and guardado["transcript_hash"] == transcript_hash:
+            print(f"\nAnálisis del video {video_id} recuperado de la base de datos.")
+            return {
+                "transcription": transcription,
+                "punctuated_text": puntuado_texto,
+                "summary": guardado["summary"],
+                "wordcount": [tuple(item) for item in guardado["wordcount"] or []],
+                "brands": guardado["brands"] or [],
+                "total_palabras": guardado["total_palabras"],
+                "cached": True,
+            }
+
+        # Initialize model manager if not already initialized
+        if not model_manager.is_initialized:
+            if not model_manager.initialize():
+                raise ValueError("No se pudo inicializar el modelo")
+
         print("\nGenerando resumen...")
         resumen = generar_resumen(puntuado_texto)
         if not resumen:
@@ -207,6 +536,8 @@ def procesar_video(video_url):
         detected_brands = analyzer.find_brands_in_transcription(transcription)
         total_palabras = sum(frecuencia for _, frecuencia in wordcount)
 
+        save_video_analysis(video_id, transcript_hash, resumen, wordcount, detected_brands, total_palabras)
+
         return {
             "transcription": transcription,
             "punctuated_text": puntuado_texto,
@@ -214,8 +545,11 @@ def procesar_video(video_url):
             "wordcount": wordcount,
             "brands": detected_brands,
             "total_palabras": total_palabras,
+            "cached": False,
         }
 
     except Exception as e:
         print(f"\n❌ Error en el flujo: {str(e)}")
-        return None
\ No newline at end of file
+        if raise_errors:
+            raise
+        return None
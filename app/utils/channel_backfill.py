@@ -0,0 +1,336 @@
+import os
+import time
+import asyncio
+import logging
+
+from app.utils.executors import run_io, run_background_inference
+from app.utils.quota import BACKGROUND, quota_priority
+from app.utils.audio_processing import obtener_transcripcion_youtube
+from app.utils.text_analysis import limpiar_y_contar, TextAnalyzer
+from app.utils.sentiment_analysis import analyze_comments_by_video
+from app.utils.youtube_api import (
+    fetch_channel_info,
+    iter_playlist_items,
+    fetch_videos_metadata,
+    fetch_comments_by_video,
+    VIDEOS_BATCH_SIZE
+)
+from app.database.database_service import (
+    insert_video_wordcount,
+    save_video_brands,
+    add_backfill_videos,
+    get_backfill_videos,
+    update_backfill_video,
+    get_backfill_summary
+)
+
+logger = logging.getLogger(__name__)
+
+# Workers de cada etapa del pipeline
+BACKFILL_TRANSCRIPT_WORKERS = int(os.getenv("BACKFILL_TRANSCRIPT_WORKERS", "4"))
+BACKFILL_TEXT_WORKERS = int(os.getenv("BACKFILL_TEXT_WORKERS", "2"))
+BACKFILL_SENTIMENT_WORKERS = int(os.getenv("BACKFILL_SENTIMENT_WORKERS", "1"))
+# Videos cuyos comentarios se puntúan en una misma llamada al modelo
+BACKFILL_SENTIMENT_BATCH = int(os.getenv("BACKFILL_SENTIMENT_BATCH", "8"))
+# Comentarios analizados por video
+BACKFILL_MAX_COMMENTS = int(os.getenv("BACKFILL_MAX_COMMENTS", "25"))
+# Intentos de un video fallido antes de dejarlo fuera de las siguientes ejecuciones
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "3"))
+
+
+class BackfillStats:
+    """
+    Contadores de una ejecución del backfill, con ritmo y tiempo restante
+    estimado a partir de los videos terminados en esta ejecución. Mientras se
+    lista la playlist, los videos aún no listados se estiman con el número de
+    videos del canal (`expected`); sin él no se muestra ETA hasta terminar.
+    """
+
+    def __init__(self, limit=None):
+        self.start = time.monotonic()
+        self.limit = limit
+        self.expected = None
+        self.listed = 0
+        self.already_done = 0
+        self.queued = 0
+        self.listing = True
+        self.outcomes = {"done": 0, "skipped": 0, "failed": 0}
+
+    def record(self, outcome):
+        self.outcomes[outcome] += 1
+
+    @property
+    def finished(self):
+        return sum(self.outcomes.values())
+
+    def rate(self):
+        """
+        Videos terminados por minuto.
+        """
+        elapsed = time.monotonic() - self.start
+        return self.finished / elapsed * 60 if elapsed > 0 else 0.0
+
+    def remaining(self):
+        """
+        Videos que quedan por terminar, o None si aún no se puede estimar.
+        """
+        remaining = self.queued - self.finished
+        if self.listing:
+            if self.expected is None:
+                return None
+            remaining += max(self.expected - self.listed, 0)
+        if self.limit is not None:
+            remaining = min(remaining, self.limit - self.finished)
+        return max(remaining, 0)
+
+    def eta_seconds(self):
+        rate = self.rate()
+        remaining = self.remaining()
+        if not rate or remaining is None:
+            return None
+        return remaining / rate * 60
+
+    def line(self):
+        eta = self.eta_seconds()
+        eta_text = format_duration(eta) if eta is not None else "-"
+        return (
+            f"{self.finished}/{self.queued} videos"
+            f"{' (listando...)' if self.listing else ''} | "
+            f"ok {self.outcomes['done']}, sin transcripción {self.outcomes['skipped']}, "
+            f"fallidos {self.outcomes['failed']}, ya procesados {self.already_done} | "
+            f"{self.rate():.1f} videos/min | ETA {eta_text}"
+        )
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {seconds:02d}s"
+
+
+def analizar_transcripcion(transcription):
+    """
+    Wordcount y marcas detectadas de una transcripción.
+    """
+    wordcount = limpiar_y_contar(transcription)
+    brands = TextAnalyzer().find_brands_in_transcription(transcription)
+    return wordcount, brands, sum(frecuencia for _, frecuencia in wordcount)
+
+
+def needs_work(state, retry_failed, max_attempts):
+    """
+    Indica si un video del checkpoint tiene que procesarse en esta ejecución.
+    """
+    if state["status"] == "pending":
+        return True
+    return retry_failed and state["status"] == "failed" and state["attempts"] < max_attempts
+
+
+class ChannelBackfill:
+    """
+    Ingesta del histórico completo de un canal como un pipeline de etapas
+    conectadas por colas acotadas:
+
+        playlist -> transcript -> text (wordcount y marcas) -> sentiment
+
+    La playlist de subidas se recorre página a página y cada página se
+    registra en `backfill_videos` antes de encolar sus videos, de modo que el
+    estado de cada video queda guardado en Postgres. Si la ejecución se
+    interrumpe, la siguiente salta los videos terminados y retoma en la etapa
+    de sentimiento los que ya tenían el wordcount guardado.
+    """
+
+    def __init__(
+        self,
+        channel_url,
+        transcript_workers=BACKFILL_TRANSCRIPT_WORKERS,
+        text_workers=BACKFILL_TEXT_WORKERS,
+        sentiment_workers=BACKFILL_SENTIMENT_WORKERS,
+        sentiment_batch=BACKFILL_SENTIMENT_BATCH,
+        max_comments=BACKFILL_MAX_COMMENTS,
+        retry_failed=True,
+        max_attempts=BACKFILL_MAX_ATTEMPTS,
+        limit=None
+    ):
+        self.channel_url = channel_url
+        self.transcript_workers = transcript_workers
+        self.text_workers = text_workers
+        self.sentiment_workers = sentiment_workers
+        self.sentiment_batch = sentiment_batch
+        self.max_comments = max_comments
+        self.retry_failed = retry_failed
+        self.max_attempts = max_attempts
+        self.limit = limit
+        self.stats = BackfillStats(limit)
+        self.channel_id = None
+        self.channel_name = None
+
+    async def _checkpoint(self, video_id, status, stage=None, average_stars=None, error=None):
+        await run_io(update_backfill_video, self.channel_id, video_id, status, stage, average_stars, error)
+        if status != "pending":
+            self.stats.record(status)
+
+    async def _fail(self, video, stage, error):
+        logger.error(f"[backfill] Error en la etapa {stage} del video {video['video_id']}: {error}")
+        await self._checkpoint(video["video_id"], "failed", error=f"{stage}: {error}")
+
+    async def _list_uploads(self, playlist_id):
+        """
+        Registra cada página de la playlist y encola los videos pendientes:
+        los que ya tienen el wordcount guardado pasan directamente a sentimiento.
+        """
+        async def enqueue(page):
+            await run_io(add_backfill_videos, self.channel_id, page)
+            states = await run_io(get_backfill_videos, self.channel_id, [video_id for video_id, _ in page])
+            todo = [
+                video_id for video_id, _ in page
+                if needs_work(states[video_id], self.retry_failed, self.max_attempts)
+            ]
+            self.stats.listed += len(page)
+            self.stats.already_done += sum(1 for state in states.values() if state["status"] == "done")
+            if self.limit is not None:
+                todo = todo[:max(self.limit - self.stats.queued, 0)]
+            self.stats.queued += len(todo)
+
+            metadata = await fetch_videos_metadata(todo)
+            for video_id in todo:
+                video = {
+                    "video_id": video_id,
+                    "title": metadata.get(video_id, {}).get("snippet", {}).get("title", ""),
+                }
+                if states[video_id]["stage"] == "text":
+                    await self.sentiment_queue.put(video)
+                else:
+                    await self.transcript_queue.put(video)
+
+        page = []
+        async for item in iter_playlist_items(playlist_id, page_size=VIDEOS_BATCH_SIZE):
+            details = item["contentDetails"]
+            page.append((details["videoId"], details.get("videoPublishedAt")))
+            if len(page) == VIDEOS_BATCH_SIZE:
+                await enqueue(page)
+                page = []
+                if self.limit is not None and self.stats.queued >= self.limit:
+                    break
+        if page:
+            await enqueue(page)
+        self.stats.listing = False
+
+    async def _transcript_worker(self):
+        while True:
+            video = await self.transcript_queue.get()
+            try:
+                url = f"https://www.youtube.com/watch?v={video['video_id']}"
+                transcription = await run_io(obtener_transcripcion_youtube, url)
+                if transcription:
+                    await self.text_queue.put(dict(video, transcription=transcription))
+                else:
+                    await self._checkpoint(video["video_id"], "skipped", stage="transcript")
+            except Exception as e:
+                await self._fail(video, "transcript", str(e))
+            finally:
+                self.transcript_queue.task_done()
+
+    async def _text_worker(self):
+        while True:
+            video = await self.text_queue.get()
+            try:
+                wordcount, brands, total_palabras = await run_io(analizar_transcripcion, video.pop("transcription"))
+                saved = await run_io(
+                    insert_video_wordcount,
+                    video_id=video["video_id"],
+                    channel_id=self.channel_id,
+                    channel_name=self.channel_name,
+                    video_title=video["title"],
+                    wordcount=wordcount,
+                    total_palabras=total_palabras,
+                )
+                if not saved:
+                    raise RuntimeError("no se pudo guardar el wordcount")
+                if not await run_io(save_video_brands, video["video_id"], brands):
+                    raise RuntimeError("no se pudieron guardar las marcas")
+                # Solo se avanza el checkpoint con el wordcount y las marcas guardados
+                await self._checkpoint(video["video_id"], "pending", stage="text")
+                await self.sentiment_queue.put(video)
+            except Exception as e:
+                await self._fail(video, "text", str(e))
+            finally:
+                self.text_queue.task_done()
+
+    async def _sentiment_worker(self):
+        while True:
+            # Se agrupan los videos disponibles para puntuar sus comentarios juntos
+            batch = [await self.sentiment_queue.get()]
+            while len(batch) < self.sentiment_batch and not self.sentiment_queue.empty():
+                batch.append(self.sentiment_queue.get_nowait())
+            try:
+                video_ids = [video["video_id"] for video in batch]
+                comments = await fetch_comments_by_video(video_ids, max_comments=self.max_comments)
+                analyzed = await run_background_inference(analyze_comments_by_video, comments)
+                for video_id in video_ids:
+                    scored = analyzed.get(video_id, [])
+                    average_stars = round(sum(c["stars"] for c in scored) / len(scored), 2) if scored else None
+                    await self._checkpoint(video_id, "done", stage="sentiment", average_stars=average_stars)
+            except Exception as e:
+                for video in batch:
+                    await self._fail(video, "sentiment", str(e))
+            finally:
+                for _ in batch:
+                    self.sentiment_queue.task_done()
+
+    async def _report(self, report, every):
+        while True:
+            await asyncio.sleep(every)
+            report(self.stats.line())
+
+    async def run(self, report=print, report_every=10):
+        """
+        Ejecuta el backfill y devuelve el resumen del checkpoint del canal.
+        Las peticiones a la API gastan cuota con prioridad baja, así que el
+        backfill cede el paso a los análisis interactivos.
+        """
+        with quota_priority(BACKGROUND):
+            return await self._run(report, report_every)
+
+    async def _run(self, report, report_every):
+        self.channel_id, channel = await fetch_channel_info(self.channel_url)
+        self.channel_name = channel["snippet"]["title"]
+        video_count = channel.get("statistics", {}).get("videoCount")
+        if video_count is not None:
+            self.stats.expected = int(video_count)
+        playlist_id = channel["contentDetails"]["relatedPlaylists"]["uploads"]
+        report(f"Backfill de {self.channel_name} ({self.channel_id})")
+
+        # Colas acotadas: la playlist no avanza más rápido de lo que se procesa
+        self.transcript_queue = asyncio.Queue(maxsize=self.transcript_workers * 2)
+        self.text_queue = asyncio.Queue(maxsize=self.text_workers * 2)
+        self.sentiment_queue = asyncio.Queue(maxsize=self.sentiment_workers * self.sentiment_batch * 2)
+
+        workers = (
+            [asyncio.create_task(self._transcript_worker()) for _ in range(self.transcript_workers)]
+            + [asyncio.create_task(self._text_worker()) for _ in range(self.text_workers)]
+            + [asyncio.create_task(self._sentiment_worker()) for _ in range(self.sentiment_workers)]
+            + [asyncio.create_task(self._report(report, report_every))]
+        )
+        try:
+            await self._list_uploads(playlist_id)
+            # Cada etapa termina cuando la anterior ya no puede encolar más
+            await self.transcript_queue.join()
+            await self.text_queue.join()
+            await self.sentiment_queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        report(self.stats.line())
+        return {
+            "channel_id": self.channel_id,
+            "channel_title": self.channel_name,
+            "listed": self.stats.listed,
+            "run": dict(self.stats.outcomes),
+            "checkpoint": await run_io(get_backfill_summary, self.channel_id),
+        }
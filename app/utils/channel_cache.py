@@ -0,0 +1,86 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+from app.database.database_service import get_channel_id_for_handle, save_channel_handle
+
+# Handles resueltos que se mantienen en memoria por proceso
+CHANNEL_CACHE_SIZE = int(os.getenv("CHANNEL_CACHE_SIZE", "1024"))
+
+# Un channelId de YouTube: "UC" seguido de 22 caracteres
+CHANNEL_ID_RE = re.compile(r"^UC[\w-]{22}$")
+
+
+def channel_handle(channel_url):
+    """
+    Extrae el handle (último segmento de la ruta) de la URL de un canal.
+    """
+    path = urlparse(channel_url.strip()).path if "://" in channel_url else channel_url.strip()
+    segments = [segment for segment in unquote(path).split("/") if segment]
+    return segments[-1] if segments else ""
+
+
+def normalize_handle(channel_url):
+    """
+    Clave de caché del canal: el handle sin "@" y en minúsculas
+    ("https://www.youtube.com/@Perfumista/" -> "perfumista").
+    """
+    return channel_handle(channel_url).lstrip("@").lower()
+
+
+def channel_id_from_url(channel_url):
+    """
+    Devuelve el channelId si la URL ya lo contiene (/channel/UC...).
+    """
+    handle = channel_handle(channel_url)
+    return handle if CHANNEL_ID_RE.match(handle) else None
+
+
+class ChannelIdCache:
+    """
+    Caché handle -> channelId en dos niveles: LRU en memoria y tabla
+    `channel_handles` en Postgres. La relación apenas cambia, así que no
+    caduca; se sobrescribe si un análisis resuelve otro channelId.
+    """
+
+    def __init__(self, max_size=CHANNEL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _set_local(self, key, channel_id):
+        with self._lock:
+            self._entries[key] = channel_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, channel_url):
+        """
+        Devuelve el channelId del canal o None si nunca se ha resuelto.
+        """
+        key = normalize_handle(channel_url)
+        if not key:
+            return None
+        with self._lock:
+            channel_id = self._entries.get(key)
+            if channel_id is not None:
+                self._entries.move_to_end(key)
+                return channel_id
+
+        channel_id = get_channel_id_for_handle(key)
+        if channel_id is not None:
+            self._set_local(key, channel_id)
+        return channel_id
+
+    def set(self, channel_url, channel_id, source):
+        key = normalize_handle(channel_url)
+        if not key:
+            return
+        self._set_local(key, channel_id)
+        save_channel_handle(key, channel_id, source)
+
+
+channel_id_cache = ChannelIdCache()
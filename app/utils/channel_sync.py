@@ -0,0 +1,145 @@
+import os
+import asyncio
+import logging
+
+from app.utils.executors import run_io, run_background_inference
+from app.utils.analysis_jobs import job_stage
+from app.utils.audio_processing import procesar_video
+from app.utils.youtube_api import fetch_channel_info, iter_playlist_items, fetch_videos_metadata
+from app.database.database_service import (
+    insert_video_wordcount,
+    get_existing_video_ids,
+    get_channel_sync_state,
+    save_channel_sync_state
+)
+
+logger = logging.getLogger(__name__)
+
+# Videos procesados a la vez durante una sincronización
+SYNC_MAX_PARALLEL = int(os.getenv("SYNC_MAX_PARALLEL", "2"))
+# Videos recientes que se revisan en la primera sincronización de un canal
+# (las subidas anteriores quedan fuera de la sincronización incremental)
+SYNC_MAX_VIDEOS = int(os.getenv("SYNC_MAX_VIDEOS", "50"))
+
+
+async def list_new_uploads(playlist_id, last_published_at=None, max_videos=SYNC_MAX_VIDEOS):
+    """
+    Lista las subidas más recientes que la marca de agua. Sin marca de agua
+    devuelve las `max_videos` más recientes.
+
+    Returns:
+        list: [(video_id, published_at)] de más reciente a más antiguo
+    """
+    uploads = []
+    async for item in iter_playlist_items(playlist_id):
+        details = item["contentDetails"]
+        published_at = details.get("videoPublishedAt")
+        # Las fechas RFC 3339 de la API se comparan como texto
+        if last_published_at and published_at and published_at <= last_published_at:
+            break
+        uploads.append((details["videoId"], published_at))
+        if not last_published_at and len(uploads) >= max_videos:
+            break
+    return uploads
+
+
+def next_high_water_mark(uploads, failed, previous):
+    """
+    Nueva marca de agua: la subida más reciente tal que todas las anteriores
+    a ella están procesadas. Si falla un video, la marca no lo sobrepasa para
+    que la siguiente sincronización lo vuelva a intentar.
+
+    Returns:
+        tuple: (published_at, video_id) o `previous` si no puede avanzar
+    """
+    mark = previous
+    for video_id, published_at in reversed(uploads):  # de más antiguo a más reciente
+        if video_id in failed or not published_at:
+            break
+        mark = (published_at, video_id)
+    return mark
+
+
+async def _process_video(video_id, title, channel_id, channel_name, semaphore):
+    """
+    Procesa un video nuevo y guarda su wordcount.
+
+    Returns:
+        str: "processed", "skipped" (sin transcripción) o "failed"
+    """
+    async with semaphore:
+        try:
+            # Solo la falta de transcripción se salta; cualquier otro error es un fallo
+            processed = await run_background_inference(
+                procesar_video, f"https://www.youtube.com/watch?v={video_id}", raise_errors=True
+            )
+            if not processed:
+                return "skipped"
+            saved = await run_io(
+                insert_video_wordcount,
+                video_id=video_id,
+                channel_id=channel_id,
+                channel_name=channel_name,
+                video_title=title,
+                wordcount=processed.get("wordcount", []),
+                total_palabras=processed.get("total_palabras", 0),
+            )
+            if not saved:
+                raise RuntimeError("no se pudo guardar el wordcount")
+            return "processed"
+        except Exception as e:
+            logger.error(f"Error al sincronizar el video {video_id}: {str(e)}")
+            return "failed"
+
+
+async def sync_channel(channel_url, progress=None, max_parallel=SYNC_MAX_PARALLEL):
+    """
+    Sincronización incremental de un canal: recorre la playlist de subidas
+    hasta la marca de agua guardada, descarta los videos que ya están en la
+    tabla videos y procesa los demás con un paralelismo máximo de
+    `max_parallel`. El coste es proporcional a las subidas nuevas.
+    """
+    async with job_stage(progress, "channel"):
+        channel_id, channel = await fetch_channel_info(channel_url)
+        channel_name = channel["snippet"]["title"]
+        uploads_playlist_id = channel["contentDetails"]["relatedPlaylists"]["uploads"]
+        state = await run_io(get_channel_sync_state, channel_id)
+        previous = (state["last_published_at"], state["last_video_id"]) if state else None
+
+    async with job_stage(progress, "playlist"):
+        uploads = await list_new_uploads(uploads_playlist_id, previous[0] if previous else None)
+
+    async with job_stage(progress, "diff"):
+        existing = await run_io(get_existing_video_ids, [video_id for video_id, _ in uploads])
+        new_ids = [video_id for video_id, _ in uploads if video_id not in existing]
+        metadata = await fetch_videos_metadata(new_ids)
+
+    async with job_stage(progress, "processing"):
+        semaphore = asyncio.Semaphore(max_parallel)
+        outcomes = await asyncio.gather(*(
+            _process_video(
+                video_id,
+                metadata.get(video_id, {}).get("snippet", {}).get("title", ""),
+                channel_id,
+                channel_name,
+                semaphore
+            )
+            for video_id in new_ids
+        ))
+        results = dict(zip(new_ids, outcomes))
+
+        failed = {video_id for video_id, outcome in results.items() if outcome == "failed"}
+        mark = next_high_water_mark(uploads, failed, previous)
+        if mark and mark != previous:
+            await run_io(save_channel_sync_state, channel_id, mark[0], mark[1])
+
+    return {
+        "channel_id": channel_id,
+        "channel_title": channel_name,
+        "checked": len(uploads),
+        "already_stored": len(existing),
+        "processed": [video_id for video_id, outcome in results.items() if outcome == "processed"],
+        "skipped": [video_id for video_id, outcome in results.items() if outcome == "skipped"],
+        "failed": sorted(failed),
+        "high_water_mark": {"published_at": mark[0], "video_id": mark[1]} if mark else None,
+    }
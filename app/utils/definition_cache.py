@@ -0,0 +1,91 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from app.database.database_service import (
+    get_cached_definition,
+    save_cached_definition,
+    delete_cached_definition
+)
+
+# Entradas en memoria por proceso y segundos que se mantienen antes de volver
+# a consultar Postgres (así otros workers ven las invalidaciones)
+DEFINITION_CACHE_SIZE = int(os.getenv("DEFINITION_CACHE_SIZE", "1024"))
+DEFINITION_CACHE_TTL = int(os.getenv("DEFINITION_CACHE_TTL", "300"))
+
+
+def normalize_term(term):
+    """
+    Normaliza un término para usarlo como clave: minúsculas, sin acentos y
+    con espacios colapsados ("Fougère " -> "fougere").
+    """
+    term = unicodedata.normalize("NFKD", term.strip().lower())
+    term = "".join(c for c in term if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", term)
+
+
+class DefinitionCache:
+    """
+    Caché de definiciones en dos niveles: LRU en memoria y tabla
+    `definition_cache` en Postgres.
+    """
+
+    def __init__(self, max_size=DEFINITION_CACHE_SIZE, ttl=DEFINITION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            definition, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return definition
+
+    def _set_local(self, key, definition):
+        with self._lock:
+            self._entries[key] = (definition, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, term):
+        """
+        Devuelve la definición guardada para el término o None.
+        """
+        key = normalize_term(term)
+        definition = self._get_local(key)
+        if definition is not None:
+            return definition
+
+        definition = get_cached_definition(key)
+        if definition is not None:
+            self._set_local(key, definition)
+        return definition
+
+    def set(self, term, definition):
+        key = normalize_term(term)
+        self._set_local(key, definition)
+        save_cached_definition(key, term, definition)
+
+    def invalidate_definition(self, definition):
+        """
+        Elimina las entradas cuyo texto es `definition`, para que se regeneren
+        en la siguiente consulta.
+        """
+        with self._lock:
+            for key in [k for k, (d, _) in self._entries.items() if d == definition]:
+                del self._entries[key]
+        return delete_cached_definition(definition)
+
+
+definition_cache = DefinitionCache()
@@ -0,0 +1,146 @@
+import os
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Hilos para E/S bloqueante (requests, psycopg2)
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+# Inferencias simultáneas y máximo de tareas en espera o ejecución antes de responder 503
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "30"))
+
+
+class ExecutorBusy(Exception):
+    """
+    El pool ha alcanzado su máximo de tareas pendientes. Se traduce en una
+    respuesta 503 con cabecera Retry-After.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"El pool '{name}' está saturado, inténtalo más tarde")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """
+    Hueco reservado en un BoundedExecutor. `release` puede llamarse varias
+    veces (desde el generador y al cerrar la respuesta): solo libera una.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.pool.release()
+
+
+class BoundedExecutor:
+    """
+    Pool de hilos con un límite de tareas pendientes (en cola o en ejecución).
+    `run` ejecuta una función bloqueante sin bloquear el event loop y lanza
+    ExecutorBusy si el pool está lleno en lugar de encolar sin límite.
+    """
+
+    def __init__(self, name, max_workers, max_pending=0, retry_after=INFERENCE_RETRY_AFTER):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def acquire(self):
+        """
+        Reserva un hueco en el pool o lanza ExecutorBusy.
+        """
+        with self._lock:
+            if self.max_pending and self._pending >= self.max_pending:
+                raise ExecutorBusy(self.name, self.retry_after)
+            self._pending += 1
+
+    def release(self, *_):
+        with self._lock:
+            self._pending -= 1
+
+    def reserve(self):
+        """
+        Reserva un hueco (o lanza ExecutorBusy) y devuelve su Reservation,
+        para trabajo cuyo fin no coincide con un bloque: respuestas en streaming.
+        """
+        self.acquire()
+        return Reservation(self)
+
+    @contextmanager
+    def slot(self):
+        """
+        Reserva un hueco durante el bloque, para trabajo que se ejecuta en el
+        pool por otra vía (lotes del MicroBatchScheduler).
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, fn, *args, **kwargs):
+        self.acquire()
+        try:
+            future = self.executor.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self.release()
+            raise
+        # El hueco se libera cuando termina el hilo, aunque el cliente cancele la petición
+        future.add_done_callback(self.release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+io_pool = BoundedExecutor("io", IO_POOL_SIZE)
+inference_pool = BoundedExecutor("inference", INFERENCE_CONCURRENCY, max_pending=INFERENCE_QUEUE_SIZE)
+
+
+async def run_io(fn, *args, **kwargs):
+    """
+    Ejecuta E/S bloqueante (HTTP, base de datos) en el pool de E/S.
+    """
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_inference(fn, *args, **kwargs):
+    """
+    Ejecuta trabajo de inferencia en el pool acotado de inferencia.
+    """
+    return await inference_pool.run(fn, *args, **kwargs)
+
+
+async def run_background_inference(fn, *args, **kwargs):
+    """
+    Como run_inference, pero para trabajo en segundo plano: si el pool está
+    lleno espera y reintenta en lugar de fallar.
+    """
+    while True:
+        try:
+            return await inference_pool.run(fn, *args, **kwargs)
+        except ExecutorBusy as e:
+            await asyncio.sleep(e.retry_after)
+
+
+def shutdown_executors():
+    io_pool.shutdown()
+    inference_pool.shutdown()
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Caché en disco de respuestas JSON, con un TTL por endpoint.
+
+    Mientras una entrada está vigente se sirve sin hacer ninguna petición. Una
+    entrada caducada con ETag se revalida con If-None-Match: si la API
+    responde 304 se renueva sin volver a descargar el cuerpo. Se eliminan las
+    entradas que llevan más de `max_age` segundos sin renovarse y, si la caché
+    ocupa más de `max_bytes`, las más antiguas.
+
+    El tamaño y la antigüedad de las entradas se llevan en memoria: el
+    directorio se recorre una sola vez, la primera vez que se guarda algo.
+    Los métodos hacen I/O de disco bloqueante; desde código asíncrono se
+    llaman con run_io.
+    """
+
+    def __init__(self, directory, ttls, default_ttl=0, max_age=7 * 24 * 3600,
+                 max_bytes=None, prune_every=500):
+        self.directory = directory
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._stores = 0
+        # Ruta -> (guardada en, bytes), de la más antigua a la más reciente
+        self._entries = None
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0}
+
+    def ttl_for(self, endpoint):
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def _key(self, endpoint, params):
+        # La API key no forma parte de la clave
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k != "key")
+        raw = json.dumps([endpoint, items], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def lookup(self, endpoint, params):
+        """
+        Devuelve (entrada, vigente). La entrada es None si no hay nada
+        guardado; si no está vigente puede usarse su ETag para revalidar.
+        """
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0:
+            return None, False
+        path = self._path(self._key(endpoint, params))
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None, False
+
+        fresh = time.time() - entry["stored_at"] < ttl
+        if fresh:
+            self._count("hits")
+        elif not entry.get("etag"):
+            self._count("misses")
+            return None, False
+        return entry, fresh
+
+    def _load_entries(self):
+        """
+        Recorre el directorio una vez para conocer las entradas ya guardadas.
+        Se llama con el lock tomado.
+        """
+        if self._entries is not None:
+            return
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                found.append((info.st_mtime, path, info.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, (mtime, size)) for mtime, path, size in found)
+        self._size = sum(size for _, _, size in found)
+
+    def _write(self, endpoint, params, body, etag):
+        path = self._path(self._key(endpoint, params))
+        entry = {"endpoint": endpoint, "etag": etag, "stored_at": time.time(), "body": body}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la respuesta en caché: {e}")
+            return
+
+        with self._lock:
+            self._load_entries()
+            _, previous = self._entries.pop(path, (None, 0))
+            self._entries[path] = (entry["stored_at"], len(data))
+            self._size += len(data) - previous
+            self._stores += 1
+            prune = (
+                self._stores % self.prune_every == 0
+                or (self.max_bytes is not None and self._size > self.max_bytes)
+            )
+        if prune:
+            self.prune()
+
+    def store(self, endpoint, params, body, etag=None):
+        if self.ttl_for(endpoint) <= 0:
+            return
+        self._write(endpoint, params, body, etag)
+        self._count("stored")
+
+    def miss(self):
+        """
+        Una entrada caducada no se pudo revalidar y se ha descargado de nuevo.
+        """
+        self._count("misses")
+
+    def revalidated(self, endpoint, params, entry):
+        """
+        La API ha respondido 304: la entrada vuelve a estar vigente.
+        """
+        self._count("revalidated")
+        self._write(endpoint, params, entry["body"], entry.get("etag"))
+
+    def prune(self):
+        """
+        Elimina las entradas que llevan más de `max_age` segundos sin guardarse
+        y, mientras la caché supere `max_bytes`, las más antiguas.
+        """
+        limit = time.time() - self.max_age
+        expired = []
+        with self._lock:
+            self._load_entries()
+            while self._entries:
+                path, (stored_at, size) = next(iter(self._entries.items()))
+                over_size = self.max_bytes is not None and self._size > self.max_bytes
+                if stored_at >= limit and not over_size:
+                    break
+                self._entries.popitem(last=False)
+                self._size -= size
+                expired.append(path)
+        removed = 0
+        for path in expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Caché de respuestas: {removed} entradas antiguas eliminadas")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            if self._entries is not None:
+                stats["entries"] = len(self._entries)
+                stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"] + stats["revalidated"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else None
+        return stats
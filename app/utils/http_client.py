@@ -0,0 +1,94 @@
+import os
+import random
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Conexiones del pool, peticiones simultáneas y reintentos
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+
+# Respuestas que se reintentan
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt, base=HTTP_BACKOFF_BASE):
+    """
+    Espera antes del reintento `attempt` (0, 1, ...): backoff exponencial con
+    jitter completo, para que los clientes no reintenten a la vez.
+    """
+    return random.uniform(0, base * 2 ** attempt)
+
+
+class AsyncHTTPClient:
+    """
+    Cliente HTTP asíncrono con conexiones keep-alive reutilizadas, un límite
+    de peticiones simultáneas y reintentos con backoff exponencial y jitter
+    ante errores de red, 429 y 5xx.
+
+    El cliente httpx se crea con la primera petición de cada event loop.
+    `base_url` permite apuntarlo a un servidor local en pruebas.
+    """
+
+    def __init__(self, base_url="", max_connections=HTTP_MAX_CONNECTIONS,
+                 max_concurrency=HTTP_MAX_CONCURRENCY, max_retries=HTTP_MAX_RETRIES,
+                 backoff_base=HTTP_BACKOFF_BASE, timeout=HTTP_TIMEOUT, transport=None):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.transport = transport
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def request(self, method, url, **kwargs):
+        """
+        Envía la petición con reintentos. Devuelve la última respuesta (aunque
+        sea un error no reintentable) o relanza el último error de red.
+        """
+        client = self._ensure_client()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                logger.warning(f"{method} {url}: {response.status_code}, reintento {attempt + 1}")
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{method} {url}: {e!r}, reintento {attempt + 1}")
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base))
+
+    async def get(self, url, params=None, **kwargs):
+        return await self.request("GET", url, params=params, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
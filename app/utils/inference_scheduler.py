@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchScheduler:
+    """
+    Agrupa peticiones concurrentes en lotes para ejecutar una sola inferencia.
+
+    Cada petición se encola con `submit`. Un worker recoge las peticiones que
+    llegan durante `max_wait_ms` (hasta `max_batch_size`), ejecuta `batch_fn`
+    con todas ellas fuera del event loop y devuelve a cada petición su
+    resultado. Mientras se ejecuta un lote, las nuevas peticiones se acumulan
+    para el siguiente.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=50, name="scheduler", executor=None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        """
+        Encola un elemento y espera el resultado de su lote.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Descartar peticiones cuyo cliente ya se ha ido
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            logger.info(f"[{self.name}] Ejecutando lote de {len(items)} peticiones")
+            try:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+            except Exception as e:
+                logger.error(f"[{self.name}] Error en el lote: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+logger = logging.getLogger(__name__)
+
+# Modelos usados en la aplicación
+QWEN_CHAT_MODEL = "Qwen/Qwen2-1.5B-Instruct"
+SQL_MODEL = "abdulmannan-01/qwen-2.5-3b-finetuned-for-sql-generation"
+SENTIMENT_MODEL = "nlptown/bert-base-multilingual-uncased-sentiment"
+
+DEVICE = "cpu"
+
+# Presupuesto de memoria para modelos cargados (en GB). 0 desactiva el límite.
+MODEL_MEMORY_BUDGET_GB = float(os.getenv("MODEL_MEMORY_BUDGET_GB", "0"))
+
+# Modos de precisión: float32, bfloat16 o int8 (cuantización dinámica de las
+# capas Linear sobre pesos float32)
+DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "int8": torch.float32,
+}
+
+# Precisión de cada modelo, configurable por variable de entorno
+MODEL_PRECISIONS = {
+    QWEN_CHAT_MODEL: os.getenv("QWEN_PRECISION", "float32"),
+    SQL_MODEL: os.getenv("SQL_MODEL_PRECISION", "float32"),
+    SENTIMENT_MODEL: os.getenv("SENTIMENT_PRECISION", "float32"),
+}
+
+
+def precision_for(name):
+    """
+    Devuelve el modo de precisión configurado para un modelo.
+    """
+    precision = MODEL_PRECISIONS.get(name, "float32")
+    if precision not in DTYPES:
+        raise ValueError(f"Precisión no soportada para {name}: {precision}")
+    return precision
+
+
+def _quantize_dynamic(model):
+    """
+    Cuantiza dinámicamente a int8 las capas Linear del modelo. Se hace en el
+    sitio para no tener a la vez en memoria una copia float del modelo.
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _load_causal_lm(name, dtype):
+    """
+    Carga un modelo causal y su tokenizer en CPU.
+    """
+    model = AutoModelForCausalLM.from_pretrained(
+        name,
+        torch_dtype=DTYPES[dtype],
+        low_cpu_mem_usage=True,
+        trust_remote_code=True,
+        device_map=None
+    ).to(DEVICE)
+    model.eval()
+    if dtype == "int8":
+        model = _quantize_dynamic(model)
+
+    tokenizer = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+        model.config.pad_token_id = model.config.eos_token_id
+
+    return model, tokenizer
+
+
+def _load_sentiment(name, dtype):
+    """
+    Carga un pipeline de análisis de sentimiento. Devuelve el pipeline como
+    modelo y su tokenizer.
+    """
+    sentiment_pipeline = pipeline(
+        "sentiment-analysis",
+        model=name,
+        framework="pt",
+        device=-1,
+        torch_dtype=DTYPES[dtype]
+    )
+    if dtype == "int8":
+        sentiment_pipeline.model = _quantize_dynamic(sentiment_pipeline.model)
+    return sentiment_pipeline, sentiment_pipeline.tokenizer
+
+
+LOADERS = {
+    "causal_lm": _load_causal_lm,
+    "sentiment": _load_sentiment,
+}
+
+
+def _estimate_size(model):
+    """
+    Estima los bytes ocupados por los pesos del modelo. Se usa el state_dict
+    para contar también los pesos empaquetados de las capas cuantizadas.
+    """
+    module = getattr(model, "model", model)  # Los pipelines envuelven el modelo
+    try:
+        values = list(module.state_dict().values())
+    except AttributeError:
+        return 0
+
+    total = 0
+    while values:
+        value = values.pop()
+        if isinstance(value, (tuple, list)):
+            values.extend(value)
+        elif isinstance(value, torch.Tensor):
+            total += value.numel() * value.element_size()
+    return total
+
+
+class ModelHandle:
+    """
+    Referencia compartida a un modelo cargado y su tokenizer.
+    """
+
+    def __init__(self, key, kind, model, tokenizer, size_bytes):
+        self.key = key
+        self.kind = kind
+        self.model = model
+        self.tokenizer = tokenizer
+        self.size_bytes = size_bytes
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def name(self):
+        return self.key[0]
+
+    @property
+    def dtype(self):
+        return self.key[1]
+
+
+class ModelRegistry:
+    """
+    Registro único de modelos para todo el proceso.
+
+    Los modelos se identifican por (nombre, dtype), se cargan bajo demanda
+    y se comparten entre todos los módulos. Cuando se supera el presupuesto
+    de memoria se descargan los modelos menos usados recientemente que no
+    tengan referencias activas.
+    """
+
+    def __init__(self, memory_budget_bytes=0):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._handles = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def _get_load_lock(self, key):
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def acquire(self, name, dtype=None, kind="causal_lm"):
+        """
+        Devuelve un handle del modelo incrementando su contador de referencias.
+        Carga el modelo si todavía no está en memoria. Si no se indica dtype se
+        usa la precisión configurada para el modelo.
+        """
+        dtype = dtype or precision_for(name)
+        key = (name, dtype)
+        with self._get_load_lock(key):
+            with self._lock:
+                handle = self._handles.get(key)
+                if handle is not None:
+                    handle.refcount += 1
+                    handle.last_used = time.monotonic()
+                    self._handles.move_to_end(key)
+                    return handle
+
+            logger.info(f"Cargando modelo {name} ({dtype})...")
+            start = time.monotonic()
+            model, tokenizer = LOADERS[kind](name, dtype)
+            handle = ModelHandle(key, kind, model, tokenizer, _estimate_size(model))
+            logger.info(
+                f"Modelo {name} cargado en {time.monotonic() - start:.1f}s "
+                f"({handle.size_bytes / 1024 ** 3:.2f} GB)"
+            )
+
+            with self._lock:
+                handle.refcount = 1
+                self._handles[key] = handle
+                self._evict_if_needed()
+            return handle
+
+    def release(self, handle):
+        """
+        Libera una referencia obtenida con `acquire`.
+        """
+        with self._lock:
+            handle.refcount = max(0, handle.refcount - 1)
+            handle.last_used = time.monotonic()
+            if handle.key in self._handles:
+                self._handles.move_to_end(handle.key)
+            self._evict_if_needed()
+
+    @contextmanager
+    def use(self, name, dtype=None, kind="causal_lm"):
+        """
+        Context manager que adquiere y libera un handle del modelo.
+        """
+        handle = self.acquire(name, dtype, kind)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def preload(self, name, dtype=None, kind="causal_lm"):
+        """
+        Carga el modelo sin retener ninguna referencia.
+        """
+        self.release(self.acquire(name, dtype, kind))
+
+    def is_loaded(self, name, dtype=None):
+        dtype = dtype or precision_for(name)
+        with self._lock:
+            return (name, dtype) in self._handles
+
+    def unload(self, name, dtype=None):
+        """
+        Descarga un modelo si no tiene referencias activas.
+        """
+        dtype = dtype or precision_for(name)
+        with self._lock:
+            handle = self._handles.get((name, dtype))
+            if handle is None or handle.refcount > 0:
+                return False
+            del self._handles[(name, dtype)]
+        logger.info(f"Modelo {name} ({dtype}) descargado")
+        return True
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(h.size_bytes for h in self._handles.values())
+
+    def stats(self):
+        """
+        Devuelve el estado de los modelos cargados.
+        """
+        with self._lock:
+            return [
+                {
+                    "name": h.name,
+                    "dtype": h.dtype,
+                    "kind": h.kind,
+                    "size_mb": round(h.size_bytes / 1024 ** 2, 1),
+                    "refcount": h.refcount,
+                }
+                for h in self._handles.values()
+            ]
+
+    def _evict_if_needed(self):
+        # Debe llamarse con self._lock adquirido
+        if not self.memory_budget_bytes:
+            return
+        total = sum(h.size_bytes for h in self._handles.values())
+        for key in list(self._handles):
+            if total <= self.memory_budget_bytes:
+                break
+            handle = self._handles[key]
+            if handle.refcount > 0:
+                continue
+            del self._handles[key]
+            total -= handle.size_bytes
+            logger.info(f"Modelo {handle.name} ({handle.dtype}) descargado por presupuesto de memoria")
+
+
+model_registry = ModelRegistry(memory_budget_bytes=int(MODEL_MEMORY_BUDGET_GB * 1024 ** 3))
@@ -0,0 +1,194 @@
+"""
+Servidor de modelos fuera de proceso.
+
+Con `uvicorn --workers N` cada worker cargaría su propia copia de los modelos.
+Este módulo permite cargarlos una sola vez en un proceso aparte al que los
+workers de la API llaman a través de un socket Unix:
+
+    python -m app.utils.model_server
+
+y arrancar la API con MODEL_SERVER_SOCKET apuntando al mismo socket. Las
+funciones decoradas con `served` (generación, sentimiento, transcripción) se
+ejecutan entonces en el servidor; sin MODEL_SERVER_SOCKET se ejecutan en el
+propio proceso como hasta ahora.
+"""
+import os
+import sys
+import pickle
+import functools
+import importlib
+import logging
+import threading
+from multiprocessing.managers import BaseManager
+
+logger = logging.getLogger(__name__)
+
+# Socket Unix del servidor de modelos. Vacío: los modelos se cargan en cada proceso
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "")
+# Clave compartida entre el servidor y los workers (obligatoria si hay servidor)
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()
+
+# Módulos que registran operaciones con `served`; el servidor los importa al arrancar
+OPERATION_MODULES = [
+    "app.utils.search_llm",
+    "app.utils.query_llm",
+    "app.utils.audio_processing",
+    "app.utils.sentiment_analysis",
+    "app.utils.transcription",
+]
+
+_operations = {}
+# True dentro del proceso servidor: las operaciones se ejecutan siempre en local
+_serving = False
+
+
+def served(name):
+    """
+    Registra una función como operación del servidor de modelos. Si hay un
+    servidor configurado, la llamada se envía a él; si no, se ejecuta aquí.
+    Los argumentos y el resultado deben poder serializarse con pickle.
+    """
+    def decorator(fn):
+        _operations[name] = fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if model_server_client.enabled:
+                return model_server_client.call(name, *args, **kwargs)
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ModelService:
+    """
+    Objeto expuesto por el servidor. Cada conexión se atiende en su propio
+    hilo; el registro de modelos es seguro entre hilos.
+    """
+
+    def call(self, name, args, kwargs):
+        if name not in _operations:
+            raise ValueError(f"Operación desconocida en el servidor de modelos: {name}")
+        try:
+            return _operations[name](*args, **kwargs)
+        except Exception as e:
+            # La excepción vuelve al cliente serializada; si no se puede, se envía como RuntimeError
+            try:
+                pickle.loads(pickle.dumps(e))
+            except Exception:
+                raise RuntimeError(f"{type(e).__name__}: {e}") from None
+            raise
+
+    def operations(self):
+        return sorted(_operations)
+
+    def stats(self):
+        from app.utils.model_registry import model_registry
+        from app.utils.startup import readiness
+        return {"registry": model_registry.stats(), "readiness": readiness()}
+
+
+_service = ModelService()
+
+
+def _get_service():
+    return _service
+
+
+class ModelServerManager(BaseManager):
+    pass
+
+
+ModelServerManager.register("service", callable=_get_service)
+
+
+class ModelServerClient:
+    """
+    Cliente del servidor de modelos. Mantiene un proxy por hilo y reconecta
+    una vez si el servidor se ha reiniciado.
+    """
+
+    def __init__(self, address=MODEL_SERVER_SOCKET, authkey=MODEL_SERVER_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        # Dentro del propio servidor las operaciones se ejecutan en local
+        return bool(self.address) and not _serving
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            if not self.authkey:
+                raise RuntimeError("MODEL_SERVER_AUTHKEY no está definida")
+            manager = ModelServerManager(address=self.address, authkey=self.authkey)
+            manager.connect()
+            service = manager.service()
+            self._local.service = service
+        return service
+
+    def _request(self, method, *args):
+        try:
+            return getattr(self._service(), method)(*args)
+        except (ConnectionError, EOFError, FileNotFoundError):
+            logger.warning("Conexión con el servidor de modelos perdida, reconectando...")
+            self._local.service = None
+            return getattr(self._service(), method)(*args)
+
+    def call(self, name, *args, **kwargs):
+        return self._request("call", name, args, kwargs)
+
+    def stats(self):
+        return self._request("stats")
+
+
+model_server_client = ModelServerClient()
+
+
+def serve(address=MODEL_SERVER_SOCKET or "/tmp/dashboard-models.sock"):
+    """
+    Carga los modelos y atiende peticiones en el socket indicado hasta que se
+    interrumpa el proceso.
+    """
+    if not MODEL_SERVER_AUTHKEY:
+        raise SystemExit("MODEL_SERVER_AUTHKEY es obligatoria para arrancar el servidor de modelos")
+
+    global _serving
+    _serving = True
+    for module in OPERATION_MODULES:
+        importlib.import_module(module)
+
+    from app.utils.startup import warm_up_models
+    warm_up_models()
+
+    if os.path.exists(address):
+        os.unlink(address)
+    manager = ModelServerManager(address=address, authkey=MODEL_SERVER_AUTHKEY)
+    # El socket se crea con permisos 0600: solo el usuario del servidor puede conectarse
+    previous_umask = os.umask(0o177)
+    try:
+        server = manager.get_server()
+    finally:
+        os.umask(previous_umask)
+    os.chmod(address, 0o600)
+    logger.info(f"Servidor de modelos escuchando en {address}: {', '.join(sorted(_operations))}")
+    try:
+        server.serve_forever()
+    finally:
+        if os.path.exists(address):
+            os.unlink(address)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    # Usar el módulo importado (no __main__) para compartir el registro de operaciones
+    from app.utils import model_server
+    model_server.serve(sys.argv[1] if len(sys.argv) > 1 else MODEL_SERVER_SOCKET or "/tmp/dashboard-models.sock")
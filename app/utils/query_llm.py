@@ -1,10 +1,14 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import psycopg2
+import json
 import logging
 import sys
 import torch
+from app.utils.model_registry import model_registry, SQL_MODEL, DEVICE
+from app.utils.sql_plan_cache import match_template, sql_plan_cache
+from app.utils.sql_executor import sql_executor, SQL_DEFAULT_PAGE_SIZE
+from app.utils.sql_guard import guard_query
+from app.utils.model_server import served
 
 # Enhanced logging configuration
 logging.basicConfig(
@@ -14,37 +18,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Device configuration
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Device configuration (the model registry places models on this device)
 logger.info(f"Using device: {DEVICE}")
 
-# Model configuration
-MODEL_NAME = "abdulmannan-01/qwen-2.5-3b-finetuned-for-sql-generation"  # Updated to your preferred model
-
-try:
-    model = AutoModelForCausalLM.from_pretrained(MODEL_NAME).to(DEVICE)
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    logger.info("Model and tokenizer loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading model: {str(e)}")
-    raise
-
-# Database configuration
-DATABASE_CONFIG = {
-    "dbname": "youtube_analysis",
-    "user": "toniamayaobrador",
-    "password": "Amaya992",
-    "host": "localhost",
-    "port": 5432
-}
+# Model configuration (loaded lazily through the shared model registry)
+MODEL_NAME = SQL_MODEL
 
 router = APIRouter()
 
 class QueryRequest(BaseModel):
     question: str
+    page: int = 1
+    page_size: int = SQL_DEFAULT_PAGE_SIZE
 
 ### Helper Functions ###
 
+@served("generate_sql")
 def generate_sql_from_question(question: str) -> dict:
     """
     Uses the Qwen model to convert a question into an SQL query.
@@ -61,24 +50,28 @@ def generate_sql_from_question(question: str) -> dict:
                                          f"Question: {question}"}
         ]
 
-        # Generar el texto del prompt
-        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        logger.debug(f"Prompt created: {prompt}")
-
-        # Tokenizar y generar la salida
-        inputs = tokenizer(prompt, return_tensors="pt").to(DEVICE)
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=80,
-            num_beams=4,
-            temperature=0.3,
-            top_p=0.9,
-            repetition_penalty=1.2,
-            early_stopping=True,
-        )
-
-        # Decodificar el texto generado
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+        with model_registry.use(MODEL_NAME) as handle:
+            model, tokenizer = handle.model, handle.tokenizer
+
+            # Generar el texto del prompt
+            prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            logger.debug(f"Prompt created: {prompt}")
+
+            # Tokenizar y generar la salida
+            inputs = tokenizer(prompt, return_tensors="pt").to(DEVICE)
+            with torch.inference_mode():
+                outputs = model.generate(
+                    **inputs,
+                    max_new_tokens=80,
+                    num_beams=4,
+                    temperature=0.3,
+                    top_p=0.9,
+                    repetition_penalty=1.2,
+                    early_stopping=True,
+                )
+
+            # Decodificar el texto generado
+            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
 
         # Filtrar solo la consulta SQL
         if "SQL:" in generated_text:
@@ -108,52 +101,117 @@ def sanitize_sql_query(sql_query: str) -> str:
         logger.error(f"Error in sanitize_sql_query: {str(e)}")
         raise HTTPException(status_code=500, detail="Error sanitizing SQL query")
 
-def execute_sql_query(sql_query: str):
+def execute_sql_query(sql_query: str, params=None, fetch_all: bool = False,
+                      page: int = 1, page_size: int = SQL_DEFAULT_PAGE_SIZE):
     """
-    Executes a sanitized SQL query in the PostgreSQL database.
+    Executes a sanitized SQL query on the read-only pool.
+    Returns the first column of the first row, or one page of the result
+    set (columns, rows, has_more) when `fetch_all` is True.
     """
-    try:
-        logger.info(f"Executing SQL query: {sql_query}")
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        result = cursor.fetchone()
-        conn.close()
-        final_result = result[0] if result else 0
-        logger.info(f"Query result: {final_result}")
-        return final_result
+    logger.info(f"Executing SQL query: {sql_query} with params {params}")
+    if fetch_all:
+        final_result = sql_executor.fetch_page(sql_query, params, page=page, page_size=page_size)
+    else:
+        final_result = sql_executor.fetch_scalar(sql_query, params)
+    logger.info(f"Query result: {final_result}")
+    return final_result
+
+def resolve_sql(question: str) -> dict:
+    """
+    Finds the SQL that answers a natural-language question, avoiding the model when possible:
 
-    except Exception as e:
-        logger.error(f"Error executing SQL: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error executing SQL query")
+    1. Common question shapes are answered by parameterized templates.
+    2. Questions already answered before reuse their validated SQL.
+    3. Anything else goes through the SQL model.
 
+    Cached and generated SQL pass through the EXPLAIN cost guard.
 
-### API Endpoint ###
+    Returns a dict with query, params, fetch_all and source.
+    """
+    match = match_template(question)
+    if match:
+        template, params = match
+        logger.info(f"Answering with template '{template.name}'")
+        return {"query": template.sql, "params": params, "fetch_all": template.fetch_all, "source": "template"}
+
+    cached_query = sql_plan_cache.get(question)
+    if cached_query:
+        logger.info("Answering with cached SQL plan")
+        # Re-checked because the estimates change as the tables grow
+        return {"query": guard_query(cached_query), "params": None, "fetch_all": True, "source": "cache"}
+
+    # Generar consulta SQL y prompt
+    sql_result = generate_sql_from_question(question)
+    logger.debug(f"Generated SQL result: {sql_result}")
+
+    # Sanear la consulta SQL
+    raw_query = sql_result.get("query")  # Extraer solo la consulta SQL
+    if not raw_query:
+        logger.error("No query found in sql_result")
+        raise ValueError("No SQL query generated.")
+
+    sanitized_query = sanitize_sql_query(raw_query)
+    logger.debug(f"Sanitized SQL query: {sanitized_query}")
+
+    # Reject or rewrite expensive queries before they run
+    guarded_query = guard_query(sanitized_query)
+    return {"query": guarded_query, "params": None, "fetch_all": True, "source": "model"}
+
+def answer_question(question: str, page: int = 1, page_size: int = SQL_DEFAULT_PAGE_SIZE) -> dict:
+    """
+    Answers a question with one page of results. Generated SQL is cached
+    only once it has executed without errors.
+    """
+    plan = resolve_sql(question)
+    results = execute_sql_query(plan["query"], plan["params"], plan["fetch_all"], page, page_size)
+    if plan["source"] == "model":
+        sql_plan_cache.set(question, plan["query"])
 
-@router.post("/api/query")
-async def query_llm(request: QueryRequest):
-    try:
-        logger.info(f"Received question: {request.question}")
+    if plan["fetch_all"]:
+        return {
+            "results": results["rows"],
+            "columns": results["columns"],
+            "page": results["page"],
+            "page_size": results["page_size"],
+            "has_more": results["has_more"],
+            "source": plan["source"],
+        }
+    return {"results": results, "source": plan["source"]}
 
-        # Generar consulta SQL y prompt
-        sql_result = generate_sql_from_question(request.question)
-        logger.debug(f"Generated SQL result: {sql_result}")
+def _stream_rows(question: str, plan: dict):
+    """
+    Yields every row of a resolved plan as a JSON line, read through a server-side cursor.
+    """
+    for row in sql_executor.iter_rows(plan["query"], plan["params"]):
+        yield json.dumps(row, default=str) + "\n"
+    if plan["source"] == "model":
+        sql_plan_cache.set(question, plan["query"])
 
-        # Sanear la consulta SQL
-        raw_query = sql_result.get("query")  # Extraer solo la consulta SQL
-        if not raw_query:
-            logger.error("No query found in sql_result")
-            raise ValueError("No SQL query generated.")
+def prepare_stream(question: str):
+    """
+    Resolves the SQL (and runs scalar queries) up front and returns an
+    iterator of JSON lines. Generation, guard and planning errors are raised
+    here, before any response is sent; only the row fetches are streamed.
+    """
+    plan = resolve_sql(question)
+    if not plan["fetch_all"]:
+        result = execute_sql_query(plan["query"], plan["params"])
+        return iter([json.dumps({"result": result}, default=str) + "\n"])
+    return _stream_rows(question, plan)
 
-        sanitized_query = sanitize_sql_query(raw_query)
-        logger.debug(f"Sanitized SQL query: {sanitized_query}")
 
-        # Ejecutar la consulta SQL saneada
-        results = execute_sql_query(sanitized_query)
-        logger.info(f"Final result from query execution: {results}")
+### API Endpoint ###
 
-        return {"results": results}
+@router.post("/api/query")
+async def query_llm(request: QueryRequest):
+    try:
+        logger.info(f"Received question: {request.question}")
+        answer = answer_question(request.question, request.page, request.page_size)
+        logger.info(f"Final result from query execution: {answer['results']}")
+        return answer
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in query process: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
@@ -0,0 +1,307 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from app.utils.executors import run_io
+
+# Cuota diaria del proyecto en la API de YouTube (unidades, compartida por todos los procesos)
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+# "postgres": bucket compartido en la tabla youtube_quota; "memory": bucket propio de cada proceso
+YOUTUBE_QUOTA_BACKEND = os.getenv("YOUTUBE_QUOTA_BACKEND", "postgres")
+# Unidades que pueden gastarse de golpe (capacidad del token bucket)
+YOUTUBE_QUOTA_BURST = int(os.getenv("YOUTUBE_QUOTA_BURST", "1000"))
+# Unidades del bucket que el trabajo en segundo plano no puede gastar
+YOUTUBE_QUOTA_RESERVE = int(os.getenv("YOUTUBE_QUOTA_RESERVE", "200"))
+# Segundos que una petición interactiva espera cuota antes de fallar
+YOUTUBE_QUOTA_MAX_WAIT = float(os.getenv("YOUTUBE_QUOTA_MAX_WAIT", "30"))
+
+# Coste en unidades de cada endpoint (lecturas list de la API de datos v3)
+QUOTA_COSTS = {
+    "channels": 1,
+    "playlistItems": 1,
+    "videos": 1,
+    "commentThreads": 1,
+    "search": 100,
+}
+DEFAULT_QUOTA_COST = 1
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, BACKGROUND: 1}
+
+# Prioridad de las peticiones de la tarea actual (se hereda en las tareas que crea)
+_current_priority = contextvars.ContextVar("youtube_quota_priority", default=INTERACTIVE)
+
+
+class QuotaExhausted(Exception):
+    """
+    No queda cuota para una petición interactiva en el tiempo de espera
+    permitido. Se traduce en una respuesta 429 con cabecera Retry-After.
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"Cuota de la API de YouTube agotada ({endpoint}), inténtalo más tarde")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+@contextmanager
+def quota_priority(priority):
+    """
+    Fija la prioridad de las peticiones a la API dentro del bloque.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+class FakeClock:
+    """
+    Reloj manual para probar el planificador sin esperas reales: `sleep`
+    solo termina cuando `advance` mueve el reloj más allá de su plazo.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + seconds, next(self._seq), future))
+        await future
+
+    async def advance(self, seconds):
+        """
+        Avanza el reloj, despierta las esperas vencidas y deja que se ejecuten.
+        """
+        self.now += seconds
+        while self._sleepers and self._sleepers[0][0] <= self.now:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+
+class LocalQuotaBucket:
+    """
+    Token bucket en memoria, propio del proceso. Usa el reloj inyectado.
+    """
+
+    blocking = False
+
+    def __init__(self, capacity, refill_rate, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def take(self, cost, floor=0):
+        """
+        Descuenta `cost` unidades si después quedan al menos `floor`.
+
+        Returns:
+            tuple: (descontadas, unidades disponibles)
+        """
+        self._refill()
+        if self._tokens - cost < floor:
+            return False, self._tokens
+        self._tokens -= cost
+        return True, self._tokens
+
+    def remaining(self):
+        self._refill()
+        return self._tokens
+
+
+class PostgresQuotaBucket:
+    """
+    Token bucket compartido por todos los procesos (workers de uvicorn, el
+    CLI de backfill...) en una fila de la tabla `youtube_quota`. Cada
+    descuento bloquea la fila con SELECT ... FOR UPDATE y usa la hora del
+    servidor de base de datos, así que los procesos no dependen de sus
+    relojes ni se rellena al reiniciar.
+    """
+
+    blocking = True
+
+    def __init__(self, capacity, refill_rate, name="youtube"):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.name = name
+
+    def take(self, cost, floor=0):
+        from app.database.database_service import take_quota_units
+        return take_quota_units(self.name, cost, floor, self.capacity, self.refill_rate)
+
+    def remaining(self):
+        from app.database.database_service import get_quota_units
+        return get_quota_units(self.name, self.capacity, self.refill_rate)
+
+
+class QuotaScheduler:
+    """
+    Planificador de peticiones a la API de YouTube con un token bucket de
+    unidades de cuota.
+
+    El bucket admite ráfagas de hasta `burst` unidades y se rellena a
+    (cuota diaria - burst) / 86400 unidades por segundo, de modo que en
+    cualquier ventana de 24 horas no se gasta más de la cuota diaria. Con
+    `shared` el bucket vive en Postgres y la cuota es una sola para todos los
+    procesos. Las peticiones esperan su turno en una cola de prioridad: las
+    interactivas pasan antes que las de segundo plano, que además no pueden
+    gastar las últimas `reserve` unidades. Una petición interactiva que
+    tendría que esperar más de `max_wait` segundos falla con QuotaExhausted.
+
+    La cola de prioridad es de cada proceso; la reserva y el saldo se
+    respetan entre procesos. `clock` y `sleep` son inyectables para probarlo
+    con un FakeClock.
+    """
+
+    def __init__(self, daily_quota=YOUTUBE_DAILY_QUOTA, burst=YOUTUBE_QUOTA_BURST,
+                 reserve=YOUTUBE_QUOTA_RESERVE, max_wait=YOUTUBE_QUOTA_MAX_WAIT,
+                 costs=QUOTA_COSTS, clock=time.monotonic, sleep=asyncio.sleep, shared=False):
+        self.capacity = min(burst, daily_quota)
+        self.refill_rate = max(daily_quota - self.capacity, 1) / 86400
+        self.reserve = min(reserve, self.capacity)
+        self.max_wait = max_wait
+        self.costs = costs
+        self.clock = clock
+        self.sleep = sleep
+        if shared:
+            self.bucket = PostgresQuotaBucket(self.capacity, self.refill_rate)
+        else:
+            self.bucket = LocalQuotaBucket(self.capacity, self.refill_rate, clock)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._changed = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "units": 0, "rejected": 0, "units_by_endpoint": {}}
+
+    def cost(self, endpoint):
+        return self.costs.get(endpoint, DEFAULT_QUOTA_COST)
+
+    async def _take(self, cost, floor):
+        if self.bucket.blocking:
+            return await run_io(self.bucket.take, cost, floor)
+        return self.bucket.take(cost, floor)
+
+    def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _wait(self, delay):
+        """
+        Espera a que cambie la cola o, como mucho, `delay` segundos.
+        """
+        changed = self._changed.wait()
+        if delay is None:
+            await changed
+            return
+        tasks = {asyncio.ensure_future(changed), asyncio.ensure_future(self.sleep(delay))}
+        _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+
+    async def acquire(self, endpoint, priority=None):
+        """
+        Espera a que haya cuota para una petición a `endpoint` y la descuenta.
+        Sin `priority` se usa la de la tarea actual (ver quota_priority).
+
+        Returns:
+            int: unidades gastadas
+        """
+        self._ensure_loop()
+        priority = priority or current_priority()
+        cost = self.cost(endpoint)
+        floor = self.reserve if priority == BACKGROUND else 0
+        if cost + floor > self.capacity:
+            raise ValueError(f"El coste de '{endpoint}' ({cost}) supera la capacidad del bucket")
+
+        ticket = (PRIORITIES[priority], next(self._seq), cost)
+        heapq.heappush(self._waiters, ticket)
+        self._notify()
+        try:
+            while True:
+                delay = None
+                if self._waiters[0] is ticket:
+                    taken, tokens = await self._take(cost, floor)
+                    if taken:
+                        self._waiters.remove(ticket)
+                        heapq.heapify(self._waiters)
+                        self._record(endpoint, cost)
+                        self._notify()
+                        return cost
+                    # Con el bucket compartido es una estimación: otros procesos también gastan
+                    delay = (cost + floor - tokens) / self.refill_rate
+                    if priority == INTERACTIVE and delay > self.max_wait:
+                        self._count("rejected")
+                        raise QuotaExhausted(endpoint, int(delay) + 1)
+                await self._wait(delay)
+        except BaseException:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._notify()
+            raise
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _record(self, endpoint, cost):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["units"] += cost
+            by_endpoint = self._stats["units_by_endpoint"]
+            by_endpoint[endpoint] = by_endpoint.get(endpoint, 0) + cost
+
+    def remaining(self):
+        """
+        Unidades disponibles ahora mismo en el bucket.
+        """
+        return self.bucket.remaining()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, units_by_endpoint=dict(self._stats["units_by_endpoint"]))
+        waiting = [priority for priority, _, _ in self._waiters]
+        stats.update({
+            "remaining": int(self.remaining()),
+            "shared": self.bucket.blocking,
+            "capacity": self.capacity,
+            "refill_per_hour": round(self.refill_rate * 3600, 1),
+            "waiting": {name: waiting.count(value) for name, value in PRIORITIES.items()},
+        })
+        return stats
+
+
+youtube_quota = QuotaScheduler(shared=YOUTUBE_QUOTA_BACKEND == "postgres")
@@ -1,10 +1,18 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
+from transformers import StoppingCriteriaList
 import logging
 import sys
 import os
+from app.utils.model_registry import model_registry, QWEN_CHAT_MODEL
+from app.utils.inference_scheduler import MicroBatchScheduler
+from app.utils.definition_cache import definition_cache
+from app.utils.executors import ExecutorBusy, inference_pool, run_io
+from app.utils.model_server import served, model_server_client
+from app.utils.streaming import SENTENCE_END, SentenceBoundaryStoppingCriteria, left_pad_batch, stream_generate, sse_event
 
 # Configurar para forzar CPU
 os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'
@@ -21,155 +29,240 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configuración del modelo Qwen
-MODEL_NAME = "Qwen/Qwen2-1.5B-Instruct"
+# Configuración del modelo Qwen (compartido a través del registro de modelos)
+MODEL_NAME = QWEN_CHAT_MODEL
 DEVICE = "cpu"
 
-logger.info(f"Iniciando carga del modelo {MODEL_NAME} en CPU")
-
-try:
-    # Inicializar el modelo y tokenizer forzando CPU
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_NAME,
-        torch_dtype=torch.float32,
-        low_cpu_mem_usage=True,
-        device_map=None  # Forzar no usar device mapping automático
-    ).to(DEVICE)
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    
-    # Configurar pad token
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
-        model.config.pad_token_id = model.config.eos_token_id
-    
-    logger.info("Modelo y tokenizer cargados exitosamente en CPU")
-except Exception as e:
-    logger.error(f"Error al cargar el modelo: {str(e)}")
-    raise
+# Longitud objetivo en tokens: al alcanzarla, la generación termina en el siguiente final de frase
+DEFINE_TARGET_TOKENS = int(os.getenv("DEFINE_TARGET_TOKENS", "80"))
+DEFINITION_GENERATION_KWARGS = {
+    "max_new_tokens": 200,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "do_sample": True,
+}
 
 router = APIRouter()
 
 class SearchRequest(BaseModel):
     term: str
 
-def truncate_at_last_period(text: str) -> str:
+def truncate_at_sentence_end(text: str) -> str:
     """
-    Trunca el texto en el último punto encontrado.
-    Si no hay punto, devuelve el texto original.
+    Trunca el texto tras el último final de frase (".", "!", "?", "…"), para
+    las respuestas que se cortaron por max_new_tokens a mitad de frase.
+    Si ya termina en final de frase o no hay ninguno, lo devuelve tal cual.
     """
-    last_period_index = text.rfind('.')
-    if last_period_index != -1:
-        return text[:last_period_index + 1]
+    text = text.rstrip()
+    if text.endswith(SENTENCE_END):
+        return text
+    last_end = max(text.rfind(end) for end in SENTENCE_END)
+    if last_end != -1:
+        return text[:last_end + 1]
     return text
 
+def build_definition_messages(term: str) -> list:
+    """
+    Construye los mensajes de chat para definir un término.
+    """
+    return [
+        {"role": "system", "content": "Eres un experto en perfumería que proporciona definiciones precisas y profesionales."},
+        {"role": "user", "content": f"Define {term} de forma breve y profesional en español."}
+    ]
+
+def generate_definitions(model, tokenizer, messages_list) -> list:
+    """
+    Genera en un solo lote las definiciones para cada lista de mensajes.
+    """
+    logger.info(f"Aplicando plantilla de chat a {len(messages_list)} prompts...")
+    texts = [
+        tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        for messages in messages_list
+    ]
+
+    # Tokenizar con padding a la izquierda
+    input_ids, attention_mask = left_pad_batch(tokenizer, texts)
+    logger.info(f"Input tokenizado. Forma del tensor: {tuple(input_ids.shape)}")
+
+    # Generar definiciones, deteniendo cada una en un final de frase tras el objetivo de longitud
+    criteria = SentenceBoundaryStoppingCriteria(tokenizer, input_ids.shape[1], DEFINE_TARGET_TOKENS)
+    logger.info("Generando definiciones...")
+    try:
+        with torch.inference_mode():
+            outputs = model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                stopping_criteria=StoppingCriteriaList([criteria]),
+                **DEFINITION_GENERATION_KWARGS,
+                pad_token_id=tokenizer.pad_token_id
+            )
+        logger.info(f"Generación completada. Forma del tensor de salida: {tuple(outputs.shape)}")
+    except Exception as e:
+        logger.error(f"Error en la generación: {str(e)}")
+        raise
+
+    # Decodificar solo los tokens generados hasta el punto de corte de cada fila
+    return tokenizer.batch_decode(criteria.trim(outputs), skip_special_tokens=True)
+
+def generate_definition(model, tokenizer, messages) -> str:
+    """
+    Genera la definición para los mensajes dados con el modelo indicado.
+    """
+    return generate_definitions(model, tokenizer, [messages])[0]
+
+@served("generate_definitions")
+def _run_definition_batch(messages_list):
+    with model_registry.use(MODEL_NAME) as handle:
+        return generate_definitions(handle.model, handle.tokenizer, messages_list)
+
+# Agrupa las peticiones concurrentes de /api/define en un único generate
+definition_scheduler = MicroBatchScheduler(
+    _run_definition_batch,
+    max_batch_size=int(os.getenv("DEFINE_MAX_BATCH_SIZE", "8")),
+    max_wait_ms=int(os.getenv("DEFINE_MAX_WAIT_MS", "50")),
+    name="define",
+    executor=inference_pool.executor
+)
+
 @router.post("/api/define")
 async def search_definition(request: SearchRequest):
     try:
         logger.info(f"Recibida solicitud de definición para: {request.term}")
-        
+
         # Crear el prompt usando el formato de mensajes
-        messages = [
-            {"role": "system", "content": "Eres un experto en perfumería que proporciona definiciones precisas y profesionales."},
-            {"role": "user", "content": f"Define {request.term} de forma breve y profesional en español."}
-        ]
-        
-        logger.info("Aplicando plantilla de chat...")
-        try:
-            text = tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-            logger.info("Plantilla de chat aplicada correctamente")
-        except Exception as e:
-            logger.error(f"Error al aplicar plantilla de chat: {str(e)}")
-            raise
-        
-        # Tokenizar
-        logger.info("Tokenizando input...")
-        try:
-            model_inputs = tokenizer([text], return_tensors="pt", padding=True)
-            logger.info(f"Input tokenizado. Forma del tensor: {model_inputs.input_ids.shape}")
-        except Exception as e:
-            logger.error(f"Error en tokenización: {str(e)}")
-            raise
-        
-        # Generar definición
-        logger.info("Generando definición...")
-        try:
-            with torch.inference_mode():
-                outputs = model.generate(
-                    model_inputs.input_ids,
-                    max_new_tokens=200,
-                    temperature=0.7,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=tokenizer.pad_token_id
-                )
-            logger.info(f"Generación completada. Forma del tensor de salida: {outputs.shape}")
-        except Exception as e:
-            logger.error(f"Error en la generación: {str(e)}")
-            raise
-        
-        # Procesar las IDs generadas
-        generated_ids = [
-            output_ids[len(input_ids):] 
-            for input_ids, output_ids in zip(model_inputs.input_ids, outputs)
-        ]
-        
-        # Decodificar
-        logger.info("Decodificando respuesta...")
-        try:
-            definition = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            logger.info(f"Respuesta completa: {definition}")
-        except Exception as e:
-            logger.error(f"Error en la decodificación: {str(e)}")
-            raise
-        
-        # Truncar en el último punto
-        definition = truncate_at_last_period(definition)
+        messages = build_definition_messages(request.term)
+
+        # Consultar primero la caché de definiciones
+        cached = await run_io(definition_cache.get, request.term)
+        if cached:
+            logger.info(f"Definición obtenida de la caché para: {request.term}")
+            return {
+                "definition": cached,
+                "prompt_system": messages[0]["content"],
+                "prompt_user": messages[1]["content"],
+                "cached": True
+            }
+
+        # Cada petición ocupa un hueco de la cola de inferencia mientras espera su lote
+        with inference_pool.slot():
+            definition = await definition_scheduler.submit(messages)
+
+        # Quitar la frase incompleta si la generación se cortó por longitud
+        definition = truncate_at_sentence_end(definition)
         logger.info(f"Definición final extraída y truncada: {definition}")
-        
+
         # Verificar calidad de la respuesta
         if len(definition) < 10:
             logger.warning("La definición generada es demasiado corta")
             raise ValueError("La definición generada es demasiado corta")
-            
+
+        await run_io(definition_cache.set, request.term, definition)
+
         return {
             "definition": definition,
             "prompt_system": messages[0]["content"],
-            "prompt_user": messages[1]["content"]
+            "prompt_user": messages[1]["content"],
+            "cached": False
         }
-        
+
+    except ExecutorBusy:
+        raise
     except Exception as e:
         logger.error(f"Error en el proceso de definición: {str(e)}")
         logger.error("Detalles del error:", exc_info=True)
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Error interno: {str(e)}"
         )
 
-# Verificar estado del modelo al inicio
-try:
+@router.get("/api/define/stream")
+async def stream_definition(term: str):
+    """
+    Devuelve la definición como Server-Sent Events a medida que se generan los
+    tokens. Emite eventos con {"text": fragmento}, un evento final "done" con
+    la definición completa y un evento "error" si la generación falla.
+    """
+    logger.info(f"Recibida solicitud de definición en streaming para: {term}")
+    messages = build_definition_messages(term)
+    cached = await run_io(definition_cache.get, term)
+
+    if cached:
+        def cached_events():
+            yield sse_event({"text": cached})
+            yield sse_event({"definition": cached, "cached": True}, event="done")
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream")
+
+    # El hueco se reserva antes de responder para poder devolver 503 si la cola está llena.
+    # Se libera al terminar la generación o, si el generador no llega a
+    # ejecutarse (el cliente se desconecta antes), al cerrar la respuesta
+    reservation = inference_pool.reserve()
+
+    def events():
+        parts = []
+        try:
+            if model_server_client.enabled:
+                # El servidor de modelos no transmite tokens: se envía la definición completa
+                parts.append(_run_definition_batch([messages])[0])
+                yield sse_event({"text": parts[0]})
+            else:
+                with model_registry.use(MODEL_NAME) as handle:
+                    text = handle.tokenizer.apply_chat_template(
+                        messages,
+                        tokenize=False,
+                        add_generation_prompt=True
+                    )
+                    input_ids, attention_mask = left_pad_batch(handle.tokenizer, [text])
+                    for chunk in stream_generate(
+                        handle.model,
+                        handle.tokenizer,
+                        input_ids,
+                        attention_mask,
+                        DEFINE_TARGET_TOKENS,
+                        pad_token_id=handle.tokenizer.pad_token_id,
+                        **DEFINITION_GENERATION_KWARGS
+                    ):
+                        parts.append(chunk)
+                        yield sse_event({"text": chunk})
+        except Exception as e:
+            logger.error(f"Error en la definición en streaming: {str(e)}")
+            yield sse_event({"detail": f"Error interno: {str(e)}"}, event="error")
+            return
+        finally:
+            reservation.release()
+
+        definition = "".join(parts).strip()
+        if len(definition) >= 10:
+            definition_cache.set(term, definition)
+        yield sse_event({"definition": definition, "cached": False}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        background=BackgroundTask(reservation.release)
+    )
+
+def warm_up():
+    """
+    Ejecuta una generación corta para verificar el modelo y calentar la caché
+    de kernels. Se invoca desde el arranque diferido de la aplicación.
+    """
     logger.info("Verificando estado del modelo...")
     test_messages = [
         {"role": "system", "content": "Eres un experto en perfumería."},
         {"role": "user", "content": "Define prueba."}
     ]
-    test_text = tokenizer.apply_chat_template(
-        test_messages,
-        tokenize=False,
-        add_generation_prompt=True
-    )
-    test_inputs = tokenizer([test_text], return_tensors="pt", padding=True)
-    with torch.inference_mode():
-        test_outputs = model.generate(
-            test_inputs.input_ids,
-            max_new_tokens=20,
-            pad_token_id=tokenizer.pad_token_id
+    with model_registry.use(MODEL_NAME) as handle:
+        test_text = handle.tokenizer.apply_chat_template(
+            test_messages,
+            tokenize=False,
+            add_generation_prompt=True
         )
-    test_response = tokenizer.decode(test_outputs[0], skip_special_tokens=True)
+        test_inputs = handle.tokenizer([test_text], return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            handle.model.generate(
+                test_inputs.input_ids,
+                max_new_tokens=20,
+                pad_token_id=handle.tokenizer.pad_token_id
+            )
     logger.info("Verificación del modelo completada exitosamente")
-except Exception as e:
-    logger.error(f"Error en la verificación inicial del modelo: {str(e)}")
-    raise
\ No newline at end of file
@@ -1,29 +1,114 @@
-from transformers import pipeline
+import os
+import torch
+from app.utils.model_registry import model_registry, SENTIMENT_MODEL
+from app.utils.model_server import served
 
-# Crear el pipeline de análisis de sentimientos
-sentiment_pipeline = pipeline("sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment", framework="pt")
+# Número de comentarios por lote de inferencia
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+MAX_LENGTH = 512
 
-def analyze_comments(comments):
+def _score_batch(model, tokenizer, texts):
+    """
+    Puntúa un lote de textos con padding hasta el texto más largo del lote.
+    Devuelve una lista de (estrellas, confianza).
+    """
+    inputs = tokenizer(
+        texts,
+        padding=True,
+        truncation=True,
+        max_length=MAX_LENGTH,
+        return_tensors="pt"
+    )
+    with torch.inference_mode():
+        logits = model(**inputs).logits
+    probs = torch.softmax(logits, dim=-1)
+    scores, indices = probs.max(dim=-1)
+
+    results = []
+    for score, index in zip(scores.tolist(), indices.tolist()):
+        label = model.config.id2label[index]
+        stars = int(label.split(" ")[0])  # Extraer las estrellas de la etiqueta (e.g., "5 stars")
+        results.append((stars, score))
+    return results
+
+@served("sentiment")
+def score_comments(comments, batch_size=None):
+    """
+    Puntúa los comentarios por lotes ordenados por longitud, de modo que cada
+    lote solo se rellena hasta su comentario más largo.
+
+    Si un lote falla se reintenta comentario a comentario, para que un
+    comentario problemático no descarte al resto de su lote.
+
+    Returns:
+        list: Un diccionario por comentario, en el orden de entrada, o None
+        si no se pudo puntuar.
+    """
+    results = [None] * len(comments)
+    if not comments:
+        return results
+    batch_size = batch_size or SENTIMENT_BATCH_SIZE
+
+    # Ordenar por longitud para reducir el padding dentro de cada lote
+    order = sorted(range(len(comments)), key=lambda i: len(comments[i]))
+
+    # El pipeline se obtiene del registro compartido de modelos
+    with model_registry.use(SENTIMENT_MODEL, kind="sentiment") as handle:
+        model = handle.model.model
+        tokenizer = handle.tokenizer
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch = [comments[i] for i in batch_indices]
+            try:
+                scored = list(zip(batch_indices, _score_batch(model, tokenizer, batch)))
+            except Exception as e:
+                print(f"Error analyzing batch of {len(batch)} comments, retrying one by one: {e}")
+                scored = []
+                for i in batch_indices:
+                    try:
+                        scored.append((i, _score_batch(model, tokenizer, [comments[i]])[0]))
+                    except Exception as e:
+                        print(f"Error analyzing comment: {comments[i][:100]}... - {e}")  # Mostrar solo una parte del comentario
+            for i, (stars, confidence) in scored:
+                results[i] = {
+                    "text": comments[i][:500],  # Guardar texto truncado para no exceder 512 tokens
+                    "stars": stars,
+                    "confidence": confidence
+                }
+    return results
+
+def analyze_comments(comments, batch_size=None):
     """
     Realiza análisis de sentimiento sobre una lista de comentarios y devuelve su valor en estrellas.
-    
+
     Args:
         comments (list): Lista de comentarios (str).
-        
+        batch_size (int): Comentarios por lote. Por defecto SENTIMENT_BATCH_SIZE.
+
     Returns:
         list: Lista de diccionarios con texto, estrellas y confianza.
     """
-    analyzed_comments = []
-    for comment in comments:
-        try:
-            # Realizar análisis de sentimiento con truncamiento
-            result = sentiment_pipeline(comment, truncation=True)
-            stars = int(result[0]["label"].split(" ")[0])  # Extraer las estrellas de la etiqueta (e.g., "5 stars")
-            analyzed_comments.append({
-                "text": comment[:500],  # Guardar texto truncado para no exceder 512 tokens
-                "stars": stars,
-                "confidence": result[0]["score"]
-            })
-        except Exception as e:
-            print(f"Error analyzing comment: {comment[:100]}... - {e}")  # Mostrar solo una parte del comentario
-    return analyzed_comments
+    return [result for result in score_comments(comments, batch_size) if result is not None]
+
+def analyze_comments_by_video(comments_by_video, batch_size=None):
+    """
+    Analiza en una sola llamada los comentarios de todos los videos de un canal.
+
+    Args:
+        comments_by_video (dict): {video_id: [comentarios]}.
+        batch_size (int): Comentarios por lote. Por defecto SENTIMENT_BATCH_SIZE.
+
+    Returns:
+        dict: {video_id: [comentarios analizados]}.
+    """
+    owners = []
+    all_comments = []
+    for video_id, comments in comments_by_video.items():
+        owners.extend([video_id] * len(comments))
+        all_comments.extend(comments)
+
+    analyzed = {video_id: [] for video_id in comments_by_video}
+    for video_id, result in zip(owners, score_comments(all_comments, batch_size)):
+        if result is not None:
+            analyzed[video_id].append(result)
+    return analyzed
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from fastapi import HTTPException
+
+from app.database.config import DATABASE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Generated SQL runs on its own pool, optionally with a dedicated read-only role
+READONLY_DATABASE_CONFIG = dict(
+    DATABASE_CONFIG,
+    user=os.getenv("SQL_READONLY_USER", DATABASE_CONFIG["user"]),
+    password=os.getenv("SQL_READONLY_PASSWORD", DATABASE_CONFIG["password"]),
+)
+SQL_POOL_MIN = int(os.getenv("SQL_POOL_MIN", "1"))
+SQL_POOL_MAX = int(os.getenv("SQL_POOL_MAX", "5"))
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "5000"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "500"))
+# Seconds to wait for a free pooled connection before answering 503
+SQL_POOL_TIMEOUT = float(os.getenv("SQL_POOL_TIMEOUT", "5"))
+# Maximum lifetime of a streamed cursor, so slow clients cannot hold a connection forever
+SQL_STREAM_TIMEOUT = float(os.getenv("SQL_STREAM_TIMEOUT", "60"))
+SQL_DEFAULT_PAGE_SIZE = 100
+
+
+class ReadOnlySQLExecutor:
+    """
+    Executes generated SQL on pooled read-only connections.
+
+    Every query runs inside a read-only transaction with a `statement_timeout`
+    and is read through a server-side cursor, so results are streamed in
+    batches of `fetch_size` rows and never loaded whole into memory.
+
+    Callers wait up to `pool_timeout` seconds for a free connection and get a
+    503 when none frees up; streamed cursors are closed after `stream_timeout`
+    seconds.
+    """
+
+    def __init__(self, config=READONLY_DATABASE_CONFIG, minconn=SQL_POOL_MIN, maxconn=SQL_POOL_MAX,
+                 statement_timeout_ms=SQL_STATEMENT_TIMEOUT_MS, max_rows=SQL_MAX_ROWS,
+                 fetch_size=SQL_FETCH_SIZE, pool_timeout=SQL_POOL_TIMEOUT,
+                 stream_timeout=SQL_STREAM_TIMEOUT):
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_rows = max_rows
+        self.fetch_size = fetch_size
+        self.pool_timeout = pool_timeout
+        self.stream_timeout = stream_timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        # getconn() fails immediately when the pool is empty, so callers queue here instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.config)
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Borrows a connection and opens a read-only transaction with the
+        statement timeout applied. The transaction is always rolled back.
+        """
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            raise self._pool_exhausted()
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+        except PoolError:
+            self._slots.release()
+            raise self._pool_exhausted()
+        except Exception:
+            self._slots.release()
+            raise
+        broken = False
+        try:
+            conn.set_session(readonly=True, autocommit=False)
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s;", (self.statement_timeout_ms,))
+            yield conn
+        except errors.QueryCanceled:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Query exceeded the statement timeout of {self.statement_timeout_ms} ms"
+            )
+        except errors.ReadOnlySqlTransaction:
+            raise HTTPException(status_code=400, detail="Only read-only queries are allowed")
+        except psycopg2.Error as e:
+            broken = conn.closed != 0
+            logger.error(f"Error executing SQL: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error executing SQL query: {e.pgerror or str(e)}")
+        finally:
+            if not conn.closed:
+                conn.rollback()
+            pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def _pool_exhausted(self):
+        return HTTPException(
+            status_code=503,
+            detail="All database connections are busy, try again later",
+            headers={"Retry-After": "1"}
+        )
+
+    @contextmanager
+    def _server_cursor(self, conn):
+        cursor = conn.cursor(name=f"generated_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+        cursor.itersize = self.fetch_size
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def fetch_scalar(self, sql_query, params=None):
+        """
+        Returns the first column of the first row, or 0 if there are no rows.
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, params)
+                row = cursor.fetchone()
+                return row[0] if row else 0
+
+    def explain(self, sql_query, params=None):
+        """
+        Returns the planner's estimate for the query (EXPLAIN without ANALYZE,
+        so nothing is executed) as the root node of the JSON plan.
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql_query}", params)
+                plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]
+
+    def fetch_page(self, sql_query, params=None, page=1, page_size=SQL_DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of the result set. Earlier rows are skipped on the
+        server (MOVE FORWARD) instead of being transferred.
+        """
+        page = max(1, page)
+        offset = (page - 1) * page_size
+        if offset >= self.max_rows:
+            raise HTTPException(status_code=400, detail=f"Results are limited to {self.max_rows} rows")
+        limit = min(page_size, self.max_rows - offset)
+
+        with self._transaction() as conn:
+            with self._server_cursor(conn) as cursor:
+                cursor.execute(sql_query, params)
+                if offset:
+                    cursor.scroll(offset)
+                rows = cursor.fetchmany(limit + 1)
+                columns = [column.name for column in cursor.description or []]
+
+        has_more = len(rows) > limit and offset + limit < self.max_rows
+        return {
+            "columns": columns,
+            "rows": [dict(row) for row in rows[:limit]],
+            "page": page,
+            "page_size": page_size,
+            "has_more": has_more,
+        }
+
+    def iter_rows(self, sql_query, params=None):
+        """
+        Yields the rows of the result set one by one, up to `max_rows` rows
+        and `stream_timeout` seconds (including the time the consumer takes).
+        """
+        deadline = time.monotonic() + self.stream_timeout
+        with self._transaction() as conn:
+            with self._server_cursor(conn) as cursor:
+                cursor.execute(sql_query, params)
+                for count, row in enumerate(cursor):
+                    if count >= self.max_rows:
+                        break
+                    if time.monotonic() > deadline:
+                        logger.warning(f"Streamed query stopped after {self.stream_timeout:g}s ({count} rows)")
+                        break
+                    yield dict(row)
+
+
+sql_executor = ReadOnlySQLExecutor()
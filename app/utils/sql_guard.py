@@ -0,0 +1,108 @@
+import os
+import logging
+
+from fastapi import HTTPException
+
+from app.utils.sql_executor import sql_executor
+
+logger = logging.getLogger(__name__)
+
+# Planner thresholds for generated SQL
+SQL_MAX_COST = float(os.getenv("SQL_MAX_COST", "100000"))
+SQL_MAX_PLAN_ROWS = int(os.getenv("SQL_MAX_PLAN_ROWS", "50000"))
+# Estimated rows (outer x inner) above which an unconditioned nested loop is rejected
+SQL_MAX_CARTESIAN_ROWS = int(os.getenv("SQL_MAX_CARTESIAN_ROWS", "10000"))
+# LIMIT added to queries that would return more than SQL_MAX_PLAN_ROWS rows
+SQL_GUARD_LIMIT = int(os.getenv("SQL_GUARD_LIMIT", "1000"))
+
+# Inner nodes that make a nested loop a parameterized (non-cartesian) join
+_INDEXED_INNER_NODES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Memoize"}
+
+
+class SQLGuardError(HTTPException):
+    """
+    Structured rejection of a generated query, returned as a 422 response.
+    """
+
+    def __init__(self, reason, message, plan=None):
+        detail = {"error": "query_rejected", "reason": reason, "message": message}
+        if plan is not None:
+            detail["estimated_cost"] = plan.get("Total Cost")
+            detail["estimated_rows"] = plan.get("Plan Rows")
+        super().__init__(status_code=422, detail=detail)
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def find_cartesian_join(plan, max_rows=SQL_MAX_CARTESIAN_ROWS):
+    """
+    Returns the first nested loop without a join condition whose estimated
+    outer x inner rows exceed `max_rows`, or None.
+
+    Hash and merge joins always have a join condition, so only nested loops
+    can be cartesian. Small cross joins (e.g. against a one-row aggregate)
+    are allowed.
+    """
+    for node in _walk(plan):
+        if node.get("Node Type") != "Nested Loop" or "Join Filter" in node:
+            continue
+        children = node.get("Plans", [])
+        if len(children) < 2 or children[1].get("Node Type") in _INDEXED_INNER_NODES:
+            continue
+        if children[0].get("Plan Rows", 0) * children[1].get("Plan Rows", 0) > max_rows:
+            return node
+    return None
+
+
+def _strip_semicolon(sql_query):
+    return sql_query.strip().rstrip(";").strip()
+
+
+def add_limit(sql_query, limit):
+    """
+    Wraps the query so that it returns at most `limit` rows.
+    """
+    return f"SELECT * FROM ({_strip_semicolon(sql_query)}) AS guarded_query LIMIT {int(limit)};"
+
+
+def guard_query(sql_query, params=None):
+    """
+    Checks the planner's estimate for a generated query before running it.
+
+    - Cartesian joins are rejected.
+    - Queries estimated to return more than SQL_MAX_PLAN_ROWS rows without a
+      LIMIT are rewritten with LIMIT SQL_GUARD_LIMIT.
+    - Queries whose estimated cost is still above SQL_MAX_COST are rejected.
+
+    Returns the query to execute (possibly rewritten) or raises SQLGuardError.
+    """
+    try:
+        plan = sql_executor.explain(sql_query, params)
+    except HTTPException as e:
+        raise SQLGuardError("invalid_query", f"The query could not be planned: {e.detail}")
+
+    cartesian = find_cartesian_join(plan)
+    if cartesian is not None:
+        raise SQLGuardError(
+            "cartesian_join",
+            "The query joins tables without a join condition.",
+            cartesian
+        )
+
+    if plan.get("Node Type") != "Limit" and plan.get("Plan Rows", 0) > SQL_MAX_PLAN_ROWS:
+        logger.info(f"Adding LIMIT {SQL_GUARD_LIMIT} to query estimated at {plan.get('Plan Rows')} rows")
+        sql_query = add_limit(sql_query, SQL_GUARD_LIMIT)
+        plan = sql_executor.explain(sql_query, params)
+
+    if plan.get("Total Cost", 0) > SQL_MAX_COST:
+        raise SQLGuardError(
+            "too_expensive",
+            f"The estimated cost exceeds the limit of {SQL_MAX_COST:g}.",
+            plan
+        )
+
+    return sql_query
@@ -0,0 +1,250 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from app.database.database_service import get_sql_plan, save_sql_plan, get_channel_names
+
+SQL_PLAN_CACHE_SIZE = int(os.getenv("SQL_PLAN_CACHE_SIZE", "512"))
+# Seconds the list of known channel names is reused before reloading it
+SQL_CHANNEL_NAMES_TTL = int(os.getenv("SQL_CHANNEL_NAMES_TTL", "300"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question for cache lookups: lowercase, no accents, no
+    punctuation and collapsed whitespace.
+    """
+    question = unicodedata.normalize("NFKD", question.strip().lower())
+    question = "".join(c for c in question if not unicodedata.combining(c))
+    question = re.sub(r"[^\w\s]", " ", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+### Template fast path ###
+
+class SQLTemplate:
+    """
+    A parameterized SQL query for a common question shape.
+
+    `pattern` is matched against the normalized question; its named groups
+    are turned into query parameters by `build_params`. `fetch_all` tells the
+    executor whether the answer is a table or a single scalar.
+    """
+
+    def __init__(self, name, pattern, sql, build_params, fetch_all=False):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.sql = sql
+        self.build_params = build_params
+        self.fetch_all = fetch_all
+
+
+_TOP = r"(?:top|las|los)?\s*(?P<limit>\d+)?\s*"
+_WORDS = r"(?:palabras|words)\s*(?:mas|most)?\s*(?:frecuentes|usadas|comunes|repetidas|used|common|frequent)?"
+_MONTHS = (
+    r"(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre"
+    r"|january|february|march|april|may|june|july|august|september|october|november|december)"
+)
+# A channel name is never just a number or a date ("en 2024", "de marzo de 2023")
+_NOT_DATE = (
+    rf"(?!(?:(?:de|del|en|el|of|in|canal|channel)\s+)*(?:[\d\s]+"
+    rf"|(?:\d+\s+)?(?:de\s+|of\s+)?{_MONTHS}(?:\s+(?:de\s+)?\d+)?)$)"
+)
+_CHANNEL_NAME = rf"{_NOT_DATE}(?P<channel>.+?)"
+# Without the "canal"/"channel" keyword the captured text must be a known
+# channel name (see match_template): "de la semana" is not a channel
+_CHANNEL_KEYWORD = r"(?:(?P<keyword>canal|channel)\s+)?"
+_CHANNEL = rf"\b(?:del|de|en el|en|for|of|in)\s+{_CHANNEL_KEYWORD}{_CHANNEL_NAME}"
+
+# Words and channel names are compared in the same normalized form as the
+# question (lowercase, no accents, punctuation collapsed to spaces)
+_ACCENT_FOLD = "translate(lower({column}), 'áàäéèëíìïóòöúùüñç', 'aaaeeeiiiooouuunc')"
+_CHANNEL_KEY = "regexp_replace(" + _ACCENT_FOLD + ", '[^a-z0-9]+', ' ', 'g')"
+
+
+def _channel_filter(column):
+    return f"{_CHANNEL_KEY.format(column=column)} LIKE %s"
+
+
+def _channel_param(channel):
+    return f"%{channel.strip()}%"
+
+
+SQL_TEMPLATES = [
+    SQLTemplate(
+        "top_words_by_channel",
+        rf"^(?:cuales son )?{_TOP}{_WORDS}\s+{_CHANNEL}$",
+        f"""
+            SELECT w.word, SUM(w.count) AS total_count
+            FROM wordcount w
+            JOIN videos v ON w.video_id = v.video_id
+            WHERE {_channel_filter("v.channel_name")}
+            GROUP BY w.word
+            ORDER BY total_count DESC
+            LIMIT %s;
+        """,
+        lambda m: (_channel_param(m.group("channel")), int(m.group("limit") or 10)),
+        fetch_all=True,
+    ),
+    SQLTemplate(
+        "top_words",
+        rf"^(?:cuales son )?{_TOP}{_WORDS}$",
+        """
+            SELECT word, SUM(count) AS total_count
+            FROM wordcount
+            GROUP BY word
+            ORDER BY total_count DESC
+            LIMIT %s;
+        """,
+        lambda m: (int(m.group("limit") or 10),),
+        fetch_all=True,
+    ),
+    SQLTemplate(
+        "word_count",
+        r"^(?:cuantas veces (?:se )?(?:dice|menciona|usa|aparece|repite)|how many times (?:is|does)|word count of|count of)"
+        r"(?: the word| la palabra)? (?P<word>[\w-]+)(?: (?:said|used|mentioned|appear))?$",
+        f"SELECT COALESCE(SUM(count), 0) FROM wordcount WHERE {_ACCENT_FOLD.format(column='word')} = %s;",
+        lambda m: (m.group("word"),),
+    ),
+    SQLTemplate(
+        "total_words_per_channel",
+        r"^(?:(?:cuantas palabras|total de palabras|numero de palabras) (?:tiene |hay )?(?:por|en cada|de cada) canal"
+        r"|(?:total )?words per channel|how many words (?:does )?each channel(?: have)?)$",
+        """
+            SELECT channel_name, SUM(total_palabras) AS total_palabras
+            FROM videos
+            GROUP BY channel_name
+            ORDER BY total_palabras DESC;
+        """,
+        lambda m: (),
+        fetch_all=True,
+    ),
+    SQLTemplate(
+        "total_words_of_channel",
+        r"^(?:cuantas palabras (?:tiene|hay en)|total de palabras (?:de|del)|(?:total )?words (?:of|for|in)) "
+        rf"(?:el )?{_CHANNEL_KEYWORD}{_CHANNEL_NAME}$",
+        f"SELECT COALESCE(SUM(total_palabras), 0) FROM videos WHERE {_channel_filter('channel_name')};",
+        lambda m: (_channel_param(m.group("channel")),),
+    ),
+    SQLTemplate(
+        "video_count_per_channel",
+        r"^(?:cuantos videos (?:hay )?(?:por|tiene cada|de cada) canal|(?:how many )?videos per channel)$",
+        """
+            SELECT channel_name, COUNT(*) AS videos
+            FROM videos
+            GROUP BY channel_name
+            ORDER BY videos DESC;
+        """,
+        lambda m: (),
+        fetch_all=True,
+    ),
+    SQLTemplate(
+        "video_count_of_channel",
+        r"^(?:cuantos videos (?:tiene|hay de|hay del|hay en)|how many videos (?:does|of|for|in)) "
+        rf"(?:el )?{_CHANNEL_KEYWORD}{_CHANNEL_NAME}(?: have)?$",
+        f"SELECT COUNT(*) FROM videos WHERE {_channel_filter('channel_name')};",
+        lambda m: (_channel_param(m.group("channel")),),
+    ),
+    SQLTemplate(
+        "video_count",
+        r"^(?:cuantos videos hay|how many videos (?:are there|in total)|total (?:de )?videos)$",
+        "SELECT COUNT(*) FROM videos;",
+        lambda m: (),
+    ),
+]
+
+
+class KnownChannels:
+    """
+    Normalized names of the channels stored in `videos`, reloaded every
+    `ttl` seconds.
+    """
+
+    def __init__(self, ttl=SQL_CHANNEL_NAMES_TTL):
+        self.ttl = ttl
+        self._names = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def names(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._names = {normalize_question(name) for name in get_channel_names()}
+                self._loaded_at = time.monotonic()
+            return self._names
+
+    def contains(self, channel):
+        """
+        True if `channel` is one or more whole words of a known channel name.
+        """
+        channel = f" {channel.strip()} "
+        return any(channel in f" {name} " for name in self.names())
+
+
+known_channels = KnownChannels()
+
+
+def _is_channel(match):
+    groups = match.groupdict()
+    if "channel" not in groups:
+        return True
+    return bool(groups.get("keyword")) or known_channels.contains(groups["channel"])
+
+
+def match_template(question: str):
+    """
+    Returns (template, params) for the first template matching the question,
+    or None if the question needs the model. A channel captured without the
+    "canal"/"channel" keyword must be a known channel name.
+    """
+    normalized = normalize_question(question)
+    for template in SQL_TEMPLATES:
+        match = template.pattern.match(normalized)
+        if match and _is_channel(match):
+            return template, template.build_params(match)
+    return None
+
+
+### Question -> SQL plan cache ###
+
+class SQLPlanCache:
+    """
+    Maps normalized questions to SQL that has already executed successfully.
+    In-process LRU backed by the `sql_plan_cache` table.
+    """
+
+    def __init__(self, max_size=SQL_PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _set_local(self, key, sql_query):
+        with self._lock:
+            self._entries[key] = sql_query
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, question: str):
+        key = normalize_question(question)
+        with self._lock:
+            sql_query = self._entries.get(key)
+            if sql_query is not None:
+                self._entries.move_to_end(key)
+                return sql_query
+
+        sql_query = get_sql_plan(key)
+        if sql_query is not None:
+            self._set_local(key, sql_query)
+        return sql_query
+
+    def set(self, question: str, sql_query: str):
+        key = normalize_question(question)
+        self._set_local(key, sql_query)
+        save_sql_plan(key, question, sql_query)
+
+
+sql_plan_cache = SQLPlanCache()
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import logging
+
+from app.utils.model_registry import model_registry, QWEN_CHAT_MODEL, SQL_MODEL, SENTIMENT_MODEL
+from app.utils.model_server import model_server_client
+
+logger = logging.getLogger(__name__)
+
+# Modo de arranque:
+#   deferred: el servidor arranca sin modelos y los carga en segundo plano (por defecto)
+#   eager: los modelos se cargan antes de aceptar peticiones
+#   lazy: no hay precarga, cada modelo se carga con la primera petición que lo usa
+STARTUP_MODE = os.getenv("STARTUP_MODE", "deferred")
+
+# Modelos a precargar: (nombre, tipo)
+WARMUP_MODELS = [
+    (QWEN_CHAT_MODEL, "causal_lm"),
+    (SENTIMENT_MODEL, "sentiment"),
+    (SQL_MODEL, "causal_lm"),
+]
+
+_status = {name: {"status": "pending", "error": None, "seconds": None} for name, _ in WARMUP_MODELS}
+_status_lock = threading.Lock()
+_warmup_thread = None
+
+
+def _set_status(name, status, error=None, seconds=None):
+    with _status_lock:
+        _status[name] = {"status": status, "error": error, "seconds": seconds}
+
+
+def _warm_up_hook(name):
+    """
+    Devuelve la función de calentamiento asociada a un modelo, si existe.
+    """
+    if name == QWEN_CHAT_MODEL:
+        from app.utils.search_llm import warm_up
+        return warm_up
+    return None
+
+
+def warm_up_models():
+    """
+    Carga y calienta todos los modelos de WARMUP_MODELS, actualizando su estado.
+    Un fallo en un modelo no impide cargar los demás.
+    """
+    for name, kind in WARMUP_MODELS:
+        _set_status(name, "loading")
+        start = time.monotonic()
+        try:
+            model_registry.preload(name, kind=kind)
+            hook = _warm_up_hook(name)
+            if hook:
+                hook()
+            _set_status(name, "ready", seconds=round(time.monotonic() - start, 1))
+        except Exception as e:
+            logger.error(f"Error al precargar el modelo {name}: {str(e)}")
+            _set_status(name, "error", error=str(e))
+
+
+def start_background_warmup():
+    """
+    Lanza la precarga de modelos en un hilo en segundo plano.
+    """
+    global _warmup_thread
+    if _warmup_thread is not None and _warmup_thread.is_alive():
+        return _warmup_thread
+    _warmup_thread = threading.Thread(target=warm_up_models, name="model-warmup", daemon=True)
+    _warmup_thread.start()
+    return _warmup_thread
+
+
+def on_startup():
+    """
+    Inicializa los modelos según STARTUP_MODE.
+    """
+    logger.info(f"Modo de arranque: {STARTUP_MODE}")
+    if model_server_client.enabled:
+        # Los modelos los carga el servidor de modelos, no este proceso
+        logger.info(f"Usando el servidor de modelos en {model_server_client.address}")
+        return
+    if STARTUP_MODE == "eager":
+        warm_up_models()
+    elif STARTUP_MODE == "deferred":
+        start_background_warmup()
+
+
+def readiness():
+    """
+    Devuelve el estado de disponibilidad de cada modelo.
+    En modo lazy el servicio se considera listo aunque no haya modelos cargados.
+    Con servidor de modelos se devuelve el estado del servidor.
+    """
+    if model_server_client.enabled:
+        try:
+            state = model_server_client.stats()["readiness"]
+        except Exception as e:
+            return {"ready": False, "server": model_server_client.address, "error": str(e)}
+        return dict(state, server=model_server_client.address)
+
+    with _status_lock:
+        models = {
+            name: dict(state, loaded=model_registry.is_loaded(name))
+            for name, state in _status.items()
+        }
+    if STARTUP_MODE == "lazy":
+        ready = True
+    else:
+        ready = all(state["status"] == "ready" for state in models.values())
+    return {"ready": ready, "mode": STARTUP_MODE, "models": models}
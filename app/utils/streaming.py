@@ -0,0 +1,110 @@
+import json
+from threading import Thread
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+SENTENCE_END = (".", "!", "?", "…")
+
+
+class SentenceBoundaryStoppingCriteria(StoppingCriteria):
+    """
+    Detiene la generación cuando cada secuencia del lote ha generado al menos
+    `target_new_tokens` tokens y acaba de cerrar una frase (o ha emitido EOS).
+
+    Guarda la posición de corte de cada fila para que `trim` descarte lo que
+    el resto del lote haya seguido generando.
+    """
+
+    def __init__(self, tokenizer, prompt_length, target_new_tokens):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.target_new_tokens = target_new_tokens
+        self.stop_positions = {}
+        self.cancelled = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.cancelled:
+            return True
+        generated = input_ids.shape[1] - self.prompt_length
+        for row in range(input_ids.shape[0]):
+            if row in self.stop_positions:
+                continue
+            last_token = input_ids[row, -1].item()
+            if last_token == self.tokenizer.eos_token_id:
+                self.stop_positions[row] = input_ids.shape[1]
+            elif generated >= self.target_new_tokens:
+                if self.tokenizer.decode([last_token]).rstrip().endswith(SENTENCE_END):
+                    self.stop_positions[row] = input_ids.shape[1]
+        return len(self.stop_positions) == input_ids.shape[0]
+
+    def trim(self, output_ids):
+        """
+        Devuelve los tokens generados de cada fila hasta su punto de corte.
+        """
+        return [
+            row[self.prompt_length:self.stop_positions.get(i, len(row))]
+            for i, row in enumerate(output_ids)
+        ]
+
+
+def left_pad_batch(tokenizer, texts):
+    """
+    Tokeniza los textos y los rellena por la izquierda, como requiere la
+    generación por lotes en modelos causales. No modifica el tokenizer compartido.
+    """
+    encoded = [tokenizer(text)["input_ids"] for text in texts]
+    max_len = max(len(ids) for ids in encoded)
+    input_ids = torch.full((len(encoded), max_len), tokenizer.pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(encoded), max_len), dtype=torch.long)
+    for i, ids in enumerate(encoded):
+        input_ids[i, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[i, max_len - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+def stream_generate(model, tokenizer, input_ids, attention_mask, target_new_tokens, **generate_kwargs):
+    """
+    Ejecuta `model.generate` en un hilo y va devolviendo el texto a medida que
+    se generan los tokens. La generación se detiene en el primer final de
+    frase tras `target_new_tokens` tokens.
+    """
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    criteria = SentenceBoundaryStoppingCriteria(tokenizer, input_ids.shape[1], target_new_tokens)
+
+    errors = []
+
+    def _generate():
+        try:
+            with torch.inference_mode():
+                model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([criteria]),
+                    **generate_kwargs
+                )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # Desbloquear al consumidor
+
+    thread = Thread(target=_generate, daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        # Si el cliente se desconecta, cortar la generación en el siguiente token
+        criteria.cancelled = True
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def sse_event(data, event=None):
+    """
+    Formatea un evento Server-Sent Events con `data` serializado como JSON.
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
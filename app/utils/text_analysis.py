@@ -1,10 +1,26 @@
-import nltk
-from nltk.corpus import stopwords
+import os
 from collections import Counter
+from functools import lru_cache
 import string
 
-# Descargar stopwords si no están descargadas
-nltk.download("stopwords")
+# Stopwords incluidas en el repositorio (copia de las listas de NLTK), para no
+# depender de descargas de red al arrancar
+STOPWORDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../resources/stopwords")
+
+
+@lru_cache(maxsize=None)
+def cargar_stopwords(idioma="spanish"):
+    """
+    Carga las stopwords del idioma desde los recursos incluidos. Si el idioma
+    no está incluido, recurre al corpus de NLTK instalado localmente.
+    """
+    path = os.path.join(STOPWORDS_DIR, f"{idioma}.txt")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return frozenset(line.strip() for line in f if line.strip())
+
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words(idioma))
 
 # Lista ampliada de stopwords (adicionales)
 stopwords_adicionales = [
@@ -60,7 +76,7 @@ def limpiar_y_contar(texto, idioma="spanish"):
         palabras = texto.split()
 
         # Cargar las stopwords en el idioma especificado
-        stop_words = set(stopwords.words(idioma)) | set(stopwords_adicionales)  # Unimos las stopwords por idioma con las adicionales
+        stop_words = cargar_stopwords(idioma) | set(stopwords_adicionales)  # Unimos las stopwords por idioma con las adicionales
 
         # Filtrar stopwords
         palabras_filtradas = [palabra for palabra in palabras if palabra not in stop_words]
@@ -0,0 +1,200 @@
+import os
+import json
+import gzip
+import mmap
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Directorio de las transcripciones guardadas
+TRANSCRIPT_STORE_DIR = os.getenv("TRANSCRIPT_STORE_DIR", "cache/transcripts")
+# Tamaño a partir del cual se empieza un nuevo fichero de datos (bytes)
+TRANSCRIPT_PACK_MAX_BYTES = int(os.getenv("TRANSCRIPT_PACK_MAX_BYTES", str(64 * 1024 ** 2)))
+
+INDEX_FILE = "index.jsonl"
+LOCK_FILE = "store.lock"
+
+
+def join_segments(segments):
+    """
+    Texto completo de una transcripción a partir de sus segmentos.
+    """
+    return " ".join(segment["text"] for segment in segments)
+
+
+class TranscriptStore:
+    """
+    Almacén en disco de transcripciones con tiempos, por (video_id, idioma).
+
+    Cada transcripción se guarda como un miembro gzip independiente (una
+    línea JSON [inicio, duración, texto] por segmento) añadido al final de un
+    fichero de datos `transcripts-NNNN.pack`. El índice `index.jsonl` es de
+    solo añadir: cada línea indica fichero, offset y longitud, y la última
+    entrada de una clave es la vigente. Las lecturas descomprimen el rango
+    sobre un mmap del fichero de datos, sin leerlo entero.
+
+    Las escrituras se serializan con un flock, así que varios procesos pueden
+    compartir el almacén; antes de cada búsqueda se leen las entradas que
+    otros procesos hayan añadido al índice.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_STORE_DIR, pack_max_bytes=TRANSCRIPT_PACK_MAX_BYTES):
+        self.directory = directory
+        self.pack_max_bytes = pack_max_bytes
+        self._index = {}
+        self._index_position = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        """
+        Lee las entradas del índice añadidas desde la última lectura.
+        """
+        try:
+            if os.path.getsize(self._path(INDEX_FILE)) == self._index_position:
+                return
+            with open(self._path(INDEX_FILE), "rb") as f:
+                f.seek(self._index_position)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Entrada a medio escribir por otro proceso
+                    self._index_position += len(line)
+                    entry = json.loads(line)
+                    self._index[(entry["video_id"], entry["lang"])] = entry
+        except FileNotFoundError:
+            pass
+
+    def _entry(self, video_id, lang):
+        with self._lock:
+            self._load_index()
+            return self._index.get((video_id, lang))
+
+    def _read(self, entry):
+        """
+        Bytes comprimidos de una entrada, a través del mmap de su fichero.
+        """
+        end = entry["offset"] + entry["length"]
+        with self._lock:
+            mapped = self._maps.get(entry["pack"])
+            if mapped is None or len(mapped) < end:
+                # El fichero ha crecido desde que se mapeó
+                if mapped is not None:
+                    mapped.close()
+                with open(self._path(entry["pack"]), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[entry["pack"]] = mapped
+            return mapped[entry["offset"]:end]
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, video_id, lang="es"):
+        """
+        Devuelve los segmentos guardados [{"text", "start", "duration"}] o None.
+        """
+        entry = self._entry(video_id, lang)
+        if entry is None:
+            self._count("misses")
+            return None
+        try:
+            raw = gzip.decompress(self._read(entry))
+        except (OSError, EOFError) as e:
+            logger.warning(f"Transcripción de {video_id} ({lang}) ilegible: {e}")
+            self._count("misses")
+            return None
+        self._count("hits")
+        segments = []
+        for line in raw.splitlines():
+            start, duration, text = json.loads(line)
+            segments.append({"text": text, "start": start, "duration": duration})
+        return segments
+
+    def _current_pack(self):
+        packs = sorted(name for name in os.listdir(self.directory) if name.endswith(".pack"))
+        if packs and os.path.getsize(self._path(packs[-1])) < self.pack_max_bytes:
+            return packs[-1]
+        return f"transcripts-{len(packs):04d}.pack"
+
+    def put(self, video_id, lang, segments):
+        """
+        Guarda los segmentos de una transcripción (sustituye a la anterior).
+        """
+        lines = "".join(
+            json.dumps(
+                [round(segment.get("start", 0.0), 3), round(segment.get("duration", 0.0), 3), segment["text"]],
+                ensure_ascii=False
+            ) + "\n"
+            for segment in segments
+        )
+        data = gzip.compress(lines.encode("utf-8"), mtime=0)
+        with self._write_lock():
+            pack = self._current_pack()
+            with open(self._path(pack), "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            entry = {
+                "video_id": video_id,
+                "lang": lang,
+                "pack": pack,
+                "offset": offset,
+                "length": len(data),
+                "segments": len(segments),
+                "stored_at": time.time(),
+            }
+            with open(self._path(INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        with self._lock:
+            self._index[(video_id, lang)] = entry
+        self._count("stored")
+
+    def keys(self, lang=None):
+        """
+        Claves (video_id, idioma) guardadas, opcionalmente de un solo idioma.
+        """
+        with self._lock:
+            self._load_index()
+            return [key for key in self._index if lang is None or key[1] == lang]
+
+    def iter_transcripts(self, lang="es"):
+        """
+        Recorre las transcripciones guardadas de un idioma como (video_id,
+        texto), para volver a analizarlas sin acceso a la red.
+        """
+        for video_id, key_lang in self.keys(lang):
+            segments = self.get(video_id, key_lang)
+            if segments is not None:
+                yield video_id, join_segments(segments)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["transcripts"] = len(self._index)
+        return stats
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+
+
+transcript_store = TranscriptStore()
@@ -0,0 +1,220 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import torch
+import whisper
+
+from app.utils.model_server import served
+
+# Configuración de Whisper
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE  # 16 kHz
+
+# Detección de voz: tamaño de trama, silencio mínimo para cortar y longitud máxima de segmento
+VAD_FRAME_MS = 30
+VAD_MIN_SILENCE_S = 0.3
+VAD_MAX_SEGMENT_S = 30
+VAD_MIN_SEGMENT_S = 0.5
+
+# Transcripción por streaming: audio acumulado antes de buscar segmentos de voz
+# (segundos) y segmentos enviados al pool sin terminar antes de dejar de leer
+STREAM_WINDOW_S = int(os.getenv("STREAM_WINDOW_S", "60"))
+STREAM_MAX_PENDING = int(os.getenv("STREAM_MAX_PENDING", str(WHISPER_WORKERS * 2)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Modelo cargado una sola vez en cada proceso worker
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = whisper.load_model(model_name, device="cpu")
+
+
+def _transcribe_segment(audio, offset, language):
+    """
+    Transcribe un segmento de audio en el proceso worker y desplaza sus
+    marcas de tiempo según la posición del segmento en el audio original.
+    """
+    result = _worker_model.transcribe(audio, language=language, task="transcribe", fp16=False)
+    return [
+        {
+            "start": round(offset + segment["start"], 2),
+            "end": round(offset + segment["end"], 2),
+            "text": segment["text"].strip(),
+        }
+        for segment in result.get("segments", [])
+        if segment["text"].strip()
+    ]
+
+
+def get_transcription_pool():
+    """
+    Devuelve el pool de procesos de transcripción, creándolo si no existe.
+    Cada worker mantiene el modelo de Whisper en memoria entre llamadas.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // WHISPER_WORKERS)
+            _pool = ProcessPoolExecutor(
+                max_workers=WHISPER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(WHISPER_MODEL, threads),
+            )
+        return _pool
+
+
+def shutdown_transcription_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_transcription_pool)
+
+
+def detectar_segmentos_voz(audio, sample_rate=SAMPLE_RATE):
+    """
+    Detecta los tramos con voz a partir de la energía de cada trama y los
+    agrupa en segmentos de como máximo VAD_MAX_SEGMENT_S segundos, cortando
+    siempre en silencios.
+
+    Returns:
+        Lista de (inicio, fin) en muestras.
+    """
+    frame = int(sample_rate * VAD_FRAME_MS / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    # Umbral adaptativo: por encima del ruido de fondo del propio audio
+    threshold = max(np.percentile(energy, 20) * 2, 1e-4)
+    voiced = energy > threshold
+
+    # Tramos de voz separados por silencios de al menos VAD_MIN_SILENCE_S
+    min_silence = int(VAD_MIN_SILENCE_S * 1000 / VAD_FRAME_MS)
+    regions = []
+    start = None
+    silence = 0
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced:
+            if start is None:
+                start = i
+            silence = 0
+        elif start is not None:
+            silence += 1
+            if silence >= min_silence:
+                regions.append((start, i - silence + 1))
+                start = None
+                silence = 0
+    if start is not None:
+        regions.append((start, n_frames))
+
+    # Agrupar tramos consecutivos hasta la longitud máxima de segmento
+    max_frames = int(VAD_MAX_SEGMENT_S * 1000 / VAD_FRAME_MS)
+    segments = []
+    for region_start, region_end in regions:
+        # Un tramo más largo que el máximo se corta en trozos de longitud fija
+        while region_end - region_start > max_frames:
+            segments.append([region_start, region_start + max_frames])
+            region_start += max_frames
+        if segments and region_end - segments[-1][0] <= max_frames:
+            segments[-1][1] = region_end
+        else:
+            segments.append([region_start, region_end])
+
+    min_frames = int(VAD_MIN_SEGMENT_S * 1000 / VAD_FRAME_MS)
+    return [
+        (seg_start * frame, min(seg_end * frame, len(audio)))
+        for seg_start, seg_end in segments
+        if seg_end - seg_start >= min_frames
+    ]
+
+
+def transcribir_segmentos(audio, language="es"):
+    """
+    Transcribe un audio (array float32 a 16 kHz) repartiendo sus segmentos de
+    voz entre los procesos del pool. Devuelve los segmentos con marcas de
+    tiempo absolutas, ordenados.
+    """
+    pool = get_transcription_pool()
+    futures = [
+        pool.submit(_transcribe_segment, audio[start:end], start / SAMPLE_RATE, language)
+        for start, end in detectar_segmentos_voz(audio)
+    ]
+    segments = []
+    for future in futures:
+        segments.extend(future.result())
+    return sorted(segments, key=lambda segment: segment["start"])
+
+
+def transcribir_stream(chunks, language="es"):
+    """
+    Transcribe audio que llega por bloques (arrays float32 a 16 kHz). Cada vez
+    que se acumulan STREAM_WINDOW_S segundos se envían al pool los segmentos
+    de voz ya cerrados por un silencio y se descarta ese audio, así que la
+    transcripción avanza mientras llega el audio y en memoria solo queda la
+    parte pendiente. Si hay más de STREAM_MAX_PENDING segmentos en el pool se
+    deja de leer hasta que termine alguno.
+    """
+    pool = get_transcription_pool()
+    futures = []
+    pending = set()
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0  # Muestras ya descartadas antes del inicio del buffer
+    window = STREAM_WINDOW_S * SAMPLE_RATE
+    # Un segmento que acaba cerca del final del buffer puede seguir en el siguiente bloque
+    guard = int((VAD_MIN_SILENCE_S + VAD_FRAME_MS / 1000) * SAMPLE_RATE)
+
+    def submit(start, end):
+        future = pool.submit(_transcribe_segment, buffer[start:end], (offset + start) / SAMPLE_RATE, language)
+        futures.append(future)
+        pending.add(future)
+        while len(pending) > STREAM_MAX_PENDING:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+
+    for chunk in chunks:
+        buffer = np.concatenate([buffer, chunk])
+        if len(buffer) < window:
+            continue
+        closed_until = len(buffer) - guard
+        cut = closed_until
+        for start, end in detectar_segmentos_voz(buffer):
+            if end > closed_until:
+                cut = min(cut, start)
+                break
+            submit(start, end)
+        buffer = buffer[cut:]
+        offset += cut
+
+    for start, end in detectar_segmentos_voz(buffer):
+        submit(start, end)
+
+    segments = []
+    for future in futures:
+        segments.extend(future.result())
+    return sorted(segments, key=lambda segment: segment["start"])
+
+
+@served("transcribe")
+def transcribir_archivo(audio_file, language="es"):
+    """
+    Carga el archivo de audio (vía ffmpeg) y lo transcribe en paralelo.
+    """
+    audio = whisper.load_audio(audio_file, sr=SAMPLE_RATE)
+    return transcribir_segmentos(audio, language=language)
@@ -1,44 +1,100 @@
 import os
 import re
-import requests
+import asyncio
 from dotenv import load_dotenv
 from app.utils.audio_processing import procesar_video
 from app.utils.wordcount_plot import generar_grafico_wordcount
-from app.database.database_service import insert_video_wordcount  
-from app.utils.sentiment_analysis import analyze_comments
+from app.database.database_service import insert_video_wordcount, check_video_exists
+from app.utils.sentiment_analysis import analyze_comments_by_video
+from app.utils.http_client import AsyncHTTPClient
+from app.utils.http_cache import ResponseCache
+from app.utils.channel_cache import channel_id_cache, channel_handle, channel_id_from_url
+from app.utils.executors import ExecutorBusy, run_inference, run_io
+from app.utils.quota import QuotaExhausted, youtube_quota
+from app.utils.analysis_jobs import job_stage
 
 # Cargar variables de entorno
 load_dotenv()
 API_KEY = os.getenv("YOUTUBE_API_KEY")
+# URL base de la API (configurable para probar contra un servidor local)
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3/")
 
-def fetch_channel_id_from_handle(channel_handle):
+# La API de videos acepta hasta 50 ids por llamada
+VIDEOS_BATCH_SIZE = 50
+# Proyecciones (respuesta parcial) para reducir el tamaño de las respuestas
+VIDEO_FIELDS = "items(id,snippet(title,publishedAt),statistics(viewCount,likeCount,commentCount))"
+# El snippet de playlistItems no cuesta cuota extra y da título y fecha si falla la llamada a videos
+PLAYLIST_PART = "snippet,contentDetails"
+PLAYLIST_FIELDS = "nextPageToken,items(snippet(title,publishedAt),contentDetails(videoId,videoPublishedAt))"
+COMMENT_FIELDS = "nextPageToken,items(snippet(topLevelComment(snippet(textDisplay))))"
+
+# Cliente compartido: conexiones keep-alive, reintentos y límite de concurrencia
+youtube_client = AsyncHTTPClient(base_url=YOUTUBE_API_URL)
+
+# Caché en disco de respuestas, con TTL por endpoint (segundos, 0 desactiva)
+YOUTUBE_CACHE_DIR = os.getenv("YOUTUBE_CACHE_DIR", "cache/youtube")
+YOUTUBE_CACHE_TTLS = {
+    "channels": int(os.getenv("YOUTUBE_CACHE_TTL_CHANNELS", "86400")),
+    "playlistItems": int(os.getenv("YOUTUBE_CACHE_TTL_PLAYLIST_ITEMS", "600")),
+    "videos": int(os.getenv("YOUTUBE_CACHE_TTL_VIDEOS", "300")),
+    "commentThreads": int(os.getenv("YOUTUBE_CACHE_TTL_COMMENTS", "1800")),
+}
+# Tamaño máximo de la caché en disco (bytes)
+YOUTUBE_CACHE_MAX_BYTES = int(os.getenv("YOUTUBE_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+youtube_cache = ResponseCache(YOUTUBE_CACHE_DIR, YOUTUBE_CACHE_TTLS, max_bytes=YOUTUBE_CACHE_MAX_BYTES)
+
+
+async def youtube_get(endpoint, **params):
+    """
+    Llama a un endpoint de la API de YouTube y devuelve la respuesta JSON.
+
+    Las respuestas vigentes se sirven desde la caché sin petición; las
+    caducadas con ETag se revalidan con If-None-Match. Cada petición real
+    espera su turno en el planificador de cuota (youtube_quota).
+    """
+    entry, fresh = await run_io(youtube_cache.lookup, endpoint, params)
+    if fresh:
+        return entry["body"]
+
+    await youtube_quota.acquire(endpoint)
+
+    headers = {"If-None-Match": entry["etag"]} if entry else None
+    response = await youtube_client.get(endpoint, params=dict(params, key=API_KEY), headers=headers)
+    if response.status_code == 304 and entry:
+        await run_io(youtube_cache.revalidated, endpoint, params, entry)
+        return entry["body"]
+    if response.status_code != 200:
+        raise Exception(f"Error fetching {endpoint}: {response.text}")
+
+    body = response.json()
+    if entry:
+        youtube_cache.miss()
+    await run_io(youtube_cache.store, endpoint, params, body, response.headers.get("ETag"))
+    return body
+
+async def fetch_channel_id_from_handle(channel_handle):
     """
     Obtiene el channelId de un canal de YouTube usando su handle.
     """
     try:
         # Llamada a la API de YouTube con el parámetro forHandle
-        channel_api_url = f"https://www.googleapis.com/youtube/v3/channels?part=id&forHandle={channel_handle}&key={API_KEY}"
-        response = requests.get(channel_api_url)
-
-        if response.status_code != 200:
-            raise Exception(f"Error fetching channel data by handle: {response.text}")
-            
-
-        channel_data = response.json()
+        channel_data = await youtube_get("channels", part="id", forHandle=channel_handle)
         if not channel_data.get("items"):
             raise Exception("No channel data found for the provided handle.")
 
         return channel_data["items"][0]["id"]
+    except QuotaExhausted:
+        raise
     except Exception as e:
         print("Error fetching channelId by handle:", e)
         return None
 
-def fetch_channel_id_from_html(channel_url):
+async def fetch_channel_id_from_html(channel_url):
     """
     Obtiene el channelId de un canal de YouTube usando scraping del HTML.
     """
     try:
-        response = requests.get(channel_url)
+        response = await youtube_client.get(channel_url)
         if response.status_code != 200:
             raise Exception(f"Error fetching HTML content: {response.status_code}")
         html_content = response.text
@@ -50,7 +106,74 @@ def fetch_channel_id_from_html(channel_url):
         print("Error fetching channelId from HTML:", e)
         return None
 
-def fetch_video_comments(video_id, max_comments=25):
+async def resolve_channel_id(channel_url):
+    """
+    Obtiene el channelId de un canal: de la propia URL si lo contiene, de la
+    caché de handles y, solo si no se ha resuelto antes, de la API (handle) o
+    del HTML del canal. Las resoluciones nuevas se guardan en la caché.
+    """
+    channel_id = channel_id_from_url(channel_url)
+    if channel_id:
+        return channel_id
+
+    channel_id = await run_io(channel_id_cache.get, channel_url)
+    if channel_id:
+        print(f"channelId recuperado de la caché: {channel_id}")
+        return channel_id
+
+    # Priorizar obtención del channelId usando el handle
+    source = "handle"
+    channel_id = await fetch_channel_id_from_handle(channel_handle(channel_url))
+
+    # Si falla, intentar obtener el channelId desde el HTML
+    if not channel_id:
+        source = "html"
+        channel_id = await fetch_channel_id_from_html(channel_url)
+
+    if channel_id:
+        await run_io(channel_id_cache.set, channel_url, channel_id, source)
+    return channel_id
+
+async def fetch_channel_info(channel_url):
+    """
+    Resuelve el canal y obtiene sus datos (snippet, contentDetails y statistics).
+
+    Returns:
+        tuple: (channel_id, item de la API del canal)
+    """
+    print(f"Fetching channelId for URL: {channel_url}")
+    channel_id = await resolve_channel_id(channel_url)
+
+    if not channel_id:
+        raise Exception("Could not extract channelId using handle or HTML.")
+
+    print(f"Channel ID: {channel_id}")
+
+    # Obtener datos del canal
+    channel_data = await youtube_get("channels", part="snippet,contentDetails,statistics", id=channel_id)
+    if not channel_data.get("items"):
+        raise Exception("No channel data found for the provided channelId")
+    return channel_id, channel_data["items"][0]
+
+async def iter_playlist_items(playlist_id, page_size=50):
+    """
+    Recorre página a página una playlist (la de subidas va de más reciente a
+    más antiguo). Devuelve los items con snippet (título y fecha) y
+    contentDetails (videoId y videoPublishedAt).
+    """
+    page_token = None
+    while True:
+        params = {"part": PLAYLIST_PART, "playlistId": playlist_id, "maxResults": page_size, "fields": PLAYLIST_FIELDS}
+        if page_token:
+            params["pageToken"] = page_token
+        data = await youtube_get("playlistItems", **params)
+        page_token = data.get("nextPageToken")
+        for item in data.get("items", []):
+            yield item
+        if not page_token:
+            break
+
+async def fetch_video_comments(video_id, max_comments=25):
     """
     Obtiene hasta `max_comments` comentarios de un video de YouTube usando la API.
     """
@@ -58,15 +181,11 @@ def fetch_video_comments(video_id, max_comments=25):
         comments = []
         next_page_token = None
         while len(comments) < max_comments:
-            comments_url = f"https://www.googleapis.com/youtube/v3/commentThreads?part=snippet&videoId={video_id}&key={API_KEY}&maxResults=50"
+            params = {"part": "snippet", "videoId": video_id, "maxResults": 50, "fields": COMMENT_FIELDS}
             if next_page_token:
-                comments_url += f"&pageToken={next_page_token}"
-
-            response = requests.get(comments_url)
-            if response.status_code != 200:
-                raise Exception(f"Error fetching comments: {response.text}")
+                params["pageToken"] = next_page_token
 
-            comments_data = response.json()
+            comments_data = await youtube_get("commentThreads", **params)
             for item in comments_data.get("items", []):
                 comment = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
                 comments.append(comment)
@@ -78,78 +197,119 @@ def fetch_video_comments(video_id, max_comments=25):
                 break  # No hay más páginas de comentarios
 
         return comments[:max_comments]
+    except QuotaExhausted:
+        raise
     except Exception as e:
         print(f"Error fetching comments for video {video_id}:", e)
         return []
 
+async def fetch_comments_by_video(video_ids, max_comments=25):
+    """
+    Obtiene en paralelo los comentarios de varios videos.
+
+    Returns:
+        dict: {video_id: [comentarios]}
+    """
+    results = await asyncio.gather(*(fetch_video_comments(video_id, max_comments) for video_id in video_ids))
+    return dict(zip(video_ids, results))
+
+async def _fetch_videos_batch(batch):
+    try:
+        data = await youtube_get("videos", part="statistics,snippet", id=",".join(batch), fields=VIDEO_FIELDS)
+        return data.get("items", [])
+    except QuotaExhausted:
+        raise
+    except Exception as e:
+        print(f"Error fetching metadata for {len(batch)} videos:", e)
+        return []
+
+async def fetch_videos_metadata(video_ids):
+    """
+    Obtiene título, fecha de publicación y estadísticas de varios videos con
+    una llamada a la API por cada 50 ids (los lotes se piden en paralelo).
+
+    Returns:
+        dict: {video_id: {"snippet": {...}, "statistics": {...}}}. Los videos
+        de un lote que falla no aparecen en el resultado.
+    """
+    batches = [video_ids[start:start + VIDEOS_BATCH_SIZE] for start in range(0, len(video_ids), VIDEOS_BATCH_SIZE)]
+    metadata = {}
+    for items in await asyncio.gather(*(_fetch_videos_batch(batch) for batch in batches)):
+        for item in items:
+            metadata[item["id"]] = item
+    return metadata
 
-def fetch_channel_videos(channel_url):
+async def fetch_channel_videos(channel_url, progress=None):
     """
     Obtiene los últimos 10 videos de un canal y procesa el más reciente.
+
+    Las llamadas a la API se hacen con el cliente asíncrono compartido; la
+    inferencia y la base de datos se ejecutan en los pools correspondientes.
+    Si se ejecuta como trabajo de análisis, `progress` registra cada etapa.
     """
     try:
-        # Priorizar obtención del channelId usando el handle
-        print(f"Fetching channelId for URL: {channel_url}")
-        channel_handle = channel_url.split("/")[-1]
-        channel_id = fetch_channel_id_from_handle(channel_handle)
+        async with job_stage(progress, "channel"):
+            channel_id, channel = await fetch_channel_info(channel_url)
+            uploads_playlist_id = channel["contentDetails"]["relatedPlaylists"]["uploads"]
 
-        # Si falla, intentar obtener el channelId desde el HTML
-        if not channel_id:
-            channel_id = fetch_channel_id_from_html(channel_url)
+        async with job_stage(progress, "videos"):
+            # Obtener los últimos 10 videos
+            videos_data = await youtube_get(
+                "playlistItems",
+                part=PLAYLIST_PART,
+                playlistId=uploads_playlist_id,
+                maxResults=10,
+                fields=PLAYLIST_FIELDS
+            )
+            videos = []
 
-        if not channel_id:
-            raise Exception("Could not extract channelId using handle or HTML.")
+            # Metadatos y comentarios de todos los videos, en paralelo
+            video_ids = [item["contentDetails"]["videoId"] for item in videos_data.get("items", [])]
+            metadata, raw_comments = await asyncio.gather(
+                fetch_videos_metadata(video_ids),
+                fetch_comments_by_video(video_ids, max_comments=25)
+            )
 
-        print(f"Channel ID: {channel_id}")
+            # Procesar cada video
+            for item in videos_data.get("items", []):
+                video_id = item["contentDetails"]["videoId"]
+                # Si el lote de videos falló, título y fecha salen del snippet de la playlist
+                snippet = metadata.get(video_id, {}).get("snippet", {})
+                playlist_snippet = item.get("snippet", {})
+                video_title = snippet.get("title") or playlist_snippet.get("title", "")
+                published_date = (
+                    snippet.get("publishedAt")
+                    or item["contentDetails"].get("videoPublishedAt")
+                    or playlist_snippet.get("publishedAt", "Unknown")
+                )
 
-        # Obtener datos del canal
-        channel_api_url = f"https://www.googleapis.com/youtube/v3/channels?part=snippet,contentDetails&id={channel_id}&key={API_KEY}"
-        response = requests.get(channel_api_url)
-        if response.status_code != 200:
-            raise Exception(f"Error fetching channel data: {response.text}")
-        channel_data = response.json()
-        if not channel_data.get("items"):
-            raise Exception("No channel data found for the provided channelId")
-        uploads_playlist_id = channel_data["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
-
-        # Obtener los últimos 10 videos
-        videos_url = f"https://www.googleapis.com/youtube/v3/playlistItems?part=snippet,contentDetails&playlistId={uploads_playlist_id}&maxResults=10&key={API_KEY}"
-        videos_response = requests.get(videos_url)
-        if videos_response.status_code != 200:
-            raise Exception(f"Error fetching videos data: {videos_response.text}")
-        videos_data = videos_response.json()
-        videos = []
-
-        # Procesar cada video
-        for item in videos_data.get("items", []):
-            video_id = item["contentDetails"]["videoId"]
-            video_title = item["snippet"]["title"]
-            published_date = item["snippet"].get("publishedAt", "Unknown")
-            video_metrics_url = f"https://www.googleapis.com/youtube/v3/videos?part=statistics&id={video_id}&key={API_KEY}"
-            video_metrics_response = requests.get(video_metrics_url)
-
-            video_data = {
-                "title": video_title,
-                "videoId": video_id,
-                "published_date": published_date,
-                "views": 0,
-                "likes": 0,
-                "comments_count": 0,
-                "comments": [], 
-                "average_stars": None,
-            }
-
-            if video_metrics_response.status_code == 200:
-                video_metrics = video_metrics_response.json().get("items", [{}])[0].get("statistics", {})
-                video_data.update({
-                    "views": int(video_metrics.get("viewCount", 0)),
-                    "likes": int(video_metrics.get("likeCount", 0)),
-                    "comments_count": int(video_metrics.get("commentCount", 0)),
-                })
-
-            # Recoger comentarios
-            raw_comments = fetch_video_comments(video_id, max_comments=25)
-            analyzed_comments = analyze_comments(raw_comments)  # Añadir análisis de sentimiento
+                video_data = {
+                    "title": video_title,
+                    "videoId": video_id,
+                    "published_date": published_date,
+                    "views": 0,
+                    "likes": 0,
+                    "comments_count": 0,
+                    "comments": [],
+                    "average_stars": None,
+                }
+
+                video_metrics = metadata.get(video_id, {}).get("statistics")
+                if video_metrics:
+                    video_data.update({
+                        "views": int(video_metrics.get("viewCount", 0)),
+                        "likes": int(video_metrics.get("likeCount", 0)),
+                        "comments_count": int(video_metrics.get("commentCount", 0)),
+                    })
+
+                # Agregar a la lista de videos
+                videos.append(video_data)
+
+        # Análisis de sentimiento por lotes de los comentarios de todos los videos
+        async with job_stage(progress, "sentiment"):
+            analyzed_by_video = await run_inference(analyze_comments_by_video, raw_comments)
+        for video_data in videos:
+            analyzed_comments = analyzed_by_video.get(video_data["videoId"], [])
 
             # Calcular la media de estrellas
             if analyzed_comments:
@@ -160,44 +320,52 @@ def fetch_channel_videos(channel_url):
             # Agregar comentarios analizados
             video_data["comments"] = analyzed_comments
 
-            # Agregar a la lista de videos
-            videos.append(video_data)
-
         # Procesar el último video
         if videos:
             latest_video = videos[0]
             video_url = f"https://www.youtube.com/watch?v={latest_video['videoId']}"
             print(f"Processing latest video: {video_url}")
-            processed_data = procesar_video(video_url)
+            async with job_stage(progress, "video_processing"):
+                processed_data = await run_inference(procesar_video, video_url)
 
             if processed_data:
                 latest_video["summary"] = processed_data.get("summary", "Resumen no disponible.")
                 latest_video["wordcount"] = processed_data.get("wordcount", [])
                 latest_video["total_palabras"] = processed_data.get("total_palabras", 0)
 
-                # Guardar wordcount en la base de datos
-                insert_video_wordcount(
-                    video_id=latest_video["videoId"],
-                    channel_id=channel_id,  # Agregar el channel_id aquí
-                    channel_name=channel_data["items"][0]["snippet"]["title"],
-                    video_title=latest_video["title"],
-                    wordcount=latest_video["wordcount"],
-                    total_palabras=latest_video["total_palabras"],
-                )
+                # Guardar wordcount en la base de datos (si el análisis viene de la
+                # base de datos y el video ya está guardado, no hay nada que escribir)
+                async with job_stage(progress, "save"):
+                    if not (processed_data.get("cached") and await run_io(check_video_exists, latest_video["videoId"])):
+                        await run_io(
+                            insert_video_wordcount,
+                            video_id=latest_video["videoId"],
+                            channel_id=channel_id,  # Agregar el channel_id aquí
+                            channel_name=channel["snippet"]["title"],
+                            video_title=latest_video["title"],
+                            wordcount=latest_video["wordcount"],
+                            total_palabras=latest_video["total_palabras"],
+                        )
 
-                # Generar gráfico de barras para el wordcount
+                # Generar gráfico de barras para el wordcount (se reutiliza si ya existe)
                 if latest_video["wordcount"]:
-                    grafico_path = generar_grafico_wordcount(
-                        latest_video["wordcount"], 
-                        output_path=f"static/wordcount_{latest_video['videoId']}.png"
-                    )
+                    async with job_stage(progress, "chart"):
+                        grafico_path = f"static/wordcount_{latest_video['videoId']}.png"
+                        if not (processed_data.get("cached") and os.path.exists(grafico_path)):
+                            grafico_path = await run_io(
+                                generar_grafico_wordcount,
+                                latest_video["wordcount"],
+                                output_path=grafico_path
+                            )
                     latest_video["wordcount_chart"] = grafico_path  # Añadir la ruta del gráfico al video
 
         return {
-            "channel_title": channel_data["items"][0]["snippet"]["title"],
-            "description": channel_data["items"][0]["snippet"]["description"],
+            "channel_title": channel["snippet"]["title"],
+            "description": channel["snippet"]["description"],
             "videos": videos
         }
+    except (ExecutorBusy, QuotaExhausted):
+        raise
     except Exception as e:
         print("Error in fetch_channel_videos:", e)
         return None
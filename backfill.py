@@ -0,0 +1,82 @@
+"""
+Ingesta el histórico completo de un canal de YouTube.
+
+Recorre toda la playlist de subidas y pasa cada video por las etapas de
+transcripción, wordcount y marcas, y sentimiento de los comentarios. El
+progreso de cada video se guarda en la tabla backfill_videos, así que si la
+ejecución se interrumpe basta con volver a lanzarla para continuar donde se
+quedó. Mientras se ejecuta muestra el ritmo (videos/min) y el tiempo restante
+estimado.
+
+Uso:
+    python backfill.py https://www.youtube.com/@canal
+    python backfill.py https://www.youtube.com/@canal --transcript-workers 8 --limit 200
+    python backfill.py https://www.youtube.com/@canal --no-retry-failed --report-every 30
+"""
+import argparse
+import asyncio
+import json
+
+
+async def run(args):
+    from app.utils.channel_backfill import ChannelBackfill
+    from app.utils.youtube_api import youtube_client
+
+    backfill = ChannelBackfill(
+        args.channel_url,
+        transcript_workers=args.transcript_workers,
+        text_workers=args.text_workers,
+        sentiment_workers=args.sentiment_workers,
+        sentiment_batch=args.sentiment_batch,
+        max_comments=args.max_comments,
+        retry_failed=args.retry_failed,
+        max_attempts=args.max_attempts,
+        limit=args.limit
+    )
+    try:
+        return await backfill.run(report_every=args.report_every)
+    finally:
+        await youtube_client.aclose()
+
+
+def main():
+    from app.database.models import create_tables
+    from app.utils.executors import shutdown_executors
+    from app.utils.channel_backfill import (
+        BACKFILL_TRANSCRIPT_WORKERS,
+        BACKFILL_TEXT_WORKERS,
+        BACKFILL_SENTIMENT_WORKERS,
+        BACKFILL_SENTIMENT_BATCH,
+        BACKFILL_MAX_COMMENTS,
+        BACKFILL_MAX_ATTEMPTS
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("channel_url")
+    parser.add_argument("--transcript-workers", type=int, default=BACKFILL_TRANSCRIPT_WORKERS)
+    parser.add_argument("--text-workers", type=int, default=BACKFILL_TEXT_WORKERS)
+    parser.add_argument("--sentiment-workers", type=int, default=BACKFILL_SENTIMENT_WORKERS)
+    parser.add_argument("--sentiment-batch", type=int, default=BACKFILL_SENTIMENT_BATCH,
+                        help="videos cuyos comentarios se puntúan juntos")
+    parser.add_argument("--max-comments", type=int, default=BACKFILL_MAX_COMMENTS)
+    parser.add_argument("--max-attempts", type=int, default=BACKFILL_MAX_ATTEMPTS,
+                        help="intentos de un video fallido antes de descartarlo")
+    parser.add_argument("--no-retry-failed", dest="retry_failed", action="store_false",
+                        help="no reintentar los videos que fallaron en ejecuciones anteriores")
+    parser.add_argument("--limit", type=int, help="procesar como mucho este número de videos")
+    parser.add_argument("--report-every", type=float, default=10, help="segundos entre informes de progreso")
+    args = parser.parse_args()
+
+    create_tables()
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nBackfill interrumpido; se retomará desde el último checkpoint.")
+        return
+    finally:
+        shutdown_executors()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
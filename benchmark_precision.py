@@ -0,0 +1,138 @@
+"""
+Compara los modos de precisión (float32, bfloat16, int8) de un modelo causal.
+
+Para cada modo se lanza un proceso independiente que carga el modelo a través
+del registro de modelos y mide el tiempo de carga, la memoria residente (RSS),
+los tokens por segundo y la similitud de las respuestas con las de float32
+sobre un conjunto fijo de prompts (decodificación greedy).
+
+Uso:
+    python benchmark_precision.py
+    python benchmark_precision.py --model abdulmannan-01/qwen-2.5-3b-finetuned-for-sql-generation --precisions float32 int8
+"""
+import argparse
+import difflib
+import json
+import subprocess
+import sys
+import time
+
+PROMPTS = [
+    "Define chipre de forma breve y profesional en español.",
+    "Define fougère de forma breve y profesional en español.",
+    "Define notas de salida de forma breve y profesional en español.",
+    "Resume en dos frases qué es un perfume oriental.",
+    "¿Cuántas palabras tiene cada canal? Devuelve solo una consulta SQL.",
+]
+MAX_NEW_TOKENS = 64
+
+
+def current_rss_mb():
+    """
+    Memoria residente actual del proceso en MB.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def run_single(model_name, precision):
+    """
+    Ejecuta el benchmark de un único modo de precisión en este proceso.
+    """
+    import torch
+    from app.utils.model_registry import model_registry
+
+    rss_before = current_rss_mb()
+    start = time.monotonic()
+    handle = model_registry.acquire(model_name, dtype=precision)
+    load_seconds = time.monotonic() - start
+    model, tokenizer = handle.model, handle.tokenizer
+
+    outputs = []
+    generated_tokens = 0
+    generation_seconds = 0.0
+    for prompt in PROMPTS:
+        text = tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt}],
+            tokenize=False,
+            add_generation_prompt=True
+        )
+        inputs = tokenizer(text, return_tensors="pt")
+        start = time.monotonic()
+        with torch.inference_mode():
+            output_ids = model.generate(
+                **inputs,
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id
+            )
+        generation_seconds += time.monotonic() - start
+        new_ids = output_ids[0, inputs["input_ids"].shape[1]:]
+        generated_tokens += len(new_ids)
+        outputs.append(tokenizer.decode(new_ids, skip_special_tokens=True))
+
+    model_registry.release(handle)
+    return {
+        "precision": precision,
+        "load_seconds": round(load_seconds, 2),
+        "rss_mb": round(current_rss_mb() - rss_before, 1),
+        "weights_mb": round(handle.size_bytes / 1024 ** 2, 1),
+        "tokens_per_second": round(generated_tokens / generation_seconds, 2) if generation_seconds else 0,
+        "outputs": outputs,
+    }
+
+
+def similarity(reference, outputs):
+    """
+    Similitud media (0-1) entre las respuestas y las de referencia.
+    """
+    ratios = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(reference, outputs)]
+    return round(sum(ratios) / len(ratios), 3) if ratios else 0
+
+
+def main():
+    from app.utils.model_registry import QWEN_CHAT_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=QWEN_CHAT_MODEL)
+    parser.add_argument("--precisions", nargs="+", default=["float32", "bfloat16", "int8"])
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.model, args.single)))
+        return
+
+    results = []
+    for precision in args.precisions:
+        print(f"=== {args.model} ({precision}) ===", file=sys.stderr)
+        completed = subprocess.run(
+            [sys.executable, __file__, "--model", args.model, "--single", precision],
+            capture_output=True,
+            text=True
+        )
+        if completed.returncode != 0:
+            print(f"❌ Error con {precision}: {completed.stderr.strip()[-500:]}", file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    reference = next((r["outputs"] for r in results if r["precision"] == "float32"), None)
+    print(f"{'precision':<10} {'carga (s)':>10} {'RSS (MB)':>10} {'pesos (MB)':>11} {'tokens/s':>9} {'similitud':>10}")
+    for r in results:
+        sim = similarity(reference, r["outputs"]) if reference else "-"
+        print(
+            f"{r['precision']:<10} {r['load_seconds']:>10} {r['rss_mb']:>10} "
+            f"{r['weights_mb']:>11} {r['tokens_per_second']:>9} {sim:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,49 @@
 import React, { useState } from 'react';
 import axios from 'axios';
 
+const API_URL = 'http://127.0.0.1:8000';
+
 const Form = ({ setDashboardData }) => {
     const [url, setUrl] = useState('');
     const [loading, setLoading] = useState(false);
+    const [stage, setStage] = useState(null);
     const [error, setError] = useState(null);
 
+    // Espera a que termine el trabajo de análisis siguiendo su progreso (SSE)
+    const waitForJob = (eventsUrl) => new Promise((resolve, reject) => {
+        const source = new EventSource(`${API_URL}${eventsUrl}`);
+        source.addEventListener('progress', (event) => {
+            const job = JSON.parse(event.data);
+            const running = job.stages.filter((s) => s.status === 'running').pop();
+            setStage(running ? running.name : null);
+        });
+        source.addEventListener('done', () => {
+            source.close();
+            resolve();
+        });
+        source.addEventListener('error', (event) => {
+            source.close();
+            reject(event.data ? JSON.parse(event.data).error : 'Error de conexión');
+        });
+    });
+
     const handleSubmit = async (e) => {
         e.preventDefault();
         setLoading(true);
+        setStage(null);
         setError(null);
 
         try {
-            const response = await axios.post('http://127.0.0.1:8000/api/analyze', { url });
+            const job = await axios.post(`${API_URL}/api/analyze`, { url });
+            await waitForJob(job.data.events_url);
+            const response = await axios.get(`${API_URL}${job.data.result_url}`);
             setDashboardData(response.data);
         } catch (err) {
             console.error('Error while analyzing URL:', err);
             setError('Failed to analyze the URL. Please try again.');
         } finally {
             setLoading(false);
+            setStage(null);
         }
     };
 
@@ -57,7 +82,7 @@ const Form = ({ setDashboardData }) => {
                         opacity: loading ? 0.7 : 1
                     }}
                 >
-                    {loading ? 'Analizando...' : 'Analizar'}
+                    {loading ? `Analizando${stage ? ` (${stage})` : ''}...` : 'Analizar'}
                 </button>
             </div>
             {error && (
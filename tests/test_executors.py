@@ -0,0 +1,17 @@
+import pytest
+
+from app.utils.executors import BoundedExecutor, ExecutorBusy
+
+
+def test_reservation_is_released_once():
+    pool = BoundedExecutor("test", 1, max_pending=1)
+    reservation = pool.reserve()
+    with pytest.raises(ExecutorBusy):
+        pool.reserve()
+    # El generador y el cierre de la respuesta liberan el mismo hueco
+    reservation.release()
+    reservation.release()
+    pool.reserve()
+    with pytest.raises(ExecutorBusy):
+        pool.reserve()
+    pool.shutdown()
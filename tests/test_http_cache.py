@@ -0,0 +1,55 @@
+import os
+import time
+
+from app.utils.http_cache import ResponseCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResponseCache(str(tmp_path), {"videos": 300}, **kwargs)
+
+
+def test_fresh_entries_are_served_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("videos", {"id": "abc", "key": "secret"}, {"items": [1]}, etag="e1")
+    entry, fresh = cache.lookup("videos", {"id": "abc", "key": "other"})
+    assert fresh
+    assert entry["body"] == {"items": [1]}
+    assert cache.stats()["hits"] == 1
+
+
+def test_revalidations_are_not_counted_as_stored(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("videos", {"id": "abc"}, {"items": []}, etag="e1")
+    entry, _ = cache.lookup("videos", {"id": "abc"})
+    cache.revalidated("videos", {"id": "abc"}, entry)
+    stats = cache.stats()
+    assert stats["stored"] == 1
+    assert stats["revalidated"] == 1
+    assert stats["entries"] == 1
+
+
+def test_oldest_entries_are_evicted_over_max_bytes(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    for i in range(10):
+        cache.store("videos", {"id": i}, {"padding": "x" * 200})
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert cache.lookup("videos", {"id": 9})[0] is not None
+    assert cache.lookup("videos", {"id": 0})[0] is None
+    on_disk = sum(len(files) for _, _, files in os.walk(tmp_path))
+    assert on_disk == stats["entries"]
+
+
+def test_existing_entries_are_loaded_once(tmp_path):
+    make_cache(tmp_path).store("videos", {"id": "old"}, {"items": []})
+    old_path = next(
+        os.path.join(root, name) for root, _, files in os.walk(tmp_path) for name in files
+    )
+    week_ago = time.time() - 8 * 24 * 3600
+    os.utime(old_path, (week_ago, week_ago))
+
+    cache = make_cache(tmp_path)
+    cache.store("videos", {"id": "new"}, {"items": []})
+    cache.prune()
+    assert not os.path.exists(old_path)
+    assert cache.stats()["entries"] == 1
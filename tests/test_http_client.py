@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from app.utils.http_client import AsyncHTTPClient
+
+
+def make_client(handler, **kwargs):
+    kwargs.setdefault("max_retries", 2)
+    return AsyncHTTPClient(
+        base_url="http://youtube.test",
+        backoff_base=0,
+        transport=httpx.MockTransport(handler),
+        **kwargs
+    )
+
+
+def run(client, request):
+    async def scenario():
+        try:
+            return await request()
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_retries_server_errors_until_success():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params["id"])
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"items": []})
+
+    client = make_client(handler)
+    response = run(client, lambda: client.get("/videos", params={"id": "abc"}))
+    assert response.status_code == 200
+    assert calls == ["abc", "abc", "abc"]
+
+
+def test_returns_last_response_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(429)
+
+    client = make_client(handler)
+    response = run(client, lambda: client.get("/videos"))
+    assert response.status_code == 429
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404)
+
+    client = make_client(handler)
+    assert run(client, lambda: client.get("/videos")).status_code == 404
+    assert len(calls) == 1
+
+
+def test_raises_network_error_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = make_client(handler, max_retries=1)
+    with pytest.raises(httpx.ConnectError):
+        run(client, lambda: client.get("/videos"))
+    assert len(calls) == 2
+
+
+def test_limits_concurrent_requests():
+    state = {"active": 0, "peak": 0}
+
+    async def handler(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        return httpx.Response(200)
+
+    client = make_client(handler, max_concurrency=2)
+    responses = run(client, lambda: asyncio.gather(*(client.get("/videos") for _ in range(6))))
+    assert [response.status_code for response in responses] == [200] * 6
+    assert state["peak"] == 2
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from app.utils.quota import (
+    BACKGROUND,
+    INTERACTIVE,
+    FakeClock,
+    QuotaExhausted,
+    QuotaScheduler,
+)
+
+COSTS = {"videos": 1, "search": 6}
+
+
+def make_scheduler(clock, **kwargs):
+    kwargs.setdefault("daily_quota", 86400 + 10)  # relleno de 1 unidad por segundo
+    kwargs.setdefault("burst", 10)
+    kwargs.setdefault("reserve", 5)
+    kwargs.setdefault("max_wait", 30)
+    return QuotaScheduler(costs=COSTS, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+async def drain(scheduler, units):
+    for _ in range(units):
+        await scheduler.acquire("videos", INTERACTIVE)
+
+
+def test_interactive_requests_go_before_background():
+    async def scenario():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock)
+        await drain(scheduler, 10)
+        order = []
+
+        async def request(name, priority):
+            await scheduler.acquire("videos", priority)
+            order.append((name, clock.now))
+
+        tasks = [
+            asyncio.create_task(request("bg1", BACKGROUND)),
+            asyncio.create_task(request("i1", INTERACTIVE)),
+            asyncio.create_task(request("i2", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        for _ in range(10):
+            await clock.advance(1)
+        await asyncio.gather(*tasks)
+        return order
+
+    # bg1 llegó primero, pero espera a las interactivas y a tener 1 + 5 de reserva
+    assert asyncio.run(scenario()) == [("i1", 1.0), ("i2", 2.0), ("bg1", 8.0)]
+
+
+def test_background_does_not_spend_the_reserve():
+    async def scenario():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock)
+        for _ in range(5):
+            await scheduler.acquire("videos", BACKGROUND)
+        blocked = asyncio.create_task(scheduler.acquire("videos", BACKGROUND))
+        await clock.advance(0)
+        background_waiting = not blocked.done()
+        # Las interactivas sí pueden gastar la reserva
+        await drain(scheduler, 5)
+        remaining = scheduler.remaining()
+        blocked.cancel()
+        await asyncio.gather(blocked, return_exceptions=True)
+        return background_waiting, remaining
+
+    background_waiting, remaining = asyncio.run(scenario())
+    assert background_waiting
+    assert remaining == 0
+
+
+def test_interactive_request_fails_with_retry_after():
+    async def scenario():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, max_wait=3)
+        await drain(scheduler, 10)
+        with pytest.raises(QuotaExhausted) as excinfo:
+            await scheduler.acquire("search", INTERACTIVE)
+        return scheduler, excinfo.value
+
+    scheduler, error = asyncio.run(scenario())
+    assert error.endpoint == "search"
+    # Faltan 6 unidades a 1 unidad por segundo
+    assert error.retry_after == 7
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_cost_above_capacity_is_rejected():
+    async def scenario():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, burst=5, reserve=0)
+        await scheduler.acquire("search", INTERACTIVE)
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
+
+
+def test_never_spends_more_than_the_daily_quota():
+    daily_quota = 1000
+    day = 86400
+
+    async def scenario():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, daily_quota=daily_quota, burst=100, reserve=20)
+        spent = {"units": 0}
+
+        async def consumer(priority):
+            while True:
+                cost = await scheduler.acquire("videos", priority)
+                if clock.now < day:
+                    spent["units"] += cost
+
+        tasks = [asyncio.create_task(consumer(BACKGROUND)), asyncio.create_task(consumer(BACKGROUND))]
+        while clock.now < day:
+            await clock.advance(60)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return spent["units"]
+
+    spent = asyncio.run(scenario())
+    assert spent <= daily_quota
+    # El trabajo en segundo plano aprovecha la cuota salvo la reserva
+    assert spent >= daily_quota - 20 - 10
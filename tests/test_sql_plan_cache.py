@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from app.utils import sql_plan_cache
+from app.utils.sql_plan_cache import match_template
+
+
+@pytest.fixture(autouse=True)
+def known_channel_names(monkeypatch):
+    monkeypatch.setattr(sql_plan_cache.known_channels, "names", lambda: {"dalas", "luisito comunica"})
+
+
+@pytest.mark.parametrize("question, params", [
+    ("top 5 palabras del canal Luisito Comunica", ("%luisito comunica%", 5)),
+    ("palabras mas usadas de Dalas", ("%dalas%", 10)),
+    ("palabras de Luisito", ("%luisito%", 10)),
+    ("words of channel mkbhd", ("%mkbhd%", 10)),
+    ("palabras en el canal 2 Hermanos", ("%2 hermanos%", 10)),
+])
+def test_channel_is_extracted(question, params):
+    template, built = match_template(question)
+    assert template.name == "top_words_by_channel"
+    assert built == params
+
+
+@pytest.mark.parametrize("question", [
+    "palabras mas usadas desde 2023",
+    "palabras mas usadas en 2024",
+    "palabras mas usadas de marzo de 2023",
+    "palabras mas usadas en el canal de 2024",
+    "cuantos videos tiene el canal 2024",
+])
+def test_numbers_and_dates_are_not_channels(question):
+    assert match_template(question) is None
+
+
+@pytest.mark.parametrize("question", [
+    "palabras mas usadas de la semana",
+    "palabras mas usadas del ultimo video",
+    "palabras mas usadas en videos de perfumes",
+    "palabras mas usadas de este mes",
+    "words in the last year",
+    "palabras mas usadas en 2024 del canal Dalas",
+    "cuantos videos tiene este mes",
+])
+def test_unknown_names_without_channel_keyword_need_the_model(question):
+    assert match_template(question) is None